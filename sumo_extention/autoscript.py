@@ -7,12 +7,13 @@ Powered by SWJTU WAVES LAB 西南交通大学WAVES课题组
     2. 事故车设置：设置事故车的停止时间、事故车辆的数量等。车辆会绕行与重新路由
     3. 紧急车辆的设置，其能够产生更加积极的变道
     4. 车道禁用
-    5. 车辆在每个车道出现的具体数量
+    5. 车辆在每个车道出现的具体数量（lane_demand：按车道、时段指定车辆数，车辆带departLane）
+    6. J0每条进口车道的E1感应线圈与E2区域检测器，聚合输出（detectors，默认关闭）
 当前版本未能实现：
-    1. 用户自行设计随机种子和.net的信号灯配时
+    1. J0在.net中为无信号交叉口，设置signal_plan时场景用netconvert生成的信号控制路网（需要安装SUMO，见signal_plans.build_tls_network；随机种子可通过main(seed=...)设置）
     2. 公交车与公交专用车道暂未实现
-    3. 车道管制未实现，即目前是整个车道禁用，而不是一小段路线禁用
-    4. 紧急车辆未设置闯红灯权限
+    3. 车道管制：部分封闭（incidents中的"partial"）只在事故路段停车并限速，SUMO的rerouter只能封闭整条车道
+    4. 紧急车辆未设置闯红灯权限（可通过signal_plan的"preemption"为其离线安排信号优先，见preemption）
 一些说明见下文todo和注释
 """
 
@@ -22,18 +23,37 @@ Current Version Features:
     2. Accident vehicle configuration: Set the stopping duration and the number of accident vehicles, etc. Affected vehicles will detour and reroute automatically.
     3. Emergency vehicle configuration: Emergency vehicles are capable of more proactive lane changes.
     4. Lane closure: The lane where accident vehicles are located is set as a closed lane. Alternatively, you can designate any lane as closed regardless of accident vehicle positions.
-    5. Customizable vehicle volume in each individual lane.
+    5. Customizable vehicle volume in each individual lane (lane_demand: vehicle counts per lane and time bin, emitted with departLane).
+    6. E1 induction loops and E2 lane area detectors with aggregated outputs on every incoming lane of J0 (detectors, off by default).
 Current Version Limitations:
-    1. Cannot support user-defined random seeds and .NET-based traffic signal timing.
+    1. J0 is unsignalized in the .net; with a signal_plan the scenario runs on a signalized network built with netconvert (needs SUMO installed, see signal_plans.build_tls_network; random seeds can be set through main(seed=...)).
     2. Bus and bus-only lane functionality not implemented. 
-    4. Partial lane closure not supported: The current version only allows full closure of an entire lane instead of closing a specific segment.
-    5. Emergency vehicles are not granted the right to run red lights.
+    4. Partial lane closure ("partial" incidents) only blocks the incident segment and limits the lane's speed; SUMO's rerouter can only close an entire lane.
+    5. Emergency vehicles are not granted the right to run red lights (signal preemption can be scheduled for them offline through the signal_plan's "preemption", see preemption).
 For additional details, refer to the todo notes and code comments below.
 """
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import csv
+import heapq
+import json
+import logging
+import os
 import random
 import numpy as np
 
+from demand_profile import (lane_counts, load_demand_profile, profile_flows, profile_rates, sample_lane_departures,
+                            sample_profile_departures)
+from detectors import scenario_detectors
+from metrics import GenerationMetrics, configure_logging
+from incidents import (DEFAULT_CLOSURE_LENGTH, DEFAULT_RESTORE_SPEED, accident_incident, blocker_vehicles,
+                       merge_closures, merge_speed_steps, safe_closures, sample_incidents)
+from net_index import load_network_index
+from preemption import DEFAULT_HOLD, DEFAULT_LEAD, emergency_arrivals, write_preemption_program
+from signal_plans import build_tls_network, load_signal_template, signal_plan, write_signal_programs
+from weather import resolve_weather_types, retype_vehicles
+
+log = logging.getLogger("autoscript")
 
 # 自定义缩进函数（兼容Python 3.8及以下版本）
 def indent(elem, level=0, space="    "):
@@ -53,9 +73,9 @@ def indent(elem, level=0, space="    "):
             elem.tail = i
 
 
-def generate_vehicle_type(parent_element, type_id, **params):
-    """生成车辆类型定义。params可接收accel, decel, length, maxSpeed等参数。"""
-    """Generate vehicle type definitions. The params parameter can accept arguments such as accel (acceleration), decel (deceleration), length (vehicle length), maxSpeed (maximum speed), etc."""
+def vehicle_type_attributes(type_id, **params):
+    """返回vType元素的属性字典（默认参数被传入参数覆盖）。"""
+    """Return the attribute dict of a vType element (the defaults overridden by the passed-in parameters)."""
     default_params = {
         "accel": "0.8",
         "decel": "4.5",
@@ -67,10 +87,38 @@ def generate_vehicle_type(parent_element, type_id, **params):
     # 用传入的参数覆盖默认参数
     # Override the default parameters with the passed-in arguments.
     default_params.update(params)
-    vtype = ET.SubElement(parent_element, "vType", id=type_id, **default_params)
+    return {"id": type_id, **default_params}
+
+
+def generate_vehicle_type(parent_element, type_id, **params):
+    """生成车辆类型定义。params可接收accel, decel, length, maxSpeed等参数。"""
+    """Generate vehicle type definitions. The params parameter can accept arguments such as accel (acceleration), decel (deceleration), length (vehicle length), maxSpeed (maximum speed), etc."""
+    vtype = ET.SubElement(parent_element, "vType", attrib=vehicle_type_attributes(type_id, **params))
     return vtype
 
 
+def resolved_vehicle_types(type_params, weather=None, weather_profiles=None):
+    """按天气展开车辆类型，返回(类型条目, 时间线)，见weather.resolve_weather_types()。"""
+    """Expand the vehicle types for the weather and return (type entries, timeline), see weather.resolve_weather_types()."""
+    type_attributes = []
+    for params in type_params:
+        params = dict(params)
+        type_attributes.append(vehicle_type_attributes(params.pop("type_id"), **params))
+    return resolve_weather_types(weather, type_attributes, weather_profiles)
+
+
+def append_vehicle_types(parent_element, type_entries):
+    """将类型条目（vType或vTypeDistribution）添加到XML元素中。"""
+    """Append type entries (vType or vTypeDistribution) to an XML element."""
+    for entry in type_entries:
+        if entry[0] == "vType":
+            ET.SubElement(parent_element, "vType", attrib=entry[1])
+        else:
+            distribution = ET.SubElement(parent_element, "vTypeDistribution", id=entry[1])
+            for attributes in entry[2]:
+                ET.SubElement(distribution, "vType", attrib=attributes)
+
+
 def generate_route(parent_element, route_id, edges):
     """生成路线定义。"""
     """Generate route definitions."""
@@ -78,13 +126,461 @@ def generate_route(parent_element, route_id, edges):
     return route
 
 
-def main():
-    # 创建XML根元素
-    # Create the root element of the XML file.
-    root = ET.Element("routes")
+# 特殊车辆的默认颜色：红色保留给紧急车辆，橙色保留给事故车辆；其他类型不写color，由vType决定
+# Default colors of special vehicles: red is reserved for emergency vehicles and orange for accident vehicles; other types omit color and use their vType
+SPECIAL_VEHICLE_COLORS = {"emergency": "255,0,0", "accident": "255,128,0"}
+# 没有事故车辆的事件的阻塞车辆类型（与事故车辆相同，vClass为truck，可以驶入rerouter封闭的车道）
+# Type of the blocker vehicles of incidents without an accident vehicle (like accident vehicles, vClass truck may enter lanes closed by the rerouter)
+INCIDENT_BLOCKER_TYPE = {"id": "incident_blocker", "vClass": "truck", "length": "4", "minGap": "0.0",
+                         "color": SPECIAL_VEHICLE_COLORS["accident"], "guiShape": "truck"}
+
+
+def accident_stop(accident, route_edges):
+    """根据事故车辆参数生成stop属性字典，停在路线第一条edge的事故车道（accident["lane"]，默认"_1"）accident["pos"]（默认50米）处，
+    占据长度为accident["length"]（默认10米）的路段；路线为空时返回None。"""
+    """Build the stop attribute dict of an accident vehicle, stopping on the accident lane (accident["lane"], lane "_1" by default) of the first edge of its route at accident["pos"] (50 m by default)
+    and occupying a segment of accident["length"] (10 m by default). Returns None if the route has no edges."""
+    edge_list = route_edges[accident["route"]].split()
+    if not edge_list:
+        return None
+    pos = float(accident.get("pos", 50.0))
+    half_length = float(accident.get("length", DEFAULT_CLOSURE_LENGTH)) / 2
+    return {
+        "lane": accident.get("lane", f"{edge_list[0]}_1"),
+        "pos": f"{pos:g}",  # 停车位置 Stop position
+        "startPos": f"{max(0.0, pos - half_length):g}",  # 实际停车开始位置 Actual parking start position
+        "endPos": f"{pos + half_length:g}",  # 实际停车结束位置 Actual parking end position
+        "duration": str(accident["accident_end"] - accident["accident_start"]),  # 停车持续时间 Parking duration
+        "until": str(accident["accident_end"]),  # 停车直到指定时间 Park until the specified time
+        "triggered": "false",  # 不触发 Do not trigger
+        "parking": "false",  # 不是停车 Not a parking event
+    }
+
+
+def resolve_accident_lanes(accident_vehicles, route_edges, index):
+    """根据路网索引为未指定"lane"的事故车辆选择事故车道：优先"_1"，若关闭该车道会切断某个转向（只有它服务该转向）则改用可安全关闭的车道。
+    没有路网索引（index为None）时保持默认的"_1"。"""
+    """Use the network index to choose the accident lane of every accident vehicle without a "lane": lane "_1" unless closing it
+    would cut off a movement only it serves, in which case a lane that can be closed safely is used. Keeps the default "_1" when index is None."""
+    if index is None:
+        return accident_vehicles
+
+    resolved = []
+    for accident in accident_vehicles:
+        edge_list = route_edges.get(accident["route"], "").split()
+        if "lane" not in accident and edge_list and edge_list[0] in index.edge_lookup:
+            lane_id = index.accident_lane(edge_list[0])
+            if lane_id is None:
+                # 该edge的每条车道都是某个转向的唯一车道，关闭后车辆无法重新规划路由
+                # Every lane of this edge is the only lane of some movement; closing any of them breaks rerouting
+                lane_id = f"{edge_list[0]}_1"
+                log.warning(f"警告: {edge_list[0]} 上没有可以安全关闭的车道，仍使用 {lane_id}")
+            accident = dict(accident, lane=lane_id)
+        resolved.append(accident)
+    return resolved
+
+
+def special_departure_times(special_streams):
+    """返回所有特殊车辆流的出发时间（已排序），供普通车辆避让。"""
+    """Return the sorted departure times of every special vehicle stream, used by regular vehicles to keep clear of them."""
+    return sorted(entry["time"] for entries in special_streams.values() for entry in entries)
+
+
+def iter_special_vehicles(name, entries, route_edges):
+    """将一个特殊车辆流（如紧急车辆、事故车辆、公交车）转换为按时间排序的事件流，元素为(出发时间, 属性字典, stop列表)。
+    entries中每一项为{"time", "route"}，可选"type"（默认与流名称相同）、"color"、"stops"，事故车辆另有"accident_start"/"accident_end"。"""
+    """Turn one special vehicle stream (emergency, accident, bus, ...) into a time-ordered event stream of (departure time, attribute dict, stop list).
+    Each entry is {"time", "route"} with optional "type" (defaults to the stream name), "color" and "stops"; accident vehicles also carry "accident_start"/"accident_end"."""
+    for count, entry in enumerate(sorted(entries, key=lambda x: x["time"])):
+        vehicle_type = entry.get("type", name)
+        depart = round(entry["time"], 2)
+        attrib = {"id": "", "type": vehicle_type, "route": entry["route"], "depart": str(depart)}
+        color = entry.get("color", SPECIAL_VEHICLE_COLORS.get(vehicle_type))
+        if color is not None:
+            attrib["color"] = color
+        stops = list(entry.get("stops", []))
+
+        if "accident_start" in entry:
+            stop = accident_stop(entry, route_edges)
+            if stop is not None:
+                stops.append(stop)
+                log.debug(f"生成事故车辆 {count} 在 {entry['time']} 秒，路线: {entry['route']}")
+                log.debug(f"  事故时间: {entry['accident_start']}-{entry['accident_end']}秒 "
+                          f"(持续{entry['accident_end'] - entry['accident_start']}秒)")
+                log.debug(f"  事故位置: {stop['lane']}, 位置: {stop['pos']}米处")
+        elif vehicle_type == "emergency":
+            log.debug(f"生成紧急车辆 {count} 在 {entry['time']} 秒，路线: {entry['route']}")
+        else:
+            log.debug(f"生成{name}车辆 {count} 在 {entry['time']} 秒，路线: {entry['route']}")
+        yield depart, attrib, stops
+
+
+def iter_regular_vehicles_loop(route_ids, route_weights, num_vehicles, base_depart_interval, interval_std_dev,
+                               special_times=()):
+    """逐辆生成普通车辆的原始方式（random + np.random），保留用于对照和基准测试。产出(出发时间, 属性字典, stop列表)。"""
+    """The original per-vehicle way of generating regular vehicles (random + np.random), kept for reference and benchmarking. Yields (departure time, attribute dict, stop list)."""
+    special_times = sorted(special_times)
+    next_special_idx = 0  # 下一个尚未出发的特殊车辆索引 Index of the next special vehicle that has not departed yet
+    depart_time = 0  # 初始出发时间 Initial departure time
+
+    for _ in range(num_vehicles):
+        # 已经出发的特殊车辆不再需要避让
+        # Special vehicles that have already departed no longer need to be avoided
+        while next_special_idx < len(special_times) and depart_time >= special_times[next_special_idx]:
+            next_special_idx += 1
+
+        # 按照概率分布选择路线
+        # Select routes according to the probability distribution
+        chosen_route = random.choices(route_ids, weights=route_weights, k=1)[0]
+
+        # 随机生成车辆颜色（RGB格式），但排除红色和橙色（红色保留给紧急车辆，橙色给事故车辆）
+        # Randomly generate vehicle color (RGB format), excluding red and orange (red is reserved for emergency vehicles, orange for accident vehicles)
+        r = random.randint(0, 200)  # 限制红色分量不超过200
+        g = random.randint(0, 255)
+        b = random.randint(0, 255)
+
+        # 确保颜色不是红色(255,0,0)或橙色(255,128,0)
+        # Ensure the color is not red (255,0,0) or orange (255,128,0)
+        while (r > 240 and g < 50 and b < 50) or (r > 240 and 100 < g < 150 and b < 50):
+            r = random.randint(0, 200)
+            g = random.randint(0, 255)
+            b = random.randint(0, 255)
+
+        # 生成随机的出发间隔，使车辆出发时间不完全均匀
+        # Generate random departure intervals to prevent vehicle departure times from being completely uniform
+        depart_interval = max(0.1, np.random.normal(base_depart_interval, interval_std_dev))
+        depart_time += depart_interval
+
+        # 确保不覆盖特殊车辆的时间
+        # Ensure the special vehicle's time is not overwritten
+        while (next_special_idx < len(special_times) and
+               abs(depart_time - special_times[next_special_idx]) < 0.1):
+            depart_time += 0.2  # 稍微推迟普通车辆，避免与特殊车辆时间冲突 Delay regular vehicles slightly to avoid time conflicts with special vehicles
+
+        depart = round(depart_time, 2)
+        yield depart, {"id": "", "type": "car", "route": chosen_route, "depart": str(depart),
+                       "color": f"{r},{g},{b}"}, []
+
+
+def sample_regular_vehicles(rng, num_vehicles, route_weights, base_depart_interval, interval_std_dev,
+                            special_times=(), colors=True):
+    """一次性采样所有普通车辆的出发时间、路线索引和颜色（colors=False时为None），分布与逐辆循环一致。"""
+    """Draw departure times, route indices and colors (None with colors=False) of all regular vehicles at once, with the same distributions as the per-vehicle loop."""
+    # 出发间隔：截断在0.1秒的正态分布，累加得到出发时间
+    # Headways: normal distribution truncated at 0.1 s, accumulated into departure times
+    headways = np.maximum(0.1, rng.normal(base_depart_interval, interval_std_dev, num_vehicles))
+    depart = avoid_special_times(np.cumsum(headways), special_times)
+
+    # 按概率分布选择路线
+    # Select routes according to the probability distribution
+    weights = np.asarray(route_weights, dtype=float)
+    route_idx = rng.choice(len(weights), size=num_vehicles, p=weights / weights.sum())
+
+    return depart, route_idx, sample_vehicle_colors(rng, num_vehicles) if colors else None
+
+
+def avoid_special_times(base_depart, special_times):
+    """与逐辆循环相同的避让规则：与特殊车辆时间相差小于0.1秒的普通车辆推迟0.2秒，之后的车辆随之整体推迟。base_depart须已排序。"""
+    """Same avoidance rule as the per-vehicle loop: a regular vehicle within 0.1 s of a special vehicle is delayed by 0.2 s, and every later vehicle shifts with it. base_depart must be sorted."""
+    num_vehicles = len(base_depart)
+    shifts = np.zeros(num_vehicles)
+    offset = 0.0
+    start = 0
+    for special_time in np.sort(np.asarray(special_times, dtype=float)):
+        i = max(start, int(np.searchsorted(base_depart, special_time - 0.1 - offset, side="right")))
+        while i < num_vehicles and abs(base_depart[i] + offset - special_time) < 0.1:
+            shifts[i] += 0.2
+            offset += 0.2
+        start = i
+    return base_depart + np.cumsum(shifts)
+
+
+def sample_vehicle_colors(rng, num_vehicles):
+    """采样普通车辆的随机颜色（uint8数组[num_vehicles, 3]）。"""
+    """Draw random colors of regular vehicles (a uint8 array [num_vehicles, 3])."""
+    # 随机颜色，排除红色和橙色（保留给紧急车辆和事故车辆）
+    # Random colors excluding red and orange (reserved for emergency and accident vehicles)
+    colors = np.empty((num_vehicles, 3), dtype=np.uint8)
+    colors[:, 0] = rng.integers(0, 201, num_vehicles)  # 限制红色分量不超过200 Limit the red component to 200
+    colors[:, 1:] = rng.integers(0, 256, (num_vehicles, 2))
+    while True:
+        r, g, b = colors[:, 0], colors[:, 1], colors[:, 2]
+        rejected = (r > 240) & (b < 50) & ((g < 50) | ((g > 100) & (g < 150)))
+        n_rejected = int(rejected.sum())
+        if not n_rejected:
+            break
+        colors[rejected, 0] = rng.integers(0, 201, n_rejected)
+        colors[rejected, 1:] = rng.integers(0, 256, (n_rejected, 2))
+    return colors
+
+
+def build_vehicle_table(route_ids, route_weights, num_vehicles, base_depart_interval, interval_std_dev,
+                        special_times=(), seed=None, colors=True):
+    """批量生成模式：用一个带种子的numpy Generator一次性采样全部普通车辆，返回按出发时间排序的列式车辆表。
+    colors=False时不生成"color"列（颜色只在sumo-gui中有用，颜色最后采样，因此不影响其他列）。"""
+    """Batch generation mode: sample every regular vehicle at once from one seeded numpy Generator and return the columnar vehicle table in departure order.
+    With colors=False the "color" column is left out (colors only matter in sumo-gui and are drawn last, so the other columns do not change)."""
+    rng = np.random.default_rng(seed)
+    depart, route_idx, color = sample_regular_vehicles(
+        rng, num_vehicles, route_weights, base_depart_interval, interval_std_dev, special_times, colors)
+    table = {
+        "depart": depart,  # 出发时间（已排序） Departure times (sorted)
+        "route": route_idx,  # 路线索引 Route indices
+        "route_ids": list(route_ids),
+    }
+    if colors:
+        table["color"] = color  # RGB颜色 RGB colors
+    return table
+
+
+def build_profile_table(profile, route_probabilities=None, special_times=(), seed=None, colors=True):
+    """时变需求模式：按需求曲线（见demand_profile）采样各路线的非齐次泊松到达，返回与build_vehicle_table()格式相同的车辆表。"""
+    """Time-varying demand mode: sample the non-homogeneous Poisson arrivals of every route from a demand profile (see demand_profile) and return a vehicle table in the same format as build_vehicle_table()."""
+    rng = np.random.default_rng(seed)
+    route_ids, bin_edges, rates = profile_rates(profile, route_probabilities)
+    depart, route_idx = sample_profile_departures(rng, bin_edges, rates)
+    table = {
+        "depart": avoid_special_times(depart, special_times),
+        "route": route_idx,
+        "route_ids": route_ids,
+    }
+    if colors:
+        table["color"] = sample_vehicle_colors(rng, len(depart))
+    return table
+
+
+def lane_route_weights(index, lane_ids, route_ids, route_edges, route_probabilities):
+    """车道-路线权重矩阵[车道, 路线]：路线的第一条edge是该车道所在edge、且第二条edge是该车道可以驶入的下游edge时，
+    权重为该路线的概率（该车道的可用路线概率均为0时改为等权重）。某条车道没有可用路线时抛出ValueError。"""
+    """Lane-route weight matrix [lane, route]: a route is usable from a lane if it starts on the lane's edge and its second edge is one the lane connects to;
+    its weight is the route probability (equal weights if every usable route of the lane has probability 0). Raises ValueError if a lane has no usable route."""
+    weights = np.zeros((len(lane_ids), len(route_ids)))
+    for row, lane_id in enumerate(lane_ids):
+        if lane_id not in index.lane_lookup:
+            raise ValueError(f"lane {lane_id} of the per-lane demand is not in the network")
+        lane = index.lane_lookup[lane_id]
+        lane_edge = str(index.edge_ids[index.lane_edge[lane]])
+        targets = index.lane_targets(lane)
+        usable = [col for col, route_id in enumerate(route_ids)
+                  if route_edges[route_id].split()[0] == lane_edge and
+                  (len(route_edges[route_id].split()) == 1 or route_edges[route_id].split()[1] in targets)]
+        if not usable:
+            raise ValueError(f"no defined route can start on lane {lane_id} (movements {sorted(index.lane_movements(lane))})")
+        weights[row, usable] = [route_probabilities.get(route_ids[col], 0.0) for col in usable]
+        if weights[row].sum() <= 0:
+            weights[row, usable] = 1.0
+    return weights
+
+
+def build_lane_table(profile, index, route_edges, route_probabilities, special_times=(), seed=None, colors=True):
+    """车道需求模式：按车道需求（见demand_profile）批量生成车辆，每辆车带有departLane，路线与该车道允许的转向一致。
+    返回的车辆表在build_vehicle_table()的列之外还有"lane"（车道行号）、"depart_lane"（车道index）、"lane_ids"、"bin_edges"和"counts"。"""
+    """Per-lane demand mode: generate vehicles in bulk from a per-lane demand (see demand_profile); every vehicle gets a departLane and a route consistent with the lane's allowed movements.
+    Besides the columns of build_vehicle_table() the table holds "lane" (lane rows), "depart_lane" (lane indices), "lane_ids", "bin_edges" and "counts"."""
+    rng = np.random.default_rng(seed)
+    lane_ids, bin_edges, counts = lane_counts(profile)
+    route_ids = list(route_edges)
+    weights = lane_route_weights(index, lane_ids, route_ids, route_edges, route_probabilities)
+    depart, lane_row, route_idx = sample_lane_departures(rng, bin_edges, counts, weights)
+    lane_index = index.lane_index[[index.lane_lookup[lane_id] for lane_id in lane_ids]]
+    table = {
+        "depart": avoid_special_times(depart, special_times),
+        "route": route_idx,
+        "route_ids": route_ids,
+        "lane": lane_row,
+        "depart_lane": np.asarray(lane_index, dtype=np.int64)[lane_row],
+        "lane_ids": lane_ids,
+        "bin_edges": bin_edges,
+        "counts": counts,
+    }
+    if colors:
+        table["color"] = sample_vehicle_colors(rng, len(depart))
+    return table
+
+
+def write_lane_summary(path, table):
+    """写出车道需求的核对表（CSV）：每个(车道, 时段)的指定车辆数与实际生成的车辆数，返回不一致的单元格数。
+    避让特殊车辆的推迟可能把个别车辆推到下一个时段。"""
+    """Write the check table of a per-lane demand (CSV): specified and generated vehicle count of every (lane, bin) cell. Returns the number of cells that differ.
+    Delays that avoid special vehicles may push a few vehicles into the next bin."""
+    bin_edges, counts = table["bin_edges"], table["counts"]
+    num_bins = counts.shape[1]
+    bin_idx = np.clip(np.searchsorted(bin_edges, table["depart"], side="right") - 1, 0, num_bins - 1)
+    generated = np.bincount(table["lane"] * num_bins + bin_idx, minlength=counts.size).reshape(counts.shape)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["lane", "begin", "end", "specified", "generated"])
+        for row, lane_id in enumerate(table["lane_ids"]):
+            for b in range(num_bins):
+                writer.writerow([lane_id, f"{bin_edges[b]:g}", f"{bin_edges[b + 1]:g}", int(counts[row, b]),
+                                 int(generated[row, b])])
+    return int((generated != counts).sum())
+
+
+# 保存到.npz的车辆表列（其余为元数据） Vehicle table columns stored in .npz (the rest is metadata)
+TABLE_COLUMNS = ("depart", "route", "type", "color", "depart_lane", "lane")
+
+
+def save_vehicle_table(path, table, type_ids=("car",)):
+    """将列式车辆表保存为压缩的.npz：出发时间、路线索引、类型索引、车道及可选的颜色，路线ID和类型ID作为字符串数组。
+    比逐辆的XML小一个数量级，可用load_vehicle_table()读回并重新写出路线文件。"""
+    """Save a columnar vehicle table as a compressed .npz: departure times, route indices, type indices, lanes and the optional colors, with route and type IDs as string arrays.
+    An order of magnitude smaller than per-vehicle XML; load_vehicle_table() reads it back for writing a route file again."""
+    arrays = {name: table[name] for name in TABLE_COLUMNS if name in table}
+    arrays.setdefault("type", np.zeros(len(table["depart"]), dtype=np.uint8))
+    arrays["route"] = np.asarray(arrays["route"], dtype=np.min_scalar_type(max(len(table["route_ids"]) - 1, 0)))
+    arrays["route_ids"] = np.asarray(table["route_ids"], dtype=str)
+    arrays["type_ids"] = np.asarray(table.get("type_ids", type_ids), dtype=str)
+    if "lane_ids" in table:
+        arrays["lane_ids"] = np.asarray(table["lane_ids"], dtype=str)
+    np.savez_compressed(path, **arrays)
+
+
+def load_vehicle_table(path):
+    """读取save_vehicle_table()保存的车辆表。"""
+    """Read a vehicle table saved by save_vehicle_table()."""
+    with np.load(path) as data:
+        table = {name: data[name] for name in data.files}
+    for name in ("route_ids", "type_ids", "lane_ids"):
+        if name in table:
+            table[name] = table[name].tolist()
+    return table
+
+
+def iter_table_vehicles(table, chunk_size=65536):
+    """将车辆表转换为按出发时间排序的事件流，元素为(出发时间, 属性字典, stop列表)。
+    字符串按块转换，内存占用与车辆总数无关。"""
+    """Turn a vehicle table into a time-ordered event stream of (departure time, attribute dict, stop list).
+    Strings are formatted one chunk at a time, so memory use does not grow with the vehicle count."""
+    route_ids = np.asarray(table["route_ids"])
+    type_ids = np.asarray(table.get("type_ids", ["car"]))
+    for start in range(0, len(table["depart"]), chunk_size):
+        stop = start + chunk_size
+        route_names = route_ids[table["route"][start:stop]].tolist()
+        departs = np.round(table["depart"][start:stop], 2).tolist()
+        count = len(departs)
+        types = type_ids[table["type"][start:stop]].tolist() if "type" in table else ["car"] * count
+        # 可选列：departLane（车道需求模式）和颜色 Optional columns: departLane (per-lane demand mode) and colors
+        lanes = table["depart_lane"][start:stop].tolist() if "depart_lane" in table else None
+        colors = ([f"{r},{g},{b}" for r, g, b in table["color"][start:stop].tolist()] if "color" in table
+                  else None)
+        for i, (depart, route_name, vehicle_type) in enumerate(zip(departs, route_names, types)):
+            attrib = {"id": "", "type": vehicle_type, "route": route_name, "depart": str(depart)}
+            if lanes is not None:
+                attrib["departLane"] = str(lanes[i])
+            if colors is not None:
+                attrib["color"] = colors[i]
+            yield depart, attrib, []
+
+
+def merge_vehicle_streams(streams):
+    """用堆对多个按时间排序的事件流做k路归并（O(n log k)），按出发时间顺序产出(属性字典, stop列表)并分配连续ID。
+    出发时间相同时按streams中的先后顺序输出。"""
+    """k-way merge of several time-ordered event streams with a heap (O(n log k)), yielding (attribute dict, stop list) in departure order with consecutive IDs.
+    Ties on departure time are broken by the order of the streams."""
+    for i, (_, attrib, stops) in enumerate(heapq.merge(*streams, key=lambda event: event[0])):
+        attrib["id"] = str(i)
+        yield attrib, stops
+
+
+def tally_vehicles(vehicles, counts, depart_range):
+    """在车辆写出的同时做统计：counts[车辆类型][路线ID]为车辆数，depart_range记录[最早, 最晚]出发时间（输入须已按时间排序）。
+    <flow>（带begin而不是depart）只计入时间范围，其车辆数由调用者按期望值统计。"""
+    """Count vehicles while they are being written: counts[vehicle type][route ID] is the vehicle count and depart_range holds [earliest, latest] departure (the input must be time-ordered).
+    <flow>s (with begin instead of depart) only extend the time range; the caller counts their expected vehicles."""
+    for attrib, stops in vehicles:
+        if "depart" in attrib:
+            depart = attrib["depart"]
+            type_counts = counts.setdefault(attrib["type"], {})
+            type_counts[attrib["route"]] = type_counts.get(attrib["route"], 0) + 1
+        else:
+            depart = attrib["begin"]
+        if not depart_range:
+            depart_range.extend((depart, depart))
+        depart_range[1] = depart
+        yield attrib, stops
+
+
+def append_vehicles(root, vehicles):
+    """将(属性字典, stop列表)形式的车辆添加到ElementTree根元素下（带begin而不是depart的条目为<flow>）。"""
+    """Append vehicles given as (attribute dict, stop list) under the ElementTree root (entries with begin instead of depart become <flow>s)."""
+    for attrib, stops in vehicles:
+        vehicle = ET.SubElement(root, "vehicle" if "depart" in attrib else "flow", attrib=attrib)
+        for stop in stops:
+            ET.SubElement(vehicle, "stop", attrib=stop)
+
+
+_ATTRIBUTE_ENTITIES = {'"': "&quot;", "\n": "&#10;"}  # ElementTree额外转义的属性字符 Extra characters ElementTree escapes in attributes
+
+
+def _xml_attributes(attrib):
+    """将属性字典格式化为XML属性字符串（与ElementTree的转义规则一致）。"""
+    """Format an attribute dict as an XML attribute string, escaped the same way ElementTree does."""
+    return " ".join(f'{key}="{escape(str(value), _ATTRIBUTE_ENTITIES)}"' for key, value in attrib.items())
+
+
+# 已序列化的类型块，按类型条目对象记忆 Serialized type blocks, memoized per type entries object
+_type_blocks = {}
+
+
+def format_vehicle_types(type_entries, space="    "):
+    """将类型条目序列化为XML文本。resolve_weather_types()返回的条目对象是记忆化的，因此相同的类型块只序列化一次。"""
+    """Serialize type entries into XML text. The entry objects returned by resolve_weather_types() are memoized, so identical type blocks are serialized only once."""
+    cached = _type_blocks.get((id(type_entries), space))
+    if cached is not None and cached[0] is type_entries:
+        return cached[1]
+    lines = []
+    for entry in type_entries:
+        if entry[0] == "vType":
+            lines.append(f"{space}<vType {_xml_attributes(entry[1])} />\n")
+        else:
+            lines.append(f"{space}<vTypeDistribution {_xml_attributes({'id': entry[1]})}>\n")
+            lines.extend(f"{space * 2}<vType {_xml_attributes(attributes)} />\n" for attributes in entry[2])
+            lines.append(f"{space}</vTypeDistribution>\n")
+    block = "".join(lines)
+    _type_blocks[(id(type_entries), space)] = (type_entries, block)
+    return block
+
+
+def write_route_file_streaming(path, type_params, route_definitions, vehicles, space="    ", chunk_size=4096,
+                               type_entries=None):
+    """流式写出路线文件：先写vType和route定义，再按出发时间顺序增量写出车辆，不构建完整的ElementTree。"""
+    """Stream the route file: write the vType and route definitions first, then append vehicles in departure order incrementally without building the full ElementTree.
+    vehicles is an iterable of (attribute dict, list of stop attribute dicts), already sorted by departure time; entries with begin instead of depart are written as <flow>. At most chunk_size vehicles are buffered before being flushed to disk.
+    type_entries (from resolved_vehicle_types()) replaces type_params when the types were expanded for the weather."""
+    if type_entries is None:
+        type_entries = resolved_vehicle_types(type_params)[0]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<routes>\n")
+        f.write(format_vehicle_types(type_entries, space))
+        for route_def in route_definitions:
+            f.write(f"{space}<route {_xml_attributes({'id': route_def['route_id'], 'edges': route_def['edges']})} />\n")
+
+        buffer = []
+        for attrib, stops in vehicles:
+            tag = "vehicle" if "depart" in attrib else "flow"
+            if stops:
+                buffer.append(f"{space}<{tag} {_xml_attributes(attrib)}>\n")
+                for stop in stops:
+                    buffer.append(f"{space * 2}<stop {_xml_attributes(stop)} />\n")
+                buffer.append(f"{space}</{tag}>\n")
+            else:
+                buffer.append(f"{space}<{tag} {_xml_attributes(attrib)} />\n")
+            if len(buffer) >= chunk_size:
+                f.write("".join(buffer))
+                buffer.clear()
+        f.write("".join(buffer))
+        f.write("</routes>\n")
+
+
+def default_scenario(seed=None):
+    """返回默认场景参数（即main()生成的场景），可作为批量生成的模板。"""
+    """Return the default scenario parameters (the scenario main() generates), used as the template for batch generation."""
     #todo 环境分为雨天。雪天、雾霾天。在这里可以通过修改accel、decel、maxSpeed、minGap等参数来达到不同的环境。（这几个目前默认，未添加"minGap": "1.5",  # 激进驾驶员，车辆间距更小 "tau": "0.8", # 反应更快 "sigma": "0.8" # 更激进, 此外跟车模型和变道模型也可设置）
     #todo The environment is classified into rainy, snowy, and foggy weather. Different environmental effects can be achieved here by modifying parameters such as accel, decel, maxSpeed, minGap, etc.
     # All modifications here are relative. (These parameters are currently set to default values; the following have not been added yet:"minGap": "1.5", # Aggressive drivers with smaller vehicle gaps"tau": "0.8", # Faster reaction time"sigma": "0.8" # More aggressive driving behaviorIn addition, the car-following model and lane-changing model can also be configured.)
+    # 天气现在通过场景的"weather"对下面的基础类型做相对变换（见weather.py）
+    # Weather is now applied as a relative transform of the base types below through the scenario's "weather" (see weather.py)
     #https://sumo.dlr.de/docs/Definition_of_Vehicles%2C_Vehicle_Types%2C_and_Routes.html#abstract_vehicle_class
     # 1. 定义多种车辆类型（可随机选择）
     # Define multiple vehicle types (random selection available).
@@ -102,10 +598,6 @@ def main():
          "color": "255,128,0", "sigma": "0.0", "guiShape": "truck",  # 使用货车形状表示事故车 Use a truck-shaped icon to represent a damaged vehicle.
          "minGap": "0.0", "emergencyDecel": "9.0"}
     ]
-    vehicle_types = []
-    for params in type_params:
-        vehicle_types.append(generate_vehicle_type(root, **params))
-
     # 2. 定义多条路线
     # 2. Define multiple routes
     route_definitions = [
@@ -122,15 +614,10 @@ def main():
         {"route_id": "eton", "edges": "-E0 E3"},
         {"route_id": "etos", "edges": "-E0 E1"}
     ]
-    route_edges = {}  # 存储路线ID和对应的edges Store route IDs and their corresponding edges
-    for route_def in route_definitions:
-        generate_route(root, **route_def)
-        route_edges[route_def["route_id"]] = route_def["edges"]
 
     # 3. 定义车辆生成参数
     # 3. Define vehicle generation parameters
     num_vehicles = 100  # 要生成的车辆总数 The total number of vehicles to be generated
-    depart_time = 0  # 初始出发时间 Initial departure time
     base_depart_interval = 1.0  # 基础出发间隔（秒） Basic departure interval (seconds)
     interval_std_dev = 0.25  # 出发间隔的标准差，用于随机化 Standard deviation of departure interval, used for randomization
 
@@ -141,8 +628,6 @@ def main():
         {"time": 60.0, "route": "ston", "type": "emergency"},  # 60秒时生成紧急车辆 Generate an emergency vehicle at 60 seconds
         {"time": 90.0, "route": "wtoe", "type": "emergency"},  # 90秒时生成紧急车辆 Generate an emergency vehicle at 90 seconds
     ]
-    emergency_vehicles.sort(key=lambda x: x["time"])  # 按时间排序 Sort by time
-    next_emergency_idx = 0  # 下一个要生成的紧急车辆索引 Index of the next emergency vehicle to be generated
 
     # 事故车辆参数
     # Accident vehicle parameters
@@ -154,8 +639,6 @@ def main():
         # {"time": 80.0, "route": "wtoe", "type": "accident",
         #  "accident_start": 85.0, "accident_end": 115.0},  # 80秒生成，85-115秒事故 # Generated at 80 seconds, accident occurs from 85 to 115 seconds
     ]
-    accident_vehicles.sort(key=lambda x: x["time"])  # 按时间排序 Sort by time
-    next_accident_idx = 0  # 下一个要生成的事故车辆索引 Index of the next accident vehicle to be generated
 
     # 4. 定义不同路线的车辆生成概率
     # 4. Define the vehicle generation probability for different routes
@@ -174,11 +657,134 @@ def main():
         "eton": 0.05,  # 5%
         "etos": 0.05  # 5%
     }
+
+    return {
+        "type_params": type_params,
+        "route_definitions": route_definitions,  # 也可以为"auto"：从路网自动枚举 May also be "auto": enumerated from the network
+        "num_vehicles": num_vehicles,
+        "base_depart_interval": base_depart_interval,
+        "interval_std_dev": interval_std_dev,
+        "emergency_vehicles": emergency_vehicles,
+        "accident_vehicles": accident_vehicles,
+        "route_probabilities": route_probabilities,  # 也可以为"uniform"：所有路线等概率 May also be "uniform": equal probability for every route
+        # 其他特殊车辆流：可直接添加新的流（如公交车、货车），无需复制生成逻辑
+        # Further special vehicle streams: new streams (buses, trucks, ...) can be added here without copying any generation logic
+        # "bus": [{"time": 20.0, "route": "ntos", "type": "bus", "color": "0,0,255"}],  # 需要先在type_params中定义bus类型 Define the bus type in type_params first
+        "special_streams": {},
+        # 时变需求曲线（字典或JSON/CSV文件路径，格式见demand_profile），给定时代替num_vehicles和出发间隔参数
+        # Time-varying demand profile (a dict or a JSON/CSV file path, format in demand_profile); replaces num_vehicles and the headway parameters when given
+        "demand_profile": None,
+        # 车道需求（字典或JSON/CSV文件路径，格式见demand_profile）：每条车道每个时段的精确车辆数，需要路网文件
+        # Per-lane demand (a dict or a JSON/CSV file path, format in demand_profile): exact vehicle counts per lane and bin; needs the network file
+        "lane_demand": None,
+        # 天气："rain"、"snow"、"fog"，按比例混合如{"rain": 0.7, "clear": 0.3}，或随时间变化的列表，见weather
+        # Weather: "rain", "snow", "fog", a mix such as {"rain": 0.7, "clear": 0.3}, or a time-varying list, see weather
+        "weather": None,
+        # 自定义天气曲线{名称: {"scale": {...}, "offset": {...}, "set": {...}}} Custom weather profiles {name: {"scale": {...}, "offset": {...}, "set": {...}}}
+        "weather_profiles": {},
+        # 不带事故车辆的车道封闭事件：[{"lane", "begin", "end", "pos", "length", "partial"}]，
+        # 或批量随机采样参数如{"count": 1000, "horizon": 86400, "duration": [300, 1800], "partial_share": 0.3}（需要路网文件）
+        # Lane closure incidents without an accident vehicle: [{"lane", "begin", "end", "pos", "length", "partial"}],
+        # or bulk random sampling parameters such as {"count": 1000, "horizon": 86400, "duration": [300, 1800], "partial_share": 0.3} (needs the network file)
+        "incidents": [],
+        # J0的信号配时方案{"type": "static"/"actuated"/"delay_based", "cycle": 90, "splits": [...], "offset": 0}，见signal_plans；
+        # 加上"preemption": {"lead": 5, "hold": 5}时为紧急车辆写出带优先相位的定时配时，见preemption
+        # Signal timing plan of J0 {"type": "static"/"actuated"/"delay_based", "cycle": 90, "splits": [...], "offset": 0}, see signal_plans;
+        # with "preemption": {"lead": 5, "hold": 5} a fixed-time program with preemption phases for the emergency vehicles is written as well, see preemption
+        "signal_plan": None,
+        # 进口车道检测器：每条进口车道一个E1感应线圈和一个E2区域检测器，按period秒聚合输出，见detectors；None时不布设
+        # 默认不布设：输出文件路径固定写在附加文件中，共享同一场景目录（ScenarioCache、VectorEnv）的运行会互相覆盖输出；
+        # 需要时显式设置如{"junctions": ["J0"], "period": 60.0, "e1_file": "e1_output.xml", "e2_file": "e2_output.xml"}，每次运行用各自的文件名
+        # Approach detectors: one E1 induction loop and one E2 lane area detector per incoming lane with outputs aggregated every period seconds, see detectors; None places none.
+        # Off by default: the output paths are fixed in the additional file, so runs sharing a scenario directory (ScenarioCache, VectorEnv) would
+        # overwrite each other's outputs; enable them explicitly, e.g. {"junctions": ["J0"], "period": 60.0, "e1_file": "e1_output.xml", "e2_file": "e2_output.xml"}, with per-run file names
+        "detectors": None,
+        # 普通车辆的随机颜色（只在sumo-gui中有用），关闭后路线文件更小 Random colors of regular vehicles (only useful in sumo-gui); turning them off shrinks the route file
+        "vehicle_colors": True,
+        # 普通车辆的写法："vehicles"逐辆写出，"flows"把需求曲线的每个(路线, 时段)写成一个<flow>（只适用于demand_profile）
+        # How regular vehicles are written: "vehicles" one by one, "flows" one <flow> per (route, bin) of the demand profile (demand_profile only)
+        "route_format": "vehicles",
+        # <flow>的间隔方式："poisson"、"bernoulli"或"uniform"，见demand_profile.profile_flows
+        # Spacing of the <flow>s: "poisson", "bernoulli" or "uniform", see demand_profile.profile_flows
+        "flow_spacing": "poisson",
+        # 列式车辆表的文件名（.npz，见save_vehicle_table），为None时不保存 File name of the columnar vehicle table (.npz, see save_vehicle_table); None skips it
+        "table_file": None,
+        "net_file": "net.net.xml",  # 路网文件 Network file
+        "seed": seed,  # numpy随机数生成器的种子 Seed of the numpy random Generator
+    }
+
+
+def generate_scenario(scenario, output_dir=".", batch=True, stream=True, config_name=None, metrics=None):
+    """根据场景参数生成路线文件与事故附加文件（config_name不为空时同时生成.sumocfg），返回生成的文件路径。
+    batch=True时使用向量化批量生成，stream=True时流式写出路线文件。metrics（metrics.GenerationMetrics）记录各阶段耗时与计数器。"""
+    """Generate the route file and the accident additional file of a scenario into output_dir (plus a .sumocfg when config_name is given) and return the generated paths.
+    batch=True uses the vectorized batch engine; stream=True streams the route file to disk instead of building the full ElementTree. metrics (a metrics.GenerationMetrics) records stage timings and counters."""
+    metrics = metrics if metrics is not None else GenerationMetrics()
+    with metrics.profiling(), metrics.stage("total"):
+        return _generate_scenario(scenario, output_dir, batch, stream, config_name, metrics)
+
+
+def _generate_scenario(scenario, output_dir, batch, stream, config_name, metrics):
+    route_file = os.path.join(output_dir, "generated_vehicles.rou.xml")
+    additional_file = os.path.join(output_dir, "accident_config.add.xml")
+
+    # 创建XML根元素
+    # Create the root element of the XML file.
+    root = ET.Element("routes")
+    # 1. 车辆类型：按天气（见weather）展开
+    # 1. Vehicle types, expanded for the weather (see weather)
+    type_params = scenario["type_params"]
+    type_entries, weather_timeline = resolved_vehicle_types(type_params, scenario.get("weather"),
+                                                            scenario.get("weather_profiles"))
+    append_vehicle_types(root, type_entries)
+
+    # 读取路网索引，用于路线枚举与校验、事故车道选择
+    # Load the network index, used for route enumeration and validation and for the accident lane choice
+    net_index = None
+    if os.path.exists(scenario["net_file"]):
+        with metrics.stage("network_index"):
+            net_index = load_network_index(scenario["net_file"])
+    else:
+        log.warning(f"警告: 路网文件 {scenario['net_file']} 不存在，跳过路线校验，事故车道使用默认的\"_1\"")
+
+    # 2. 路线：route_definitions为"auto"时从路网的连接图自动枚举所有可行的OD路线
+    # 2. Routes: with route_definitions="auto" every feasible OD route is enumerated from the network's connection graph
+    route_definitions = scenario["route_definitions"]
+    with metrics.stage("routes"):
+        if route_definitions == "auto":
+            if net_index is None:
+                raise ValueError(f"route_definitions='auto' requires the network file {scenario['net_file']}")
+            route_definitions = net_index.enumerate_routes(scenario.get("route_k", 1))
+        if net_index is not None:
+            # 在写任何文件之前校验路线，不可行的路线在生成阶段即报错，而不是等到SUMO加载时
+            # Validate the routes before writing anything, so a bad route fails here instead of when SUMO loads it
+            net_index.validate_routes(route_definitions)
+    metrics.count("routes", len(route_definitions))
+    route_edges = {}  # 存储路线ID和对应的edges Store route IDs and their corresponding edges
+    for route_def in route_definitions:
+        generate_route(root, **route_def)
+        route_edges[route_def["route_id"]] = route_def["edges"]
+
+    # 3. 车辆生成参数
+    # 3. Vehicle generation parameters
+    num_vehicles = scenario["num_vehicles"]
+    base_depart_interval = scenario["base_depart_interval"]
+    interval_std_dev = scenario["interval_std_dev"]
+    emergency_vehicles = sorted(scenario["emergency_vehicles"], key=lambda x: x["time"])  # 按时间排序 Sort by time
+    accident_vehicles = sorted(scenario["accident_vehicles"], key=lambda x: x["time"])  # 按时间排序 Sort by time
+    accident_vehicles = resolve_accident_lanes(accident_vehicles, route_edges, net_index)
+
+    # 4. 各路线的车辆生成概率
+    # 4. Vehicle generation probability of each route
+    if scenario["route_probabilities"] == "uniform":
+        route_probabilities = {route_id: 1.0 / len(route_edges) for route_id in route_edges}
+    else:
+        route_probabilities = dict(scenario["route_probabilities"])
     # 验证概率总和为1
     # Verify that the sum of probabilities is 1
     prob_sum = sum(route_probabilities.values())
     if abs(prob_sum - 1.0) > 0.0001:
-        print(f"警告: 路线概率总和为{prob_sum}，不等于1.0，将自动归一化")
+        log.warning(f"警告: 路线概率总和为{prob_sum}，不等于1.0，将自动归一化")
         # 归一化处理
         # Normalization processing
         for route_id in route_probabilities:
@@ -189,444 +795,406 @@ def main():
     route_ids = list(route_probabilities.keys())
     route_weights = list(route_probabilities.values())
 
-    # 车辆计数
-    # Vehicle count
-    vehicle_id = 0
-    emergency_count = 0
-    accident_count = 0
-
-    # 记录每个车辆的出发时间
-    # Record the departure time of each vehicle
-    vehicle_depart_times = []
-
-    # 5. 生成车辆
-    # 5. Generate vehicles
-    # 总车辆数包含普通车辆、紧急车辆和事故车辆
-    # The total number of vehicles includes regular vehicles, emergency vehicles and accident vehicles
-    total_special_vehicles = len(emergency_vehicles) + len(accident_vehicles)
-
-    for _ in range(num_vehicles + total_special_vehicles):
-        # 检查是否需要生成紧急车辆
-        # Check whether an emergency vehicle needs to be generated
-        if (next_emergency_idx < len(emergency_vehicles) and
-                depart_time >= emergency_vehicles[next_emergency_idx]["time"]):
-            # 生成紧急车辆
-            # Generate emergency vehicles
-            emergency = emergency_vehicles[next_emergency_idx]
-            chosen_type = emergency["type"]
-            chosen_route = emergency["route"]
-            emergency_time = emergency["time"]
-
-            # 紧急车辆颜色固定为红色
-            # The color of emergency vehicles is fixed as red
-            vehicle_color = "255,0,0"
-
-            # 创建紧急车辆元素
-            # Generate emergency vehicles
-            vehicle = ET.SubElement(root, "vehicle", attrib={
-                "id": f"emergency_{emergency_count}",  # 紧急车辆特殊ID
-                "type": chosen_type,
-                "route": chosen_route,
-                "depart": str(round(emergency_time, 2)),
-                "color": vehicle_color
-            })
-
-            print(f"生成紧急车辆 {emergency_count} 在 {emergency_time} 秒，路线: {chosen_route}")
-            emergency_count += 1
-            next_emergency_idx += 1
-            vehicle_depart_times.append(emergency_time)
-
-            # 设置depart_time为紧急车辆生成时间，避免时间跳跃
-            # Set depart_time to the generation time of emergency vehicles to avoid time jumps
-            depart_time = max(depart_time, emergency_time)
-
-            # 继续循环，不增加普通车辆计数
-            # Continue the loop without incrementing the count of regular vehicles
-            continue
-
-        # 检查是否需要生成事故车辆
-        # Check whether an accident vehicle needs to be generated
-        if (next_accident_idx < len(accident_vehicles) and
-                depart_time >= accident_vehicles[next_accident_idx]["time"]):
-            # 生成事故车辆
-            # Generate accident vehicles
-            accident = accident_vehicles[next_accident_idx]
-            chosen_type = accident["type"]
-            chosen_route = accident["route"]
-            accident_time = accident["time"]
-            accident_start = accident["accident_start"]
-            accident_end = accident["accident_end"]
-
-            # 事故持续时间和位置计算
-            # Calculation of accident duration and location
-            accident_duration = accident_end - accident_start
-
-            # 事故车辆颜色固定为橙色
-            # The color of accident vehicles is fixed as orange
-            vehicle_color = "255,128,0"
-
-            # 创建事故车辆元素
-            # Create accident vehicle element
-            vehicle = ET.SubElement(root, "vehicle", attrib={
-                "id": f"accident_{accident_count}",  # 事故车辆特殊ID
-                "type": chosen_type,
-                "route": chosen_route,
-                "depart": str(round(accident_time, 2)),
-                "color": vehicle_color
-            })
-
-            # 为事故车辆添加停车(stop)定义
-            # Add stop definition for accident vehicles
-            # 获取路线的edges
-            # Get edges of the route
-            edges = route_edges[chosen_route]
-            edge_list = edges.split()
-            if edge_list:
-                first_edge = edge_list[0]
-                # 这里我们使用默认车道"_1"，实际可能需要根据路网调整
-                # We use the default lane "_1" here; it may need to be adjusted according to the road network in practice
-                lane_id = f"{first_edge}_1"
-
-                # 添加stop元素
-                # Add stop element
-                stop = ET.SubElement(vehicle, "stop", attrib={
-                    "lane": lane_id,
-                    "pos": "50",  # 在edge的50米位置停车 Park at the 50-meter position of the edge
-                    "startPos": "45",  # 实际停车开始位置 Actual parking start position
-                    "endPos": "55",  # 实际停车结束位置 Actual parking end position
-                    "duration": str(accident_duration),  # 停车持续时间 Parking duration
-                    "until": str(accident_end),  # 停车直到指定时间 Park until the specified time
-                    "triggered": "false",  # 不触发 Do not trigger
-                    "parking": "false",  # 不是停车 Not a parking event
-                })
-
-                print(f"生成事故车辆 {accident_count} 在 {accident_time} 秒，路线: {chosen_route}")
-                print(f"  事故时间: {accident_start}-{accident_end}秒 (持续{accident_duration}秒)")
-                print(f"  事故位置: {lane_id}, 位置: 50米处")
-
-            accident_count += 1
-            next_accident_idx += 1
-            vehicle_depart_times.append(accident_time)
-
-            # 设置depart_time为事故车辆生成时间
-            # Set depart_time to the generation time of accident vehicles
-            depart_time = max(depart_time, accident_time)
-
-            # 继续循环，不增加普通车辆计数
-            # Continue the loop without incrementing the count of regular vehicles
-            continue
-
-        # 如果你有多个车辆类型，可以取消下面的代码
-        # If you have multiple vehicle types, you can comment out the code below
-        # vehicle_type_probabilities = {
-        #     "car": 0.9,  # 60%的小汽车
-        #     "truck": 0.3,  # 30%的卡车
-        #     "motorbike": 0.1,  # 10%的摩托车
-        # }
-        # type_ids = list(vehicle_type_probabilities.keys())
-        # type_weights = list(vehicle_type_probabilities.values())
-        # chosen_type = random.choices(type_ids, weights=type_weights, k=1)[0]
-
-        chosen_type = "car"
-
-        # 按照概率分布选择路线
-        # Select routes according to the probability distribution
-        chosen_route = random.choices(route_ids, weights=route_weights, k=1)[0]
-
-        # 随机生成车辆颜色（RGB格式），但排除红色和橙色（红色保留给紧急车辆，橙色给事故车辆）
-        # Randomly generate vehicle color (RGB format), excluding red and orange (red is reserved for emergency vehicles, orange for accident vehicles)
-
-        r = random.randint(0, 200)  # 限制红色分量不超过200
-        g = random.randint(0, 255)
-        b = random.randint(0, 255)
-
-        # 确保颜色不是红色(255,0,0)或橙色(255,128,0)
-        # Ensure the color is not red (255,0,0) or orange (255,128,0)
-        while (r > 240 and g < 50 and b < 50) or (r > 240 and 100 < g < 150 and b < 50):
-            r = random.randint(0, 200)
-            g = random.randint(0, 255)
-            b = random.randint(0, 255)
-
-        vehicle_color = f"{r},{g},{b}"
-
-        # 生成随机的出发间隔，使车辆出发时间不完全均匀
-        # Generate random departure intervals to prevent vehicle departure times from being completely uniform
-        depart_interval = max(0.1, np.random.normal(base_depart_interval, interval_std_dev))
-        depart_time += depart_interval
-
-        # 确保不覆盖紧急车辆的时间
-        # Ensure the emergency vehicle's time is not overwritten
-        while (next_emergency_idx < len(emergency_vehicles) and
-               abs(depart_time - emergency_vehicles[next_emergency_idx]["time"]) < 0.1):
-            depart_time += 0.2  # 稍微推迟普通车辆，避免与紧急车辆时间冲突 Delay regular vehicles slightly to avoid time conflicts with emergency vehicles
-
-        # 确保不覆盖事故车辆的时间
-        # Ensure the accident vehicle's time is not overwritten
-        while (next_accident_idx < len(accident_vehicles) and
-               abs(depart_time - accident_vehicles[next_accident_idx]["time"]) < 0.1):
-            depart_time += 0.2  # 稍微推迟普通车辆，避免与事故车辆时间冲突 Delay regular vehicles slightly to avoid time conflicts with accident vehicles
-
-        # 创建车辆元素
-        # Create vehicle element
-        vehicle = ET.SubElement(root, "vehicle", attrib={
-            "id": str(vehicle_id),
-            "type": chosen_type,
-            "route": chosen_route,
-            "depart": str(round(depart_time, 2)),
-            "color": vehicle_color
-        })
-
-        vehicle_id += 1
-        vehicle_depart_times.append(depart_time)
-
-        # 如果已经生成了足够多的普通车辆，跳出循环
-        # Exit the loop if a sufficient number of regular vehicles have been generated
-        if vehicle_id >= num_vehicles:
-            # 但可能还有紧急车辆和事故车辆需要生成
-            # However, there may still be emergency vehicles and accident vehicles left to generate
-            # 先生成剩余的紧急车辆
-            # Generate the remaining emergency vehicles first
-            while next_emergency_idx < len(emergency_vehicles):
-                emergency = emergency_vehicles[next_emergency_idx]
-                chosen_type = emergency["type"]
-                chosen_route = emergency["route"]
-                emergency_time = emergency["time"]
-
-                # 紧急车辆颜色固定为红色
-                # The color of emergency vehicles is fixed as red
-                vehicle_color = "255,0,0"
-
-                # 创建紧急车辆元素
-                # Create emergency vehicle element
-                vehicle = ET.SubElement(root, "vehicle", attrib={
-                    "id": f"emergency_{emergency_count}",
-                    "type": chosen_type,
-                    "route": chosen_route,
-                    "depart": str(round(emergency_time, 2)),
-                    "color": vehicle_color
-                })
-
-                print(f"生成紧急车辆 {emergency_count} 在 {emergency_time} 秒，路线: {chosen_route}")
-                emergency_count += 1
-                next_emergency_idx += 1
-                vehicle_depart_times.append(emergency_time)
-
-            # 生成剩余的事故车辆
-            # Generate the remaining accident vehicles
-            while next_accident_idx < len(accident_vehicles):
-                accident = accident_vehicles[next_accident_idx]
-                chosen_type = accident["type"]
-                chosen_route = accident["route"]
-                accident_time = accident["time"]
-                accident_start = accident["accident_start"]
-                accident_end = accident["accident_end"]
-
-                accident_duration = accident_end - accident_start
-                vehicle_color = "255,128,0"
-
-                vehicle = ET.SubElement(root, "vehicle", attrib={
-                    "id": f"accident_{accident_count}",
-                    "type": chosen_type,
-                    "route": chosen_route,
-                    "depart": str(round(accident_time, 2)),
-                    "color": vehicle_color
-                })
-
-                # 为事故车辆添加停车(stop)定义
-                # Add stop definition for accident vehicles
-                edges = route_edges[chosen_route]
-                edge_list = edges.split()
-                if edge_list:
-                    first_edge = edge_list[0]
-                    lane_id = f"{first_edge}_1"
-
-                    stop = ET.SubElement(vehicle, "stop", attrib={
-                        "lane": lane_id,
-                        "pos": "50",
-                        "startPos": "45",
-                        "endPos": "55",
-                        "duration": str(accident_duration),
-                        "until": str(accident_end),
-                        "triggered": "false",
-                        "parking": "false",
-                    })
-
-                    print(f"生成事故车辆 {accident_count} 在 {accident_time} 秒，路线: {chosen_route}")
-                    print(f"  事故时间: {accident_start}-{accident_end}秒 (持续{accident_duration}秒)")
-
-                accident_count += 1
-                next_accident_idx += 1
-                vehicle_depart_times.append(accident_time)
-
-            break
+    # 时变需求曲线（可为字典或JSON/CSV文件路径），给定时代替num_vehicles和固定出发间隔
+    # Time-varying demand profile (a dict or a JSON/CSV file path); when given it replaces num_vehicles and the constant headway
+    demand_profile = scenario.get("demand_profile")
+    if isinstance(demand_profile, str):
+        demand_profile = load_demand_profile(demand_profile)
+    if demand_profile is not None:
+        route_ids = profile_rates(demand_profile, route_probabilities)[0]
+
+    # 车道需求（可为字典或JSON/CSV文件路径）：每条车道每个时段的精确车辆数，车辆带departLane
+    # Per-lane demand (a dict or a JSON/CSV file path): exact vehicle counts per lane and bin, vehicles carry departLane
+    lane_demand = scenario.get("lane_demand")
+    if isinstance(lane_demand, str):
+        lane_demand = load_demand_profile(lane_demand, key="counts")
+    if lane_demand is not None:
+        if demand_profile is not None:
+            raise ValueError("demand_profile and lane_demand cannot be combined")
+        if net_index is None:
+            raise ValueError(f"lane_demand requires the network file {scenario['net_file']}")
+        route_ids = list(route_edges)
+
+    # 特殊车辆流：每个流是一组按时间生成的车辆
+    # Special vehicle streams: each stream is a list of timed vehicles
+    special_streams = {
+        "emergency": emergency_vehicles,
+        "accident": accident_vehicles,
+        **scenario.get("special_streams", {}),
+    }
 
-    # 6. 重新按出发时间排序所有车辆
-    # 6. Re-sort all vehicles by departure time
-    # 获取所有车辆并排序
-    # Get all vehicles and sort them
-    vehicles = root.findall("vehicle")
-    # 按出发时间排序
-    # Sort by departure time
-    vehicles_sorted = sorted(vehicles, key=lambda v: float(v.get("depart")))
-
-    # 清除原有车辆
-    # Clear the original vehicles
-    for vehicle in root.findall("vehicle"):
-        root.remove(vehicle)
-
-    # 按排序顺序重新添加，并重新分配ID
-    # Re-add in sorted order and reassign IDs
-    for i, vehicle in enumerate(vehicles_sorted):
-        vehicle.set("id", str(i))
-        root.append(vehicle)
-
-    # 7. 统计各路线实际生成的车辆数量
-    # 7. Count the actual number of vehicles generated for each route
-    route_counts = {route_id: 0 for route_id in route_ids}
-    emergency_route_counts = {route_id: 0 for route_id in route_ids}
-    accident_route_counts = {route_id: 0 for route_id in route_ids}
-
-    for vehicle in root.findall("vehicle"):
-        route_id = vehicle.get("route")
-        vehicle_type = vehicle.get("type")
-
-        if vehicle_type == "emergency":
-            emergency_route_counts[route_id] = emergency_route_counts.get(route_id, 0) + 1
-        elif vehicle_type == "accident":
-            accident_route_counts[route_id] = accident_route_counts.get(route_id, 0) + 1
+    # 所有引用的路线都必须已定义
+    # Every referenced route must be defined
+    referenced_routes = set(route_ids) | {entry["route"] for entries in special_streams.values() for entry in entries}
+    unknown_routes = referenced_routes - route_edges.keys()
+    if unknown_routes:
+        raise ValueError(f"undefined routes referenced: {', '.join(sorted(unknown_routes))}")
+
+    # 5. 生成各车辆流（默认使用批量向量化模式，batch=False时使用逐辆生成的原始循环）
+    # 5. Build the vehicle streams (the vectorized batch mode is the default; batch=False falls back to the original per-vehicle loop)
+    special_times = special_departure_times(special_streams)
+    colors = scenario.get("vehicle_colors", True)
+    route_format = scenario.get("route_format", "vehicles")
+    if route_format not in ("vehicles", "flows"):
+        raise ValueError(f"unknown route_format '{route_format}'")
+    if route_format == "flows" and demand_profile is None:
+        # 只有需求曲线是分段平稳的泊松过程，可以写成统计等价的<flow>
+        # Only demand profiles are piecewise-stationary Poisson processes that <flow>s reproduce in distribution
+        raise ValueError("route_format='flows' needs a demand_profile")
+    table = None
+    flow_counts = None
+    with metrics.stage("sampling"):
+        if lane_demand is not None:
+            table = build_lane_table(lane_demand, net_index, route_edges, route_probabilities, special_times,
+                                     seed=scenario.get("seed"), colors=colors)
+            num_vehicles = len(table["depart"])
+            regular_stream = iter_table_vehicles(table)
+        elif route_format == "flows":
+            # 每个(路线, 时段)一个<flow>，在天气切换时刻再分段，使retype_vehicles()能按开始时间切换类型
+            # One <flow> per (route, bin), split again where the weather changes so retype_vehicles() can switch types by begin time
+            flow_route_ids, bin_edges, rates = profile_rates(demand_profile, route_probabilities)
+            breaks = [begin for begin, _ in weather_timeline] if weather_timeline is not None else ()
+            flows = profile_flows(bin_edges, rates, flow_route_ids, scenario.get("flow_spacing", "poisson"), breaks)
+            # 普通车辆数为期望值 The regular vehicle counts are expected values
+            expected = rates @ np.diff(bin_edges) / 3600.0
+            flow_counts = dict(zip(flow_route_ids, np.round(expected).astype(int).tolist()))
+            num_vehicles = sum(flow_counts.values())
+            regular_stream = ((begin, attrib, []) for begin, attrib in flows)
+        elif demand_profile is not None:
+            # 需求曲线只有向量化采样实现 Demand profiles are only sampled by the vectorized engine
+            table = build_profile_table(demand_profile, route_probabilities, special_times, seed=scenario.get("seed"),
+                                        colors=colors)
+            num_vehicles = len(table["depart"])
+            regular_stream = iter_table_vehicles(table)
+        elif batch:
+            table = build_vehicle_table(route_ids, route_weights, num_vehicles, base_depart_interval, interval_std_dev,
+                                        special_times, seed=scenario.get("seed"), colors=colors)
+            regular_stream = iter_table_vehicles(table)
+        else:
+            regular_stream = iter_regular_vehicles_loop(route_ids, route_weights, num_vehicles, base_depart_interval,
+                                                        interval_std_dev, special_times)
+    # 普通车辆流放在最前面：出发时间相同时普通车辆先于特殊车辆
+    # The regular stream goes first so that it wins ties on departure time
+    streams = [regular_stream] + [iter_special_vehicles(name, entries, route_edges)
+                                  for name, entries in special_streams.items()]
+
+    # 6. 所有车辆流均已按时间排序，用堆归并直接得到最终顺序并写入文件，同时统计各路线的车辆数量
+    # 6. Every stream is already time-ordered, so a heap merge yields the final order directly; write it to the file while counting vehicles per route
+    vehicle_counts = {vehicle_type: {route_id: 0 for route_id in route_ids}
+                      for vehicle_type in ("car", "emergency", "accident")}
+    depart_range = []
+    # 归并时间单独计时（不含写出），写出阶段的时间扣除归并时间
+    # Merging is timed on its own (excluding writing), and the serialization stage excludes the merge time
+    # 只扣除这一次归并的时间，metrics可能已累计了之前调用的归并时间 Subtract only this call's merge time, as metrics may hold merges of earlier calls
+    merge_seconds = metrics.stages.get("merge", {}).get("seconds", 0.0)
+    vehicles = tally_vehicles(metrics.timed_iter("merge", merge_vehicle_streams(streams)), vehicle_counts,
+                              depart_range)
+    if weather_timeline is not None:
+        # 随时间变化的天气：按出发时间切换车辆类型（统计仍按基础类型）
+        # Time-varying weather: switch vehicle types by departure time (the statistics keep the base types)
+        vehicles = retype_vehicles(vehicles, weather_timeline, {params["type_id"] for params in type_params})
+    with metrics.stage("serialization"):
+        if stream:
+            write_route_file_streaming(route_file, type_params, route_definitions, vehicles, type_entries=type_entries)
         else:
-            route_counts[route_id] = route_counts.get(route_id, 0) + 1
-
-    print("\n车辆分布统计:")
-    print("普通车辆:")
-    for route_id, count in route_counts.items():
-        if count > 0:
-            percentage = (count / num_vehicles) * 100
-            print(f"  {route_id}: {count}辆车 ({percentage:.1f}%)")
-
-    print(f"\n紧急车辆: 共{emergency_count}辆")
-    for route_id, count in emergency_route_counts.items():
-        if count > 0:
-            print(f"  {route_id}: {count}辆车")
-
-    print(f"\n事故车辆: 共{accident_count}辆")
-    for route_id, count in accident_route_counts.items():
-        if count > 0:
-            print(f"  {route_id}: {count}辆车")
-            # 打印事故详细信息
-            # Print detailed accident information
-            for accident in accident_vehicles:
-                if accident["route"] == route_id:
-                    print(f"    事故时间: {accident['accident_start']}-{accident['accident_end']}秒")
-
-    # 计算最早的紧急车辆和最晚的车辆时间
-    # Calculate the earliest time of emergency vehicles and the latest time of vehicles
-    if vehicle_depart_times:
-        print(f"\n车辆时间统计:")
-        print(f"  最早出发时间: {min(vehicle_depart_times):.2f}秒")
-        print(f"  最晚出发时间: {max(vehicle_depart_times):.2f}秒")
-        print(f"  仿真持续时间: {max(vehicle_depart_times) - min(vehicle_depart_times):.2f}秒")
-
-    # 8. 将生成的XML结构写入文件
-    # 8. Write the generated XML structure to the file
-    tree = ET.ElementTree(root)
-    # 使用自定义缩进函数
-    # Use the custom indentation function
-    indent(root)
-
-    # 写入文件
-    # Write to the file
-    tree.write("generated_vehicles.rou.xml", encoding="utf-8", xml_declaration=True)
-    print(
-        f"\n成功生成包含 {num_vehicles} 辆普通车辆、{emergency_count} 辆紧急车辆和 {accident_count} 辆事故车辆的配置文件")
-    print(f"总车辆数: {num_vehicles + emergency_count + accident_count}")
-    print(f"配置文件: generated_vehicles.rou.xml")
+            append_vehicles(root, vehicles)
+            tree = ET.ElementTree(root)
+            # 使用自定义缩进函数
+            # Use the custom indentation function
+            indent(root)
+
+            # 写入文件
+            # Write to the file
+            tree.write(route_file, encoding="utf-8", xml_declaration=True)
+    metrics.stages["serialization"]["seconds"] -= metrics.stages["merge"]["seconds"] - merge_seconds
+    if flow_counts is not None:
+        vehicle_counts["car"].update(flow_counts)
+    for vehicle_type, route_counts in vehicle_counts.items():
+        metrics.count(f"vehicles.{vehicle_type}", sum(route_counts.values()))
+
+    # 7. 各路线实际生成的车辆数量
+    # 7. The actual number of vehicles generated for each route
+    emergency_count = len(emergency_vehicles)
+    accident_count = len(accident_vehicles)
+
+    # 统计在写出时已经完成，这里只负责输出；日志级别高于INFO时跳过格式化
+    # The statistics were collected while writing; this only reports them, and skips the formatting above INFO level
+    if log.isEnabledFor(logging.INFO):
+        log.info("\n车辆分布统计:")
+        log.info("普通车辆:")
+        for route_id, count in vehicle_counts["car"].items():
+            if count > 0:
+                percentage = (count / num_vehicles) * 100
+                log.info(f"  {route_id}: {count}辆车 ({percentage:.1f}%)")
+
+        log.info(f"\n紧急车辆: 共{emergency_count}辆")
+        for route_id, count in vehicle_counts["emergency"].items():
+            if count > 0:
+                log.info(f"  {route_id}: {count}辆车")
+
+        log.info(f"\n事故车辆: 共{accident_count}辆")
+        for route_id, count in vehicle_counts["accident"].items():
+            if count > 0:
+                log.info(f"  {route_id}: {count}辆车")
+                # 打印事故详细信息
+                # Print detailed accident information
+                for accident in accident_vehicles:
+                    if accident["route"] == route_id:
+                        log.debug(f"    事故时间: {accident['accident_start']}-{accident['accident_end']}秒")
+
+        for vehicle_type, route_counts in vehicle_counts.items():
+            if vehicle_type not in ("car", "emergency", "accident"):
+                log.info(f"\n{vehicle_type}车辆: 共{sum(route_counts.values())}辆")
+                for route_id, count in route_counts.items():
+                    log.info(f"  {route_id}: {count}辆车")
+
+        # 计算最早和最晚的车辆出发时间
+        # Calculate the earliest and the latest departure time
+        if depart_range:
+            earliest, latest = (float(t) for t in depart_range)
+            log.info(f"\n车辆时间统计:")
+            log.info(f"  最早出发时间: {earliest:.2f}秒")
+            log.info(f"  最晚出发时间: {latest:.2f}秒")
+            log.info(f"  仿真持续时间: {latest - earliest:.2f}秒")
+
+        log.info(
+            f"\n成功生成包含 {num_vehicles} 辆普通车辆、{emergency_count} 辆紧急车辆和 {accident_count} 辆事故车辆的配置文件")
+        log.info(f"总车辆数: {num_vehicles + sum(len(entries) for entries in special_streams.values())}")
+        log.info(f"配置文件: {route_file}")
+
+    # 8. 其他事件（车道封闭）：事件列表，或批量随机采样的参数{"count", "horizon", ...}（见incidents.sample_incidents）
+    # 8. Further incidents (lane closures): a list of incidents, or the parameters {"count", "horizon", ...} of bulk random sampling (see incidents.sample_incidents)
+    incidents = scenario.get("incidents") or []
+    if isinstance(incidents, dict):
+        if net_index is None:
+            raise ValueError(f"sampled incidents require the network file {scenario['net_file']}")
+        sampler = dict(incidents)
+        with metrics.stage("incidents"):
+            incidents = sample_incidents(net_index, sampler.pop("count"), sampler.pop("horizon"),
+                                         **{"seed": scenario.get("seed"), **sampler})
+    elif net_index is not None:
+        unknown_lanes = {incident["lane"] for incident in incidents} - net_index.lane_lookup.keys()
+        if unknown_lanes:
+            raise ValueError(f"incident lanes not in the network: {', '.join(sorted(unknown_lanes))}")
 
     # 9. 创建附加配置文件，用于事故车辆的特殊行为
     # 9. Create an additional configuration file for the special behaviors of accident vehicles
-    create_additional_file(accident_vehicles, route_edges)
+    detector_spec = scenario.get("detectors")
+    if detector_spec is not None and net_index is None:
+        log.warning("警告: 没有路网文件，不布设检测器")
+        detector_spec = None
+    with metrics.stage("additional_file"):
+        create_additional_file(accident_vehicles, route_edges, additional_file, index=net_index, incidents=incidents,
+                               metrics=metrics, detectors=detector_spec)
+
+    paths = {"route_file": route_file, "additional_file": additional_file}
+    if scenario.get("table_file") and table is not None:
+        # 列式车辆表（普通车辆），可用load_vehicle_table()读回 Columnar table of the regular vehicles, read back with load_vehicle_table()
+        paths["table_file"] = os.path.join(output_dir, scenario["table_file"])
+        with metrics.stage("table_file"):
+            save_vehicle_table(paths["table_file"], table)
+    additional_files = [additional_file]
+    signal_spec = scenario.get("signal_plan")
+    if signal_spec is not None:
+        # 信号配时方案（需要路网文件；交叉口不是信号控制时先用netconvert生成信号控制的路网，见signal_plans.build_tls_network）
+        # Signal timing plan (needs the network file; a junction without signal control first gets a signalized network built with netconvert, see signal_plans.build_tls_network)
+        if not os.path.exists(scenario["net_file"]):
+            raise ValueError(f"signal_plan requires the network file {scenario['net_file']}")
+        junction_id = signal_spec.get("junction", "J0")
+        paths["signal_file"] = os.path.join(output_dir, "signal_plan.add.xml")
+        with metrics.stage("signal_plan"):
+            template = load_signal_template(scenario["net_file"], junction_id, signal_spec.get("protected_left", True))
+            plans = signal_plan(template, signal_spec)
+            write_signal_programs(paths["signal_file"], template, plans, signal_spec.get("type", "static"),
+                                  program_prefix=signal_spec.get("program_id", "plan_"))
+        additional_files.append(paths["signal_file"])
+        log.info(f"已创建信号配时附加文件: {paths['signal_file']}")
+        if not net_index.junction_type[net_index.junction_lookup[junction_id]].startswith("traffic_light"):
+            # 无信号控制的交叉口加载不了tlLogic，.sumocfg改用打过tls patch的路网
+            # A junction without signal control cannot load a tlLogic, so the .sumocfg uses the network with the tls patch applied
+            paths["tls_patch"] = os.path.join(output_dir, f"{junction_id}.tll.xml")
+            paths["net_file"] = os.path.join(output_dir, "net_tls.net.xml")
+            with metrics.stage("tls_network"):
+                built = build_tls_network(scenario["net_file"], template, paths["tls_patch"], paths["net_file"])
+            if not built:
+                raise RuntimeError(f"signal_plan needs netconvert to turn {junction_id} into a traffic light junction: "
+                                   f"netconvert -s {scenario['net_file']} --tls.set {junction_id} "
+                                   f"--tllogic-files {paths['tls_patch']} -o {paths['net_file']}")
+            log.info(f"已生成信号控制路网: {paths['net_file']}")
+        preemption_spec = signal_spec.get("preemption")
+        if preemption_spec is not None:
+            # 紧急车辆信号优先：按预测的到达时间把优先相位写进定时配时（见preemption）
+            # Emergency vehicle preemption: the preemption phases are baked into a fixed-time program at the predicted arrivals (see preemption)
+            paths["preemption_file"] = os.path.join(output_dir, "signal_preemption.add.xml")
+            paths["preemption_report"] = os.path.join(output_dir, "preemption_report.json")
+            emergency_type = next((params for params in type_params if params["type_id"] == "emergency"), {})
+            with metrics.stage("preemption"):
+                arrivals = emergency_arrivals(
+                    emergency_vehicles, route_edges, net_index, template,
+                    max_speed=float(emergency_type.get("maxSpeed", vehicle_type_attributes("emergency")["maxSpeed"])),
+                    accel=float(emergency_type.get("accel", vehicle_type_attributes("emergency")["accel"])),
+                    speed_factor=preemption_spec.get("speed_factor", 1.0))
+                report = write_preemption_program(paths["preemption_file"], template, plans, arrivals,
+                                                  preemption_spec.get("lead", DEFAULT_LEAD),
+                                                  preemption_spec.get("hold", DEFAULT_HOLD),
+                                                  preemption_spec.get("horizon"))
+                with open(paths["preemption_report"], "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2, ensure_ascii=False)
+            metrics.count("preemptions", len(arrivals))
+            additional_files.append(paths["preemption_file"])
+            log.info(f"已创建紧急车辆信号优先配时: {paths['preemption_file']}（{len(arrivals)} 次优先，"
+                     f"估计减少等待 {report['emergency_wait_saved']:.1f} 秒，占用其他相位绿灯 {report['green_taken']:.1f} 秒）")
+    if lane_demand is not None:
+        # 车道需求的核对表 Check table of the per-lane demand
+        paths["lane_counts_file"] = os.path.join(output_dir, "lane_counts.csv")
+        mismatched = write_lane_summary(paths["lane_counts_file"], table)
+        metrics.count("lane_demand.mismatched_cells", mismatched)
+        log.info(f"车道车辆数核对表: {paths['lane_counts_file']}（{mismatched} 个车道时段与指定数量不一致）")
+    if config_name is not None:
+        paths["config_file"] = os.path.join(output_dir, config_name)
+        write_sumocfg(paths["config_file"], paths.get("net_file", scenario["net_file"]), route_file, additional_files)
+    return paths
+
+
+def main(batch=True, seed=None, stream=True, verbosity="info", report_file=None, memory=False, profile_file=None):
+    """在当前目录生成默认场景的路线文件与事故附加文件。seed为numpy随机数生成器的种子。
+    verbosity为日志级别（"debug"时输出每辆特殊车辆的信息）；report_file为JSON报告的路径（各阶段耗时、计数器，
+    memory=True时含内存峰值）；profile_file为cProfile结果的保存路径（同时写入报告）。"""
+    """Generate the route file and the accident additional file of the default scenario in the working directory. seed seeds the numpy random Generator.
+    verbosity is the log level ("debug" adds every special vehicle); report_file is the path of a JSON report (stage timings, counters and, with memory=True, peak memory);
+    profile_file is where the cProfile results are saved (they also go into the report)."""
+    configure_logging(verbosity)
+    metrics = GenerationMetrics(memory=memory, profile=profile_file is not None)
+    try:
+        generate_scenario(default_scenario(seed), batch=batch, stream=stream, metrics=metrics)
+    finally:
+        metrics.close()
+    if report_file is not None:
+        metrics.write_json(report_file)
+    if profile_file is not None:
+        metrics.dump_profile(profile_file)
+    return metrics.report()
 
 
 # https://sumo.dlr.de/docs/Simulation/Rerouter.html
-def create_additional_file(accident_vehicles, route_edges):
-    """创建附加配置文件，用于设置事故车辆的特殊行为"""
-    root = ET.Element("additional")
-
-    # 为每个事故车辆创建VSS（可变速度标志）
-    # Create a VSS (Variable Speed Sign) for each accident vehicle
-    for i, accident in enumerate(accident_vehicles):
+def create_additional_file(accident_vehicles, route_edges, path="accident_config.add.xml", index=None, incidents=(),
+                           metrics=None, detectors=None):
+    """创建附加配置文件，用于设置事故车辆的特殊行为。事故车辆与incidents中的其他事件一起合并（见incidents）：
+    每个有完全封闭的edge一个rerouter，时间段合并为最少的interval；每条受影响的车道一个variableSpeedSign。
+    恢复速度取路网中车道的限速（没有index时为13.89 m/s）；有index时先剔除合起来会切断某个转向的重叠封闭，事故车辆的封闭除外，只给出警告（见incidents.safe_closures）。
+    没有事故车辆的事件由一辆停在事故路段的阻塞车辆占据该路段。detectors（场景的"detectors"参数，需要index）在进口车道上加入E1/E2检测器，见detectors。"""
+    """Create the additional file that sets up the special behaviour of accident vehicles. Accident vehicles are merged together with the further incidents (see incidents):
+    one rerouter per edge with full closures, its time windows merged into the minimal set of intervals, and one variableSpeedSign per affected lane.
+    The restore speed is the lane's speed limit from the network (13.89 m/s without an index); with an index, overlapping closures that would cut off a movement together are trimmed first, except those of accident vehicles, which only get a warning (see incidents.safe_closures).
+    Incidents without an accident vehicle get a blocker vehicle stopped on the incident segment. metrics (a metrics.GenerationMetrics) counts the written elements.
+    detectors (the scenario's "detectors" parameters, needs index) adds E1/E2 detectors on the incoming lanes, see detectors."""
+    all_incidents = list(incidents)
+    for accident in accident_vehicles:
         route_id = accident["route"]
         if route_id in route_edges:
             edges_str = route_edges[route_id]
         else:
-            print(f"警告: 路线 {route_id} 在route_edges中未找到")
+            log.warning(f"警告: 路线 {route_id} 在route_edges中未找到")
             continue
 
         edge_list = edges_str.split()
         if not edge_list:
-            print(f"警告: 路线 {route_id} 的edges为空")
+            log.warning(f"警告: 路线 {route_id} 的edges为空")
             continue
 
         first_edge = edge_list[0]
-        lane_id = f"{first_edge}_1"
-
-        # 创建VSS区域
-        # Create VSS zone
-        vss = ET.SubElement(root, "variableSpeedSign", attrib={
-            "id": f"accident_vss_{i}",
-            "lanes": lane_id
-        })
-
-        # 在事故开始前，速度正常
-        # Before the accident starts, the speed remains normal
-        ET.SubElement(vss, "step", attrib={
-            "time": "0.00",
-            "speed": "13.89"  # 50 km/h
-        })
-
-        # 事故开始时间，速度降为0
-        # Accident start time; reduce speed to zero
-        ET.SubElement(vss, "step", attrib={
-            "time": str(accident["accident_start"]),
-            "speed": "0.00"
-        })
-
-        # 事故结束时间，速度恢复正常
-        # End time of the accident; restore speed to normal
-        ET.SubElement(vss, "step", attrib={
-            "time": str(accident["accident_end"]),
-            "speed": "13.89"
-        })
-
-        # 创建路侧设备
-        # Create roadside devices
-        rerouter = ET.SubElement(root, "rerouter", attrib={
-            "id": f"accident_rerouter_{i}",
-            "edges": first_edge  # 正确：edges="-E1"
-        })
-
-        # 在事故期间重新路由
-        # Reroute during the accident period
-        interval = ET.SubElement(rerouter, "interval", attrib={
-            "begin": str(accident["accident_start"]),
-            "end": str(accident["accident_end"])
-        })
-
-        # 关闭车道
-        # Close the lane
-        #todo 注意这里不能关闭只有一个类型的车道，比如只有一个车道负责左转，那这个车道就不能关闭，因为车辆无法重新规划路由导致报错
-        ET.SubElement(interval, "closingLaneReroute", attrib={
-            "id": lane_id,  # 修正：属性名改为"id"
-            "allow": "truck"
-        })
-
-    # 写入附加文件
-    # Write to the additional file
-    tree = ET.ElementTree(root)
-    indent(root)
-    tree.write("accident_config.add.xml", encoding="utf-8", xml_declaration=True)
-    print(f"已创建事故配置附加文件: accident_config.add.xml")
-    print("在运行SUMO时使用: sumo-gui -n your_network.net.xml -r generated_vehicles.rou.xml -a accident_config.add.xml")
+        all_incidents.append(accident_incident(accident, accident.get("lane", f"{first_edge}_1")))
+
+    if index is not None:
+        all_incidents, shortened, dropped, unsafe = safe_closures(all_incidents, index)
+        if shortened or dropped:
+            log.warning(f"警告: {shortened} 个封闭被缩短、{dropped} 个被丢弃，否则与同一edge上的其他封闭合起来会切断转向")
+        if unsafe:
+            log.warning(f"警告: {unsafe} 个事故车辆的封闭与同一edge上的其他封闭合起来会切断转向，事故车辆的停车时长不变，仍保留")
+
+    lane_ids = {incident["lane"] for incident in all_incidents}
+    lane_edges = {lane_id: lane_id.rsplit("_", 1)[0] for lane_id in lane_ids}
+    restore_speeds = {lane_id: float(index.lane_speed[index.lane_lookup[lane_id]])
+                      if index is not None and lane_id in index.lane_lookup else DEFAULT_RESTORE_SPEED
+                      for lane_id in lane_ids}
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<additional>\n")
+        # 每条车道一个VSS（可变速度标志）：事故期间速度降为0（部分封闭时降为限速），结束后恢复
+        # One VSS (Variable Speed Sign) per lane: the speed drops to zero during an accident (to a limit for partial closures) and is restored afterwards
+        speed_steps = merge_speed_steps(all_incidents, restore_speeds)
+        for i, (lane_id, steps) in enumerate(speed_steps.items()):
+            f.write(f"    <variableSpeedSign {_xml_attributes({'id': f'accident_vss_{i}', 'lanes': lane_id})}>\n")
+            for time, speed in steps:
+                f.write(f'        <step time="{time:.2f}" speed="{speed:.2f}" />\n')
+            f.write("    </variableSpeedSign>\n")
+
+        # 每个edge一个路侧设备，在封闭期间关闭车道并重新路由
+        # One roadside device per edge that closes the lanes and reroutes during the closures
+        # 注意这里不能关闭只有一个类型的车道，比如只有一个车道负责左转，那这个车道就不能关闭，因为车辆无法重新规划路由导致报错（见resolve_accident_lanes）
+        # A lane that is the only lane of a movement (e.g. the single left-turn lane) must not be closed, otherwise vehicles cannot reroute (see resolve_accident_lanes)
+        closures = merge_closures(all_incidents, lane_edges)
+        for i, (edge_id, intervals) in enumerate(closures.items()):
+            f.write(f"    <rerouter {_xml_attributes({'id': f'accident_rerouter_{i}', 'edges': edge_id})}>\n")
+            for begin, end, closed_lanes in intervals:
+                f.write(f'        <interval begin="{begin:g}" end="{end:g}">\n')
+                for lane_id in closed_lanes:
+                    f.write(f"            <closingLaneReroute {_xml_attributes({'id': lane_id, 'allow': 'truck'})} />\n")
+                f.write("        </interval>\n")
+            f.write("    </rerouter>\n")
+
+        # 没有事故车辆的事件：阻塞车辆在事故路段停到事件结束，部分封闭因此只阻塞事故路段
+        # Incidents without an accident vehicle: a blocker vehicle stops on the incident segment until the incident ends, so a partial closure only blocks that segment
+        blockers = blocker_vehicles(all_incidents)
+        if blockers:
+            f.write(f"    <vType {_xml_attributes(INCIDENT_BLOCKER_TYPE)} />\n")
+        for vehicle_id, edge_id, lane_index, begin, end, start_pos, end_pos in blockers:
+            attrib = {"id": vehicle_id, "type": INCIDENT_BLOCKER_TYPE["id"], "depart": f"{begin:g}",
+                      "departLane": lane_index, "departPos": f"{start_pos:g}", "departSpeed": "0"}
+            stop = {"lane": f"{edge_id}_{lane_index}", "startPos": f"{start_pos:g}", "endPos": f"{end_pos:g}",
+                    "until": f"{end:g}"}
+            f.write(f"    <vehicle {_xml_attributes(attrib)}>\n")
+            f.write(f"        <route {_xml_attributes({'edges': edge_id})} />\n")
+            f.write(f"        <stop {_xml_attributes(stop)} />\n")
+            f.write("    </vehicle>\n")
+
+        # 进口车道的E1/E2检测器，位置由车道长度得出 E1/E2 detectors on the incoming lanes, positioned from the lane lengths
+        detector_layout = []
+        if detectors is not None:
+            detector_layout, detector_text = scenario_detectors(index, detectors)
+            f.write(detector_text)
+        f.write("</additional>\n")
+    if metrics is not None:
+        metrics.count("incidents", len(all_incidents))
+        metrics.count("variable_speed_signs", len(speed_steps))
+        metrics.count("rerouters", len(closures))
+        metrics.count("rerouter_intervals", sum(len(intervals) for intervals in closures.values()))
+        metrics.count("incident_blockers", len(blockers))
+        metrics.count("detectors", len(detector_layout))
+    log.info(f"已创建事故配置附加文件: {path}")
+    log.info("在运行SUMO时使用: sumo-gui -n your_network.net.xml -r generated_vehicles.rou.xml -a accident_config.add.xml")
+
+
+def write_sumocfg(path, net_file, route_file, additional_file):
+    """生成SUMO配置文件（格式与"v0.1 - 副本.sumocfg"一致），文件路径写为相对于配置文件所在目录的相对路径。additional_file可以是路径列表。"""
+    """Write a SUMO configuration file (in the format of "v0.1 - 副本.sumocfg"); paths are written relative to the directory of the configuration file. additional_file may be a list of paths."""
+    if isinstance(additional_file, str):
+        additional_file = [additional_file]
+    config_dir = os.path.dirname(os.path.abspath(path))
+
+    def relative(file_path):
+        return escape(os.path.relpath(os.path.abspath(file_path), config_dir).replace(os.sep, "/"), _ATTRIBUTE_ENTITIES)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n\n'
+                '<sumoConfiguration xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/sumoConfiguration.xsd">\n\n'
+                '    <input>\n'
+                f'        <net-file value="{relative(net_file)}"/>\n'
+                f'        <route-files value="{relative(route_file)}"/>\n'
+                f'        <additional-files value="{",".join(relative(file_path) for file_path in additional_file)}"/>\n'
+                '    </input>\n\n'
+                '</sumoConfiguration>\n')
 
 
 if __name__ == "__main__":
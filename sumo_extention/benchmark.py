@@ -0,0 +1,838 @@
+"""
+生成器性能基准测试
+Benchmarks for the scenario generator.
+
+用法 Usage:
+    python benchmark.py demand --sizes 10000 100000 1000000
+    python benchmark.py writer --sizes 10000 100000 1000000
+    python benchmark.py batch --scenarios 64 --workers 1 2 4 8
+    python benchmark.py profile --vehicles 100000 500000 1000000
+    python benchmark.py incidents --counts 1000 10000 100000
+    python benchmark.py env --steps 3600 --backend fake --latency 0.00005
+    python benchmark.py routes --vehicles 100000 1000000
+    python benchmark.py vecenv --workers 1 2 4 8 --steps 2000 --episode-steps 500
+    python benchmark.py snapshots --warmup 600 --episodes 20 --backend fake
+    python benchmark.py prefetch --episodes 10 --episode-steps 1000 --depth 2 --workers 1
+    python benchmark.py surrogate --plans 10 100 1000 10000 --vehicles 3000
+    python benchmark.py grid --sizes 2 5 10 20 --steps 600
+    python benchmark.py suite --output bench.json [--baseline baseline.json] [--quick]
+    python benchmark.py compare bench.json baseline.json --tolerance 0.2
+
+suite运行固定的一组用例（生成时间与内存峰值随车辆数/事件数/路线数的变化、XML序列化方式、仿真步速），结果写入JSON；
+指定baseline（或使用compare）时与保存的基线逐项比较，有回退时以非零状态退出。
+suite runs a fixed set of cases (generation time and peak memory against vehicle, incident and route counts, XML
+serialization variants, simulation steps/s) and writes the results as JSON; with a baseline (or through compare) every
+metric is checked against the stored baseline and the exit status is non-zero on regressions.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import itertools
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import autoscript
+import grid_network
+import incidents
+import scenario_batch
+import snapshots
+from metrics import GenerationMetrics
+import prefetch
+import sumo_env
+import sumo_outputs
+import surrogate
+import vector_env
+from net_index import load_network_index
+
+# 基准测试使用的路线和特殊车辆配置，与main()中的默认场景保持同一规模
+# Routes and special vehicles used by the benchmarks, at the same scale as the default scenario in main()
+BENCH_ROUTE_EDGES = {
+    "ntos": "-E3 E1", "ntow": "-E3 E2", "ntoe": "-E3 E0",
+    "ston": "-E1 E3", "stow": "-E1 E2", "stoe": "-E1 E0",
+    "wtoe": "-E2 E0", "wton": "-E2 E3",
+    "etow": "-E0 E2", "eton": "-E0 E3", "etos": "-E0 E1",
+}
+BENCH_SPECIAL_STREAMS = {
+    "emergency": [
+        {"time": 30.0, "route": "ntos", "type": "emergency"},
+        {"time": 60.0, "route": "ston", "type": "emergency"},
+        {"time": 90.0, "route": "wtoe", "type": "emergency"},
+    ],
+    "accident": [
+        {"time": 40.0, "route": "ston", "type": "accident", "accident_start": 45.0, "accident_end": 75.0},
+    ],
+}
+BENCH_ROUTE_IDS = list(BENCH_ROUTE_EDGES)
+BENCH_ROUTE_WEIGHTS = [1.0 / len(BENCH_ROUTE_IDS)] * len(BENCH_ROUTE_IDS)
+
+
+def _vehicles(n, batch=True):
+    """基准场景的车辆事件流（归并后），batch=False时使用逐辆生成的原始循环。"""
+    """The merged vehicle stream of the benchmark scenario; batch=False uses the original per-vehicle loop."""
+    special_times = autoscript.special_departure_times(BENCH_SPECIAL_STREAMS)
+    if batch:
+        table = autoscript.build_vehicle_table(BENCH_ROUTE_IDS, BENCH_ROUTE_WEIGHTS, n, 1.0, 0.25, special_times,
+                                               seed=0)
+        regular_stream = autoscript.iter_table_vehicles(table)
+    else:
+        regular_stream = autoscript.iter_regular_vehicles_loop(BENCH_ROUTE_IDS, BENCH_ROUTE_WEIGHTS, n, 1.0, 0.25,
+                                                               special_times)
+    streams = [regular_stream] + [autoscript.iter_special_vehicles(name, entries, BENCH_ROUTE_EDGES)
+                                  for name, entries in BENCH_SPECIAL_STREAMS.items()]
+    return autoscript.merge_vehicle_streams(streams)
+
+
+def _timed(func, *args, **kwargs):
+    """运行一次func并返回耗时（秒）。"""
+    """Run func once and return the elapsed wall time in seconds."""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _peak_memory(func, *args, **kwargs):
+    """运行一次func并返回tracemalloc记录的峰值内存（MB）。"""
+    """Run func once and return the peak memory traced by tracemalloc, in MB."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_demand(sizes, skip_loop_above=None):
+    """比较逐辆循环与批量向量化模式在不同车辆规模下的生成时间。"""
+    """Compare generation time of the per-vehicle loop and the vectorized batch mode across vehicle counts."""
+    special_times = autoscript.special_departure_times(BENCH_SPECIAL_STREAMS)
+
+    print(f"{'vehicles':>10} {'loop (s)':>10} {'batch (s)':>10} {'sampling (s)':>13} {'speedup':>8}")
+    for n in sizes:
+        batch_time = _timed(autoscript.append_vehicles, ET.Element("routes"), _vehicles(n))
+        sampling_time = _timed(autoscript.build_vehicle_table, BENCH_ROUTE_IDS, BENCH_ROUTE_WEIGHTS, n, 1.0, 0.25,
+                               special_times, seed=0)
+        if skip_loop_above is not None and n > skip_loop_above:
+            print(f"{n:>10} {'-':>10} {batch_time:>10.3f} {sampling_time:>13.4f} {'-':>8}")
+            continue
+        loop_time = _timed(autoscript.append_vehicles, ET.Element("routes"), _vehicles(n, batch=False))
+        print(f"{n:>10} {loop_time:>10.3f} {batch_time:>10.3f} {sampling_time:>13.4f} "
+              f"{loop_time / batch_time:>7.1f}x")
+
+
+def _write_with_elementtree(path, n):
+    """原有输出路径：构建完整ElementTree、indent()后一次性写出。"""
+    """The original output path: build the full ElementTree, indent() it and write it in one go."""
+    root = ET.Element("routes")
+    for type_id in ("car", "emergency", "accident"):
+        autoscript.generate_vehicle_type(root, type_id)
+    for route_id, edges in BENCH_ROUTE_EDGES.items():
+        autoscript.generate_route(root, route_id, edges)
+    autoscript.append_vehicles(root, _vehicles(n))
+    autoscript.indent(root)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def _write_streaming(path, n):
+    """流式输出路径：只保留列式车辆表，增量写出车辆。"""
+    """The streaming output path: keep only the columnar vehicle table and write vehicles incrementally."""
+    autoscript.write_route_file_streaming(
+        path, [{"type_id": type_id} for type_id in ("car", "emergency", "accident")],
+        [{"route_id": route_id, "edges": edges} for route_id, edges in BENCH_ROUTE_EDGES.items()],
+        _vehicles(n))
+
+
+def bench_writer(sizes):
+    """比较ElementTree输出路径与流式写出路径的耗时和峰值内存。"""
+    """Compare wall time and peak memory of the ElementTree output path and the streaming writer."""
+    print(f"{'vehicles':>10} {'tree (s)':>10} {'stream (s)':>11} {'tree (MB)':>10} {'stream (MB)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.rou.xml")
+        for n in sizes:
+            tree_time = _timed(_write_with_elementtree, path, n)
+            stream_time = _timed(_write_streaming, path, n)
+            tree_peak = _peak_memory(_write_with_elementtree, path, n)
+            stream_peak = _peak_memory(_write_streaming, path, n)
+            print(f"{n:>10} {tree_time:>10.3f} {stream_time:>11.3f} {tree_peak:>10.1f} {stream_peak:>12.1f}")
+
+
+def bench_batch(num_scenarios, workers, num_vehicles):
+    """测量并行批量生成在不同进程数下的吞吐量（场景/秒）。"""
+    """Measure the throughput (scenarios/s) of parallel batch generation for different worker counts."""
+    scenarios = [{"num_vehicles": num_vehicles}] * num_scenarios
+    print(f"{'workers':>8} {'time (s)':>10} {'scenarios/s':>12} {'scaling':>8}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_workers in workers:
+            elapsed = _timed(scenario_batch.generate_batch, scenarios, os.path.join(tmp, str(n_workers)), n_workers)
+            throughput = num_scenarios / elapsed
+            baseline = baseline or throughput
+            print(f"{n_workers:>8} {elapsed:>10.2f} {throughput:>12.1f} {throughput / baseline:>7.2f}x")
+
+
+def _day_profile(vehicles_per_day, bin_seconds=900):
+    """全天需求曲线：早晚高峰的双峰流量，总量约为vehicles_per_day，按BENCH_ROUTE_IDS均分。"""
+    """A full-day demand profile: a two-peak (morning and evening) flow totalling about vehicles_per_day, split evenly over BENCH_ROUTE_IDS."""
+    hours = (np.arange(0, 86400, bin_seconds) + bin_seconds / 2) / 3600
+    shape = 0.2 + np.exp(-0.5 * ((hours - 8) / 1.5) ** 2) + np.exp(-0.5 * ((hours - 18) / 1.5) ** 2)
+    total = vehicles_per_day * shape / (shape.sum() * bin_seconds / 3600)  # veh/h
+    return {"bin_seconds": bin_seconds, "total": total.tolist(),
+            "shares": dict(zip(BENCH_ROUTE_IDS, BENCH_ROUTE_WEIGHTS))}
+
+
+def bench_profile(sizes):
+    """测量全天时变需求（15分钟时段）的采样时间和写出整个路线文件的时间。"""
+    """Measure the sampling time of a full-day time-varying demand (15-minute bins) and the time to write the whole route file."""
+    special_times = autoscript.special_departure_times(BENCH_SPECIAL_STREAMS)
+    print(f"{'vehicles/day':>13} {'sampled':>9} {'sampling (s)':>13} {'write (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.rou.xml")
+        for n in sizes:
+            profile = _day_profile(n)
+            start = time.perf_counter()
+            table = autoscript.build_profile_table(profile, special_times=special_times, seed=0)
+            sampling_time = time.perf_counter() - start
+            streams = [autoscript.iter_table_vehicles(table)] + [
+                autoscript.iter_special_vehicles(name, entries, BENCH_ROUTE_EDGES)
+                for name, entries in BENCH_SPECIAL_STREAMS.items()]
+            write_time = _timed(autoscript.write_route_file_streaming, path,
+                                [{"type_id": type_id} for type_id in ("car", "emergency", "accident")],
+                                [{"route_id": route_id, "edges": edges} for route_id, edges in BENCH_ROUTE_EDGES.items()],
+                                autoscript.merge_vehicle_streams(streams))
+            print(f"{n:>13} {len(table['depart']):>9} {sampling_time:>13.3f} {write_time:>10.2f}")
+
+
+def _route_load_time(route_file, net_file):
+    """SUMO加载整个路线文件的时间（--route-steps 0一次读入）；没有安装SUMO时用expat流式解析的时间代替。"""
+    """Time for SUMO to load the whole route file (--route-steps 0 reads it at once); without SUMO the streaming expat parse time stands in."""
+    if shutil.which("sumo"):
+        command = ["sumo", "-n", net_file, "-r", route_file, "--route-steps", "0", "--begin", "0", "--end", "0",
+                   "--no-step-log", "true", "--no-warnings", "true"]
+        return _timed(subprocess.run, command, check=True, stdout=subprocess.DEVNULL), "sumo"
+    start = time.perf_counter()
+    for kind in ("vehicles", "flows"):
+        for _ in sumo_outputs.iter_output_chunks(route_file, kind):
+            pass
+    return time.perf_counter() - start, "parse"
+
+
+def bench_routes(sizes, net_file="net.net.xml"):
+    """比较全天需求的路线文件写法：逐辆<vehicle>（带/不带颜色）、<flow>以及列式.npz车辆表的文件大小和加载时间。"""
+    """Compare the route file formats of a full-day demand: per-vehicle <vehicle> (with and without colors), <flow>s and the columnar .npz vehicle table, by file size and load time."""
+    formats = [("vehicles+color", {"route_format": "vehicles", "vehicle_colors": True}),
+               ("vehicles", {"route_format": "vehicles", "vehicle_colors": False}),
+               ("flows", {"route_format": "flows"})]
+    print(f"{'vehicles/day':>13} {'format':>15} {'size (MB)':>10} {'generate (s)':>13} {'load (s)':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            scenario = autoscript.default_scenario(seed=0)
+            scenario.update({"net_file": os.path.abspath(net_file), "demand_profile": _day_profile(n),
+                             "table_file": "vehicles.npz"})
+            for name, options in formats:
+                output_dir = os.path.join(tmp, name)
+                os.makedirs(output_dir, exist_ok=True)
+                start = time.perf_counter()
+                paths = autoscript.generate_scenario(dict(scenario, **options), output_dir)
+                generate_time = time.perf_counter() - start
+                load_time, how = _route_load_time(paths["route_file"], net_file)
+                print(f"{n:>13} {name:>15} {os.path.getsize(paths['route_file']) / 2 ** 20:>10.2f} "
+                      f"{generate_time:>13.2f} {load_time:>9.2f} ({how})")
+                if name == "vehicles":
+                    load_time = _timed(autoscript.load_vehicle_table, paths["table_file"])
+                    print(f"{n:>13} {'npz table':>15} {os.path.getsize(paths['table_file']) / 2 ** 20:>10.2f} "
+                          f"{'':>13} {load_time:>9.2f} (numpy)")
+
+
+def bench_incidents(counts, net_file="net.net.xml"):
+    """测量批量随机事件的采样与合并写出时间，以及合并后rerouter interval的数量。"""
+    """Measure sampling and merged writing time of bulk random incidents, and the number of rerouter intervals after merging."""
+    index = load_network_index(net_file)
+    print(f"{'incidents':>10} {'sampling (s)':>13} {'write (s)':>10} {'intervals':>10} {'file (KB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.add.xml")
+        for n in counts:
+            start = time.perf_counter()
+            sampled = incidents.sample_incidents(index, n, 86400, partial_share=0.3, seed=0)
+            sampling_time = time.perf_counter() - start
+            write_time = _timed(autoscript.create_additional_file, [], {}, path, index=index, incidents=sampled)
+            lane_edges = {incident["lane"]: incident["lane"].rsplit("_", 1)[0] for incident in sampled}
+            intervals = sum(len(windows) for windows in incidents.merge_closures(sampled, lane_edges).values())
+            print(f"{n:>10} {sampling_time:>13.3f} {write_time:>10.3f} {intervals:>10} "
+                  f"{os.path.getsize(path) / 1024:>10.1f}")
+
+
+def bench_env(steps, backend="fake", latency=5e-5, net_file="net.net.xml"):
+    """比较订阅方式与逐项轮询的环境步速（steps/s）。fake后端用latency模拟每次TraCI调用的往返延迟。"""
+    """Compare environment steps/s of subscriptions and per-variable polling. The fake backend simulates the round trip of every TraCI call with latency."""
+    print(f"{'mode':>13} {'steps/s':>10} {'calls/step':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        scenario = autoscript.default_scenario(seed=0)
+        scenario["net_file"] = os.path.abspath(net_file)
+        config_file = None
+        if backend != "fake":
+            config_file = autoscript.generate_scenario(scenario, tmp, config_name="scenario.sumocfg")["config_file"]
+        rates = {}
+        for mode in ("subscription", "polling"):
+            env = sumo_env.SumoEnv(config_file, net_file=net_file, max_steps=steps, mode=mode, backend=backend,
+                                   fake_options={"latency": latency} if backend == "fake" else None)
+            env.reset(seed=0)
+            calls = getattr(env.connection, "calls", 0)
+            start = time.perf_counter()
+            done = False
+            while not done:
+                done = env.step()[2]
+            rates[mode] = env.steps / (time.perf_counter() - start)
+            calls_per_step = (getattr(env.connection, "calls", 0) - calls) / env.steps
+            env.close()
+            print(f"{mode:>13} {rates[mode]:>10.0f} {calls_per_step if backend == 'fake' else float('nan'):>11.1f}")
+        print(f"subscription speedup: {rates['subscription'] / rates['polling']:.1f}x")
+
+
+def bench_vector_env(workers, steps, episode_steps, backend="fake", latency=5e-5, net_file="net.net.xml"):
+    """比较不同工作进程数下同步和异步步进的总环境步速（env-steps/s），包含回合结束时生成新场景的开销。"""
+    """Compare the aggregate env-steps/s of lockstep and async stepping across worker counts, including the scenario generation on every auto-reset."""
+    fake_options = {"latency": latency} if backend == "fake" else None
+    print(f"{'workers':>8} {'lockstep/s':>11} {'async/s':>10} {'episodes':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in workers:
+            rates = {}
+            with vector_env.VectorEnv(n, base_seed=0, output_root=tmp, net_file=net_file, backend=backend,
+                                      max_steps=episode_steps, fake_options=fake_options) as env:
+                env.reset()
+                start = time.perf_counter()
+                for _ in range(steps):
+                    env.step()
+                rates["lockstep"] = n * steps / (time.perf_counter() - start)
+
+                # 异步：每个环境完成后立即开始下一步 Async: every environment starts its next step as soon as it finishes
+                start = time.perf_counter()
+                env.send()
+                done = 0
+                while done < n * steps:
+                    ready = env.recv()
+                    done += len(ready)
+                    env.send(env_ids=ready)
+                env.recv_all()
+                rates["async"] = done / (time.perf_counter() - start)
+                episodes = int(env.episodes.sum())
+            print(f"{n:>8} {rates['lockstep']:>11.0f} {rates['async']:>10.0f} {episodes:>9}")
+
+
+def bench_snapshots(warmup, episodes, count=snapshots.DEFAULT_COUNT, interval=snapshots.DEFAULT_INTERVAL,
+                    backend="fake", latency=5e-5, net_file="net.net.xml"):
+    """比较每个回合重新仿真预热（reset后逐步推进warmup步）与从快照reset的延迟，以及创建快照的一次性开销。"""
+    """Compare the per-episode latency of re-simulating the warm-up (reset, then warmup steps) with a reset from a snapshot, plus the one-off cost of creating the snapshots."""
+    with tempfile.TemporaryDirectory() as tmp:
+        scenario = autoscript.default_scenario(seed=0)
+        scenario["net_file"] = os.path.abspath(net_file)
+        config_file = autoscript.generate_scenario(scenario, tmp, config_name="scenario.sumocfg")["config_file"]
+        env = sumo_env.SumoEnv(config_file, net_file=net_file, max_steps=int(warmup) + 1, backend=backend,
+                               fake_options={"latency": latency} if backend == "fake" else None)
+        cold = []
+        for episode in range(episodes):
+            start = time.perf_counter()
+            env.reset(seed=episode)
+            for _ in range(int(warmup)):
+                env.step()
+            cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        paths = snapshots.create_snapshots(env, config_file, warmup, count, interval, seed=0)
+        create_seconds = time.perf_counter() - start
+        rng = np.random.default_rng(0)
+        warm = []
+        for episode in range(episodes):
+            start = time.perf_counter()
+            env.reset(seed=episode, snapshot=snapshots.choose_snapshot(paths, rng))
+            warm.append(time.perf_counter() - start)
+        env.close()
+    cold_ms, warm_ms = 1000 * float(np.median(cold)), 1000 * float(np.median(warm))
+    print(f"warm-up {warmup:g} s, {count} snapshots, {backend} backend, median of {episodes} episodes")
+    print(f"{'reset + warm-up steps':>24} {cold_ms:>10.2f} ms")
+    print(f"{'reset from snapshot':>24} {warm_ms:>10.2f} ms")
+    print(f"{'saved per episode':>24} {cold_ms - warm_ms:>10.2f} ms ({cold_ms / warm_ms:.0f}x)")
+    print(f"{'creating snapshots':>24} {1000 * create_seconds:>10.2f} ms "
+          f"(pays off after {create_seconds / max((cold_ms - warm_ms) / 1000, 1e-9):.1f} episodes)")
+
+
+def _run_episode(config_file, seed, episode_steps, backend, latency, net_file):
+    env = sumo_env.SumoEnv(config_file, net_file=net_file, max_steps=episode_steps, backend=backend,
+                           fake_options={"latency": latency} if backend == "fake" else None)
+    env.reset(seed=seed)
+    done = False
+    while not done:
+        done = env.step()[2]
+    env.close()
+
+
+def bench_prefetch(episodes, episode_steps, depth=2, workers=1, num_vehicles=1000, backend="fake", latency=5e-5,
+                   net_file="net.net.xml"):
+    """比较先生成再仿真（串行）与后台预取场景时的回合吞吐量，以及仿真器等待场景的时间。"""
+    """Compare episode throughput of generating then simulating (in sequence) with background prefetching, plus the time the simulator waits for scenarios."""
+    net_file = os.path.abspath(net_file)
+    base = {"net_file": net_file, "num_vehicles": num_vehicles}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        generation = 0.0
+        for scenario in itertools.islice(prefetch.seeded_scenarios(base), episodes):
+            generated = time.perf_counter()
+            paths = prefetch._generate(scenario, os.path.join(tmp, "sequential"), None)
+            generation += time.perf_counter() - generated
+            _run_episode(paths["config_file"], scenario["seed"], episode_steps, backend, latency, net_file)
+        results["sequential"] = (time.perf_counter() - start, generation)
+
+        start = time.perf_counter()
+        with prefetch.ScenarioPrefetcher(itertools.islice(prefetch.seeded_scenarios(base), episodes),
+                                         os.path.join(tmp, "prefetch"), depth=depth, workers=workers) as scenarios:
+            for scenario, paths in scenarios:
+                _run_episode(paths["config_file"], scenario["seed"], episode_steps, backend, latency, net_file)
+        results["prefetch"] = (time.perf_counter() - start, scenarios.wait_seconds)
+    print(f"{episodes} episodes of {episode_steps} steps, {num_vehicles} vehicles, depth {depth}, {workers} worker(s)")
+    print(f"{'pipeline':>10} {'seconds':>9} {'episodes/s':>11} {'waiting s':>10}")
+    for name, (seconds, waiting) in results.items():
+        print(f"{name:>10} {seconds:>9.2f} {episodes / seconds:>11.2f} {waiting:>10.2f}")
+    print(f"speedup: {results['sequential'][0] / results['prefetch'][0]:.2f}x")
+
+
+def bench_surrogate(plan_counts, num_vehicles=3000, net_file="net.net.xml"):
+    """点排队替代模型一次评估不同数量配时方案的时间，以及每个方案的平均耗时。"""
+    """Time for the point-queue surrogate to evaluate different numbers of timing plans in one batch, and the mean time per plan."""
+    model = surrogate.QueueSurrogate(net_file)
+    scenario = autoscript.default_scenario(seed=0)
+    scenario["net_file"] = os.path.abspath(net_file)
+    scenario["num_vehicles"] = num_vehicles
+    arrivals, headway = model.scenario_arrivals(scenario)
+    rng = np.random.default_rng(0)
+    print(f"{arrivals.shape[0]} steps, {num_vehicles} vehicles")
+    print(f"{'plans':>7} {'seconds':>9} {'ms/plan':>9}")
+    for n in plan_counts:
+        green = rng.uniform(0.5, 3.0, (n, model.template.num_stages))
+        cycle = rng.uniform(60.0, 150.0, n)
+        plans = {"cycle": cycle, "offset": np.zeros(n), "green": model.template.green_times(cycle, green)}
+        seconds = _timed(model.evaluate, arrivals, headway, plans)
+        print(f"{n:>7} {seconds:>9.3f} {1000 * seconds / n:>9.3f}")
+
+
+def _sumo_step_rate(config_file, steps):
+    """用sumo命令行运行steps个仿真步，返回steps/s（含加载路网的时间）。"""
+    """Run steps simulation steps with the sumo command line and return steps/s (network loading included)."""
+    command = ["sumo", "-c", config_file, "--end", str(steps), "--no-step-log", "true", "--no-warnings", "true"]
+    return steps / _timed(subprocess.run, command, check=True, stdout=subprocess.DEVNULL)
+
+
+def bench_grid(sizes, steps, vehicles_per_junction=200, net_file="net.net.xml"):
+    """测量N×N网格的合成时间（纯文本路网、路线、场景），安装了netconvert和sumo时再测量建网时间和仿真步速。"""
+    """Measure the synthesis time of N×N grids (plain network, routes, scenario) and, with netconvert and sumo installed, the network build time and the simulation step rate."""
+    template = grid_network.JunctionTemplate(net_file)
+    has_sumo = shutil.which("netconvert") is not None and shutil.which("sumo") is not None
+    print(f"{'grid':>8} {'junctions':>10} {'routes':>8} {'network (s)':>12} {'routes (s)':>11} {'scenario (s)':>13} "
+          f"{'netconvert (s)':>15} {'steps/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            prefix = os.path.join(tmp, f"grid{n}")
+            start = time.perf_counter()
+            network = grid_network.GridNetwork(n, n, template)
+            paths = network.write_plain(prefix)
+            network_time = time.perf_counter() - start
+            start = time.perf_counter()
+            routes = network.route_definitions()
+            route_time = time.perf_counter() - start
+            convert_time = rate = float("nan")
+            if has_sumo:
+                convert_time = _timed(grid_network.run_netconvert, paths["netccfg"])
+            scenario = network.scenario(paths["net"], vehicles_per_junction * network.num_junctions, seed=0)
+            scenario_time = _timed(autoscript.generate_scenario, scenario, tmp, config_name=f"grid{n}.sumocfg")
+            if has_sumo:
+                rate = _sumo_step_rate(os.path.join(tmp, f"grid{n}.sumocfg"), steps)
+            print(f"{n:>4}x{n:<3} {network.num_junctions:>10} {len(routes):>8} {network_time:>12.3f} {route_time:>11.3f} "
+                  f"{scenario_time:>13.2f} {convert_time:>15.2f} {rate:>8.0f}")
+    if not has_sumo:
+        print("netconvert/sumo not found: network build time and step rate skipped")
+
+
+# 基准套件的默认规模 Default sizes of the benchmark suite
+SUITE_SIZES = {
+    "vehicles": [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6],
+    "incidents": [10, 10 ** 3, 10 ** 4],
+    "routes": [11, 110, 1100],
+    "serialization": [10 ** 4, 10 ** 5],
+    "grids": [2, 10, 50],
+    "steps": 3600,
+}
+QUICK_SIZES = {
+    "vehicles": [10 ** 3, 10 ** 4],
+    "incidents": [10, 10 ** 3],
+    "routes": [11, 110],
+    "serialization": [10 ** 4],
+    "grids": [2, 10],
+    "steps": 600,
+}
+MINIDOM_MAX_VEHICLES = 10 ** 5  # minidom需要整棵DOM，超过此规模跳过 minidom needs the whole DOM and is skipped above this size
+
+# 指标的方向：True表示越大越好 Direction of the metrics: True means higher is better
+SUITE_METRICS = {"seconds": False, "peak_mb": False, "steps_per_second": True}
+
+
+def _best_of(repeat, func, *args, **kwargs):
+    """运行func repeat次，返回最短耗时（秒）。"""
+    """Run func repeat times and return the shortest wall time in seconds."""
+    return min(_timed(func, *args, **kwargs) for _ in range(repeat))
+
+
+def _suite_generation(scenario, tmp, repeat):
+    """完整生成一个场景：最短耗时和各阶段耗时来自不带tracemalloc的运行，内存峰值来自单独一次运行。"""
+    """Generate one full scenario: the best time and the stage times come from runs without tracemalloc, the peak memory from one extra run."""
+    os.makedirs(tmp, exist_ok=True)
+    best = None
+    for _ in range(repeat):
+        metrics = GenerationMetrics()
+        autoscript.generate_scenario(scenario, tmp, metrics=metrics)
+        if best is None or metrics.stages["total"]["seconds"] < best.stages["total"]["seconds"]:
+            best = metrics
+    memory = GenerationMetrics(memory=True)
+    try:
+        autoscript.generate_scenario(scenario, tmp, metrics=memory)
+    finally:
+        memory.close()
+    return {"seconds": best.stages["total"]["seconds"], "peak_mb": memory.stages["total"]["peak_bytes"] / 2 ** 20,
+            "stages": {name: stage["seconds"] for name, stage in best.stages.items() if name != "total"},
+            "counters": best.counters}
+
+
+def _bench_tree(n):
+    """构建基准场景的完整ElementTree（未缩进）。"""
+    """Build the full ElementTree of the benchmark scenario (not indented)."""
+    root = ET.Element("routes")
+    for type_id in ("car", "emergency", "accident"):
+        autoscript.generate_vehicle_type(root, type_id)
+    for route_id, edges in BENCH_ROUTE_EDGES.items():
+        autoscript.generate_route(root, route_id, edges)
+    autoscript.append_vehicles(root, _vehicles(n))
+    return root
+
+
+def _serialize_indent(root, path):
+    autoscript.indent(root)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def _serialize_et_indent(root, path):
+    ET.indent(root, space="    ")
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def _serialize_flat(root, path):
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def _serialize_minidom(root, path):
+    from xml.dom import minidom
+    with open(path, "wb") as f:
+        f.write(minidom.parseString(ET.tostring(root)).toprettyxml(indent="    ", encoding="utf-8"))
+
+
+SERIALIZERS = {
+    "indent": _serialize_indent,          # autoscript.indent()（原有写法 the original path）
+    "et_indent": _serialize_et_indent,    # xml.etree.ElementTree.indent()
+    "no_indent": _serialize_flat,         # 不缩进 no pretty-printing
+    "minidom": _serialize_minidom,        # xml.dom.minidom.toprettyxml()
+}
+
+
+def _suite_serialization(n, path, repeat):
+    """在同一棵树上比较各种XML序列化方式（不计建树时间），以及不建树的流式写出。"""
+    """Compare the XML serializers on the same tree (tree construction not timed) and the streaming writer that builds no tree."""
+    cases = {}
+    for name, serialize in SERIALIZERS.items():
+        if name == "minidom" and n > MINIDOM_MAX_VEHICLES:
+            continue
+        times = []
+        for _ in range(repeat):
+            root = _bench_tree(n)
+            times.append(_timed(serialize, root, path))
+        root = _bench_tree(n)
+        cases[name] = {"seconds": min(times), "peak_mb": _peak_memory(serialize, root, path),
+                       "file_mb": os.path.getsize(path) / 2 ** 20}
+    cases["streaming"] = {"seconds": _best_of(repeat, _write_streaming, path, n),
+                          "peak_mb": _peak_memory(_write_streaming, path, n),
+                          "file_mb": os.path.getsize(path) / 2 ** 20}
+    return cases
+
+
+def _simulation_backends():
+    """可用的仿真后端：fake总是可用（衡量环境本身的开销），libsumo/traci在安装了SUMO时加入。"""
+    """Available simulation backends: fake always (it measures the environment overhead itself), libsumo/traci when SUMO is installed."""
+    backends = ["fake"]
+    if sumo_env.libsumo is not None:
+        backends.append("libsumo")
+    if sumo_env.traci is not None and shutil.which("sumo"):
+        backends.append("traci")
+    return backends
+
+
+def _suite_simulation(backend, steps, net_file, tmp):
+    """生成的默认场景在给定后端上的步速（steps/s）。"""
+    """Steps/s of the generated default scenario on the given backend."""
+    scenario = autoscript.default_scenario(seed=0)
+    scenario["net_file"] = net_file
+    os.makedirs(tmp, exist_ok=True)
+    config_file = autoscript.generate_scenario(scenario, tmp, config_name="scenario.sumocfg")["config_file"]
+    env = sumo_env.SumoEnv(config_file, net_file=net_file, max_steps=steps, backend=backend)
+    try:
+        env.reset(seed=0)
+        start = time.perf_counter()
+        done = False
+        while not done:
+            done = env.step()[2]
+        elapsed = time.perf_counter() - start
+        return {"steps": env.steps, "seconds": elapsed, "steps_per_second": env.steps / elapsed}
+    finally:
+        env.close()
+
+
+def _git_revision():
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    return None
+
+
+def run_suite(sizes=None, net_file="net.net.xml", repeat=3, log=print):
+    """运行整个基准套件，返回{"meta": 环境信息, "cases": {用例名: 指标}}。"""
+    """Run the whole benchmark suite and return {"meta": environment info, "cases": {case name: metrics}}."""
+    sizes = dict(SUITE_SIZES, **(sizes or {}))
+    net_file = os.path.abspath(net_file)
+    cases = {}
+
+    def record(name, result):
+        cases[name] = result
+        log(f"{name:<40} " + " ".join(f"{metric}={result[metric]:.4g}" for metric in SUITE_METRICS
+                                        if metric in result))
+
+    base = autoscript.default_scenario(seed=0)
+    base["net_file"] = net_file
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. 生成时间与内存峰值随车辆数的变化 Generation time and peak memory against the vehicle count
+        for n in sizes["vehicles"]:
+            record(f"generation/vehicles={n}",
+                   _suite_generation(dict(base, num_vehicles=n), os.path.join(tmp, "gen"), repeat if n < 10 ** 6 else 1))
+
+        # 2. 随事件数的变化（批量采样的车道封闭） Against the incident count (bulk sampled lane closures)
+        for n in sizes["incidents"]:
+            scenario = dict(base, incidents={"count": n, "horizon": 86400, "partial_share": 0.3})
+            record(f"generation/incidents={n}", _suite_generation(scenario, os.path.join(tmp, "gen"), repeat))
+
+        # 3. 随路线数的变化：默认路线之外重复使用J0的路线边序列，路线ID各不相同
+        # 3. Against the route count: beyond the default routes the J0 edge lists are reused under distinct route IDs
+        for n in sizes["routes"]:
+            defaults = base["route_definitions"]
+            definitions = defaults + [{"route_id": f"r{i}", "edges": defaults[i % len(defaults)]["edges"]}
+                                      for i in range(n - len(defaults))]
+            scenario = dict(base, route_definitions=definitions, route_probabilities="uniform", num_vehicles=10 ** 4)
+            record(f"generation/routes={n}", _suite_generation(scenario, os.path.join(tmp, "gen"), repeat))
+
+        # 4. XML序列化方式 XML serialization variants
+        path = os.path.join(tmp, "serialize.rou.xml")
+        for n in sizes["serialization"]:
+            for name, result in _suite_serialization(n, path, repeat).items():
+                record(f"serialization/{name}/vehicles={n}", result)
+
+        # 5. 多交叉口路网合成（纯文本路网与路线） Multi-intersection network synthesis (plain network and routes)
+        template = grid_network.JunctionTemplate(net_file)
+        for n in sizes["grids"]:
+            def synthesize():
+                network = grid_network.GridNetwork(n, n, template)
+                network.write_plain(os.path.join(tmp, "grid"))
+                network.route_definitions()
+            record(f"network/grid={n}x{n}", {"seconds": _best_of(repeat, synthesize),
+                                             "peak_mb": _peak_memory(synthesize)})
+
+        # 6. 仿真步速 Simulation steps/s
+        for backend in _simulation_backends():
+            record(f"simulation/{backend}",
+                   _suite_simulation(backend, sizes["steps"], net_file, os.path.join(tmp, "sim")))
+
+    meta = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "revision": _git_revision(),
+            "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "repeat": repeat, "sizes": sizes}
+    return {"meta": meta, "cases": cases}
+
+
+def compare_results(current, baseline, tolerance=0.2, min_seconds=0.005):
+    """逐项比较两次套件结果，返回[(用例名, 指标, 基线值, 当前值, 比值, 是否回退)]。
+    变差超过tolerance（相对值）即为回退；耗时差小于min_seconds时视为噪声不计。只比较两边都有的用例。"""
+    """Compare two suite results metric by metric and return [(case name, metric, baseline, current, ratio, regressed)].
+    A change for the worse beyond tolerance (relative) is a regression; time differences below min_seconds count as noise. Only cases present on both sides are compared."""
+    rows = []
+    for name, result in current["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+        for metric, higher_is_better in SUITE_METRICS.items():
+            if metric not in result or metric not in reference or not reference[metric]:
+                continue
+            ratio = result[metric] / reference[metric]
+            worse = ratio < 1 / (1 + tolerance) if higher_is_better else ratio > 1 + tolerance
+            if metric == "seconds" and abs(result[metric] - reference[metric]) < min_seconds:
+                worse = False
+            rows.append((name, metric, reference[metric], result[metric], ratio, worse))
+    return rows
+
+
+def print_comparison(rows):
+    """打印比较结果并返回回退的数量。"""
+    """Print the comparison and return the number of regressions."""
+    print(f"{'case':<40} {'metric':>16} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, metric, reference, value, ratio, worse in rows:
+        print(f"{name:<40} {metric:>16} {reference:>10.4g} {value:>10.4g} {ratio:>6.2f}x{'  REGRESSION' if worse else ''}")
+    regressions = sum(worse for *_, worse in rows)
+    print(f"{len(rows)} metrics compared, {regressions} regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scenario generator benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    demand = subparsers.add_parser("demand", help="per-vehicle loop vs. vectorized batch demand engine")
+    demand.add_argument("--sizes", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6])
+    demand.add_argument("--skip-loop-above", type=int, default=None,
+                        help="only time the batch engine above this vehicle count")
+
+    writer = subparsers.add_parser("writer", help="ElementTree route file output vs. streaming writer")
+    writer.add_argument("--sizes", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6])
+
+    batch = subparsers.add_parser("batch", help="parallel multi-scenario generation throughput")
+    batch.add_argument("--scenarios", type=int, default=64)
+    batch.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    batch.add_argument("--vehicles", type=int, default=10000, help="vehicles per scenario")
+
+    profile = subparsers.add_parser("profile", help="full-day time-varying demand sampling and writing")
+    profile.add_argument("--vehicles", type=int, nargs="+", default=[10 ** 5, 5 * 10 ** 5, 10 ** 6],
+                         help="expected vehicles per day")
+
+    incident = subparsers.add_parser("incidents", help="bulk random incidents with merged closures")
+    incident.add_argument("--counts", type=int, nargs="+", default=[10 ** 3, 10 ** 4, 10 ** 5])
+    incident.add_argument("--net", default="net.net.xml")
+
+    env = subparsers.add_parser("env", help="subscription-based vs. polling observation reads")
+    env.add_argument("--steps", type=int, default=3600)
+    env.add_argument("--backend", default="fake", choices=["fake", "libsumo", "traci", "auto"])
+    env.add_argument("--latency", type=float, default=5e-5, help="simulated round trip per TraCI call (fake backend)")
+    env.add_argument("--net", default="net.net.xml")
+
+    routes = subparsers.add_parser("routes", help="route file size and load time: per-vehicle XML, <flow>s and .npz")
+    routes.add_argument("--vehicles", type=int, nargs="+", default=[10 ** 5, 10 ** 6], help="expected vehicles per day")
+    routes.add_argument("--net", default="net.net.xml")
+
+    grid = subparsers.add_parser("grid", help="multi-intersection grid synthesis, netconvert time and SUMO step rate")
+    grid.add_argument("--sizes", type=int, nargs="+", default=[2, 5, 10, 20], help="grid side length N (N×N junctions)")
+    grid.add_argument("--steps", type=int, default=600)
+    grid.add_argument("--vehicles-per-junction", type=int, default=200)
+    grid.add_argument("--net", default="net.net.xml", help="template network with J0")
+
+    vecenv = subparsers.add_parser("vecenv", help="aggregate env-steps/s of the parallel vector environment")
+    vecenv.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    vecenv.add_argument("--steps", type=int, default=2000, help="steps per environment")
+    vecenv.add_argument("--episode-steps", type=int, default=500, help="steps per episode before the auto-reset")
+    vecenv.add_argument("--backend", default="fake", choices=["fake", "libsumo", "traci", "auto"])
+    vecenv.add_argument("--latency", type=float, default=5e-5, help="simulated round trip per TraCI call (fake backend)")
+    vecenv.add_argument("--net", default="net.net.xml")
+
+    snapshot = subparsers.add_parser("snapshots", help="episode reset latency with and without warm-up snapshots")
+    snapshot.add_argument("--warmup", type=float, default=snapshots.DEFAULT_WARMUP, help="warm-up time in seconds")
+    snapshot.add_argument("--episodes", type=int, default=20)
+    snapshot.add_argument("--count", type=int, default=snapshots.DEFAULT_COUNT, help="snapshots per scenario")
+    snapshot.add_argument("--interval", type=float, default=snapshots.DEFAULT_INTERVAL,
+                          help="seconds between snapshots")
+    snapshot.add_argument("--backend", default="fake", choices=["fake", "libsumo", "traci", "auto"])
+    snapshot.add_argument("--latency", type=float, default=5e-5, help="simulated round trip per TraCI call (fake backend)")
+    snapshot.add_argument("--net", default="net.net.xml")
+
+    prefetcher = subparsers.add_parser("prefetch", help="episode throughput with and without background scenario prefetch")
+    prefetcher.add_argument("--episodes", type=int, default=10)
+    prefetcher.add_argument("--episode-steps", type=int, default=1000)
+    prefetcher.add_argument("--depth", type=int, default=2, help="maximum number of scenarios generated ahead")
+    prefetcher.add_argument("--workers", type=int, default=1, help="background generation processes")
+    prefetcher.add_argument("--vehicles", type=int, default=1000, help="vehicles per scenario")
+    prefetcher.add_argument("--backend", default="fake", choices=["fake", "libsumo", "traci", "auto"])
+    prefetcher.add_argument("--latency", type=float, default=5e-5, help="simulated round trip per TraCI call (fake backend)")
+    prefetcher.add_argument("--net", default="net.net.xml")
+
+    surrogates = subparsers.add_parser("surrogate", help="batched timing plan evaluation with the point-queue surrogate")
+    surrogates.add_argument("--plans", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    surrogates.add_argument("--vehicles", type=int, default=3000)
+    surrogates.add_argument("--net", default="net.net.xml")
+
+    suite = subparsers.add_parser("suite", help="the full benchmark suite, written as JSON")
+    suite.add_argument("--output", default="bench.json")
+    suite.add_argument("--baseline", default=None, help="compare against this stored result and fail on regressions")
+    suite.add_argument("--tolerance", type=float, default=0.2, help="relative change that counts as a regression")
+    suite.add_argument("--repeat", type=int, default=3, help="timing runs per case (the best one counts)")
+    suite.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    suite.add_argument("--net", default="net.net.xml")
+
+    compare = subparsers.add_parser("compare", help="compare two suite results and fail on regressions")
+    compare.add_argument("current")
+    compare.add_argument("baseline")
+    compare.add_argument("--tolerance", type=float, default=0.2, help="relative change that counts as a regression")
+
+    args = parser.parse_args()
+    # 基准运行期间只显示生成过程的错误，日志不混入结果表 Only generation errors are shown while benchmarking, so log records stay out of the result tables
+    logging.getLogger("autoscript").setLevel(logging.ERROR)
+    if args.benchmark == "demand":
+        bench_demand(args.sizes, args.skip_loop_above)
+    elif args.benchmark == "writer":
+        bench_writer(args.sizes)
+    elif args.benchmark == "batch":
+        bench_batch(args.scenarios, args.workers, args.vehicles)
+    elif args.benchmark == "profile":
+        bench_profile(args.vehicles)
+    elif args.benchmark == "incidents":
+        bench_incidents(args.counts, args.net)
+    elif args.benchmark == "env":
+        bench_env(args.steps, args.backend, args.latency, args.net)
+    elif args.benchmark == "routes":
+        bench_routes(args.vehicles, args.net)
+    elif args.benchmark == "vecenv":
+        bench_vector_env(args.workers, args.steps, args.episode_steps, args.backend, args.latency, args.net)
+    elif args.benchmark == "grid":
+        bench_grid(args.sizes, args.steps, args.vehicles_per_junction, args.net)
+    elif args.benchmark == "snapshots":
+        bench_snapshots(args.warmup, args.episodes, args.count, args.interval, args.backend, args.latency, args.net)
+    elif args.benchmark == "prefetch":
+        bench_prefetch(args.episodes, args.episode_steps, args.depth, args.workers, args.vehicles, args.backend,
+                       args.latency, args.net)
+    elif args.benchmark == "surrogate":
+        bench_surrogate(args.plans, args.vehicles, args.net)
+    elif args.benchmark == "suite":
+        results = run_suite(QUICK_SIZES if args.quick else None, args.net, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+        if args.baseline is not None:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            if print_comparison(compare_results(results, baseline, args.tolerance)):
+                sys.exit(1)
+    elif args.benchmark == "compare":
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if print_comparison(compare_results(current, baseline, args.tolerance)):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
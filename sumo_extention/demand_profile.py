@@ -0,0 +1,187 @@
+"""
+时变需求曲线
+Time-varying demand profiles.
+
+需求曲线把仿真时间划分为若干时段（例如24小时内每15分钟一个时段），为每条路线（OD对）给出各时段的流量（veh/h）。
+每条路线的到达过程是分段常数强度的非齐次泊松过程：先对所有(路线, 时段)一次性采样泊松分布的车辆数，
+再在各自时段内均匀采样出发时间，最后整体排序。整个过程是向量化的，全天数十万辆车的采样只需零点几秒。
+
+A demand profile splits simulation time into bins (for example 15-minute bins over a 24 h day) and gives the flow of
+every route (OD pair) in every bin, in veh/h. Arrivals on each route follow a non-homogeneous Poisson process with a
+piecewise-constant rate: the vehicle count of every (route, bin) cell is drawn from a Poisson distribution in one call,
+departure times are drawn uniformly within their bins and everything is sorted once. The whole process is vectorized,
+so a full day with hundreds of thousands of vehicles is sampled in a fraction of a second.
+
+格式 Format (JSON, 或Python字典 or a Python dict):
+    {"bin_seconds": 900, "begin": 0, "flows": {"ntos": [120, 180, ...], "ston": [90, 150, ...]}}
+    {"bin_seconds": 900, "total": [800, 1200, ...], "shares": {"ntos": 0.2, "ston": 0.8}}
+    可用"bin_edges": [0, 900, 1800, ...]代替bin_seconds/begin以使用不等长时段；省略shares时使用场景的route_probabilities。
+    "bin_edges": [0, 900, 1800, ...] may replace bin_seconds/begin for bins of unequal length; without shares the
+    scenario's route_probabilities are used.
+
+CSV格式 CSV format (每行一个时段 one row per bin):
+    begin,end,ntos,ston,...
+    0,900,120,90,...
+
+按车道的需求（车道需求）给出每条进口车道在各时段内的精确车辆数，用于复现检测器计数。每辆车带有departLane，
+路线从该车道允许的转向（路网中的connection）对应的路线中按route_probabilities选择：
+Per-lane demand gives the exact number of vehicles entering on every approach lane in every bin, for replaying
+detector counts. Every vehicle gets a departLane and a route chosen (by route_probabilities) among the routes the
+lane's allowed movements (its connections in the network) can serve:
+    {"bin_seconds": 900, "counts": {"-E3_0": [40, 55, ...], "-E3_1": [60, 80, ...]}}
+    CSV格式同上，列名为车道ID The CSV format is the same with lane IDs as columns
+"""
+import csv
+import json
+
+import numpy as np
+
+
+def load_demand_profile(path, key="flows"):
+    """读取JSON或CSV格式的需求曲线文件，返回需求曲线字典。CSV的各列存入profile[key]（车道需求为"counts"）。"""
+    """Read a demand profile from a JSON or CSV file and return the profile dict. The CSV columns go to profile[key] ("counts" for per-lane demand)."""
+    if not path.lower().endswith(".csv"):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        if header[:2] != ["begin", "end"]:
+            raise ValueError(f"{path}: the first two CSV columns must be 'begin' and 'end'")
+        rows = [[float(value) for value in row] for row in reader if row]
+    bin_edges = [row[0] for row in rows] + [rows[-1][1]] if rows else []
+    for previous, row in zip(rows, rows[1:]):
+        if row[0] != previous[1]:
+            raise ValueError(f"{path}: bins must be contiguous, got end {previous[1]} followed by begin {row[0]}")
+    return {"bin_edges": bin_edges,
+            key: {route_id: [row[i] for row in rows] for i, route_id in enumerate(header[2:], start=2)}}
+
+
+def profile_rates(profile, route_probabilities=None):
+    """将需求曲线展开为(路线ID列表, 时段边界数组, 流量矩阵[路线, 时段]（veh/h）)。"""
+    """Expand a demand profile into (route ID list, bin edge array, flow matrix [route, bin] in veh/h)."""
+    if "flows" in profile:
+        route_ids = list(profile["flows"])
+        rates = np.array([profile["flows"][route_id] for route_id in route_ids], dtype=float)
+    elif "total" in profile:
+        shares = profile.get("shares", route_probabilities)
+        if not shares:
+            raise ValueError("a demand profile with 'total' needs 'shares' or the scenario's route_probabilities")
+        route_ids = list(shares)
+        weights = np.array([shares[route_id] for route_id in route_ids], dtype=float)
+        rates = np.outer(weights / weights.sum(), np.asarray(profile["total"], dtype=float))
+    else:
+        raise ValueError("a demand profile needs either 'flows' or 'total'")
+    if rates.ndim != 2 or rates.shape[1] == 0:
+        raise ValueError("every route of a demand profile needs one flow per bin")
+    if np.any(rates < 0):
+        raise ValueError("flows of a demand profile must not be negative")
+    return route_ids, _bin_edges(profile, rates.shape[1]), rates
+
+
+def _bin_edges(profile, num_bins):
+    """需求曲线的时段边界：bin_edges，或由begin和bin_seconds得到的等长时段。"""
+    """Bin edges of a demand profile: bin_edges, or equal bins from begin and bin_seconds."""
+    if "bin_edges" in profile:
+        bin_edges = np.asarray(profile["bin_edges"], dtype=float)
+    else:
+        begin = float(profile.get("begin", 0.0))
+        bin_edges = begin + float(profile["bin_seconds"]) * np.arange(num_bins + 1)
+    if len(bin_edges) != num_bins + 1:
+        raise ValueError(f"{num_bins} bins of demand do not match {len(bin_edges)} bin edges")
+    if np.any(np.diff(bin_edges) <= 0):
+        raise ValueError("bin edges of a demand profile must be strictly increasing")
+    return bin_edges
+
+
+def lane_counts(profile):
+    """将车道需求展开为(车道ID列表, 时段边界数组, 车辆数矩阵[车道, 时段])。"""
+    """Expand a per-lane demand into (lane ID list, bin edge array, vehicle count matrix [lane, bin])."""
+    lane_ids = list(profile["counts"])
+    counts = np.array([profile["counts"][lane_id] for lane_id in lane_ids], dtype=float)
+    if counts.ndim != 2 or counts.shape[1] == 0:
+        raise ValueError("every lane of a per-lane demand needs one count per bin")
+    if np.any(counts < 0) or np.any(counts != np.round(counts)):
+        raise ValueError("per-lane demand counts must be non-negative integers")
+    return lane_ids, _bin_edges(profile, counts.shape[1]), counts.astype(np.int64)
+
+
+def sample_profile_departures(rng, bin_edges, rates):
+    """对每条路线采样分段常数强度的非齐次泊松过程，返回按时间排序的(出发时间数组, 路线索引数组)。
+    每个(路线, 时段)的车辆数服从Poisson(流量 × 时段长度 / 3600)，车辆在时段内均匀分布，这与按强度精确采样等价。"""
+    """Sample a non-homogeneous Poisson process with piecewise-constant rate for every route and return (departure times, route indices) sorted by time.
+    The count of every (route, bin) cell is Poisson(flow × bin length / 3600) and its vehicles are uniform within the bin, which is exact for a piecewise-constant rate."""
+    widths = np.diff(bin_edges)
+    counts = rng.poisson(rates * widths / 3600.0)  # [路线, 时段] [route, bin]
+    cell_counts = counts.ravel()
+    route_idx = np.repeat(np.repeat(np.arange(rates.shape[0]), rates.shape[1]), cell_counts)
+    bin_idx = np.repeat(np.tile(np.arange(rates.shape[1]), rates.shape[0]), cell_counts)
+    depart = bin_edges[bin_idx] + rng.random(len(bin_idx)) * widths[bin_idx]
+
+    order = np.argsort(depart, kind="stable")
+    return depart[order], route_idx[order]
+
+
+def sample_lane_departures(rng, bin_edges, counts, route_weights):
+    """按车道需求批量采样：每个(车道, 时段)恰好生成counts辆车，出发时间在时段内均匀分布，
+    路线按route_weights[车道, 路线]（每行为该车道可用路线的权重）选择。返回按时间排序的(出发时间, 车道行号, 路线索引)。"""
+    """Sample a per-lane demand in bulk: exactly counts vehicles per (lane, bin) cell with departures uniform within the bin,
+    and routes drawn from route_weights[lane, route] (each row weights the routes usable from that lane). Returns (departure times, lane rows, route indices) sorted by time."""
+    widths = np.diff(bin_edges)
+    cell_counts = counts.ravel()
+    lane_row = np.repeat(np.repeat(np.arange(counts.shape[0]), counts.shape[1]), cell_counts)
+    bin_idx = np.repeat(np.tile(np.arange(counts.shape[1]), counts.shape[0]), cell_counts)
+    depart = bin_edges[bin_idx] + rng.random(len(bin_idx)) * widths[bin_idx]
+
+    # 按行的逆累积分布抽样：第i行的累积权重平移到[i, i+1)，一次searchsorted即可为所有车辆选出路线
+    # Inverse-CDF sampling per row: the cumulative weights of row i are shifted into [i, i+1), so a single searchsorted picks every route
+    weights = route_weights / route_weights.sum(axis=1, keepdims=True)
+    num_routes = weights.shape[1]
+    cumulative = (np.cumsum(weights, axis=1) + np.arange(weights.shape[0])[:, None]).ravel()
+    flat = np.searchsorted(cumulative, lane_row + rng.random(len(lane_row)), side="right")
+    route_idx = np.minimum(flat - lane_row * num_routes, num_routes - 1)
+    # 浮点误差可能落到权重为0的路线上，改为该行最后一条可用路线
+    # Rounding may land on a zero-weight route; fall back to the last usable route of the row
+    last_usable = num_routes - 1 - np.argmax(weights[:, ::-1] > 0, axis=1)
+    bad = weights[lane_row, route_idx] <= 0
+    route_idx[bad] = last_usable[lane_row[bad]]
+
+    order = np.argsort(depart, kind="stable")
+    return depart[order], lane_row[order], route_idx[order]
+
+
+# <flow>的间隔方式: SUMO属性 Spacing of a <flow>: SUMO attribute
+FLOW_SPACINGS = {"poisson": "period", "bernoulli": "probability", "uniform": "vehsPerHour"}
+
+
+def profile_flows(bin_edges, rates, route_ids, spacing="poisson", breaks=(), step_length=1.0):
+    """将分段常数的需求强度转换为SUMO的<flow>：每个流量不为0的(路线, 时段)一个flow，返回按开始时间排序的[(开始时间, 属性字典)]。
+    poisson使用period="exp(λ)"，与逐辆采样的非齐次泊松过程同分布；bernoulli使用probability=λ×步长（每个仿真步一次伯努利试验，
+    λ×步长较小时近似泊松）；uniform使用vehsPerHour（等间隔，只保持平均流量）。breaks中的时刻（如天气切换）把时段再分开。"""
+    """Turn piecewise-constant demand rates into SUMO <flow>s: one flow per (route, bin) with a non-zero rate, returned as [(begin time, attribute dict)] sorted by begin.
+    poisson uses period="exp(λ)", which has the same distribution as the per-vehicle non-homogeneous Poisson sampling; bernoulli uses probability=λ×step length (one Bernoulli trial per simulation step,
+    close to Poisson while λ×step length is small); uniform uses vehsPerHour (evenly spaced, only the mean flow is kept). Times in breaks (e.g. weather changes) split the bins further."""
+    if spacing not in FLOW_SPACINGS:
+        raise ValueError(f"unknown flow spacing '{spacing}' (known: {', '.join(FLOW_SPACINGS)})")
+    extra = [t for t in breaks if bin_edges[0] < t < bin_edges[-1]]
+    edges = np.union1d(bin_edges, extra)
+    bin_idx = np.searchsorted(bin_edges, edges[:-1], side="right") - 1
+    segment_rates = rates[:, bin_idx]  # [路线, 分段] [route, segment]
+    if spacing == "bernoulli" and np.any(segment_rates * step_length / 3600.0 > 1.0):
+        raise ValueError("a flow of more than one vehicle per simulation step cannot use bernoulli spacing")
+
+    flows = []
+    for segment in range(len(edges) - 1):
+        begin, end = round(float(edges[segment]), 2), round(float(edges[segment + 1]), 2)
+        for row in np.flatnonzero(segment_rates[:, segment] > 0).tolist():
+            rate = float(segment_rates[row, segment])
+            if spacing == "poisson":
+                value = f"exp({rate / 3600.0:.6g})"
+            elif spacing == "bernoulli":
+                value = f"{rate * step_length / 3600.0:.6g}"
+            else:
+                value = f"{rate:.6g}"
+            flows.append((begin, {"id": "", "type": "car", "route": route_ids[row], "begin": str(begin),
+                                  "end": str(end), FLOW_SPACINGS[spacing]: value}))
+    return flows
@@ -0,0 +1,138 @@
+"""
+交叉口检测器布设
+Detector layout for the junction approaches.
+
+在交叉口（默认J0，也可以是合成路网中的所有交叉口）的每条进口车道上布设一个E1感应线圈（停车线前setback米处）和
+一个E2区域检测器（从停车线向上游覆盖e2_length米，默认覆盖整条车道），位置由网络索引中的车道长度得出。检测器按period
+秒聚合并写入输出文件，控制器每步只需读取每条车道一个聚合值（traci.inductionloop/lanearea），或在仿真后用
+sumo_outputs解析聚合输出，比高需求下逐车辆查询便宜得多。
+
+Places one E1 induction loop (setback metres before the stop line) and one E2 lane area detector (covering e2_length
+metres upstream of the stop line, the whole lane by default) on every incoming lane of the junction (J0 by default, or
+every junction of a synthesized network), positioned from the lane lengths in the network index. The detectors
+aggregate over period seconds into their output files, so a controller reads one aggregated value per lane per step
+(traci.inductionloop/lanearea), or parses the aggregated outputs with sumo_outputs afterwards, which is far cheaper
+than per-vehicle queries at high demand.
+
+场景参数 Scenario parameters ("detectors"):
+    {"junctions": ["J0"]（或"all"：除dead_end外的所有交叉口 or "all": every junction but dead ends）,
+     "period": 60, "e1": True, "e2": True, "setback": 2.0, "e2_length": None,
+     "e1_file": "e1_output.xml", "e2_file": "e2_output.xml"}
+    输出文件路径相对于附加文件所在目录 Output file paths are relative to the directory of the additional file
+    场景默认不布设检测器（None）；共享场景目录的运行应使用各自的输出文件名，否则会互相覆盖
+    Scenarios place no detectors by default (None); runs sharing a scenario directory need their own output file names or they overwrite each other
+
+用法 Usage:
+    python detectors.py --net grid.net.xml --junctions all --period 300 --output detectors.add.xml
+"""
+import argparse
+from xml.sax.saxutils import quoteattr
+
+from net_index import load_network_index
+
+DEFAULT_PERIOD = 60.0  # 聚合周期（秒） Aggregation period (s)
+DEFAULT_SETBACK = 2.0  # E1距停车线的距离（米） Distance of the E1 loop from the stop line (m)
+DEFAULT_E1_FILE = "e1_output.xml"
+DEFAULT_E2_FILE = "e2_output.xml"
+_SKIPPED_JUNCTION_TYPES = ("dead_end", "internal")
+
+
+def detector_junctions(index, junctions=("J0",)):
+    """要布设检测器的交叉口ID；junctions为"all"时为除dead_end外所有有进口车道的交叉口。"""
+    """IDs of the junctions that get detectors; with junctions="all" every junction with incoming lanes except dead ends."""
+    if junctions != "all":
+        unknown = [junction_id for junction_id in junctions if junction_id not in index.junction_lookup]
+        if unknown:
+            raise ValueError(f"junctions not in the network: {', '.join(unknown)}")
+        return list(junctions)
+    return [junction_id for junction_id, junction_type in zip(index.junction_ids.tolist(), index.junction_type.tolist())
+            if junction_type not in _SKIPPED_JUNCTION_TYPES and len(index.junction_incoming_lanes(junction_id))]
+
+
+def detector_layout(index, junctions=("J0",), e1=True, e2=True, setback=DEFAULT_SETBACK, e2_length=None):
+    """计算检测器布设：[{"kind": "e1"/"e2", "id", "lane", "junction", "pos", "end"}]，pos/end为车道上的位置（米，E1只有pos）。
+    一条车道是多个交叉口的进口车道时只布设一次。"""
+    """Compute the detector layout: [{"kind": "e1"/"e2", "id", "lane", "junction", "pos", "end"}], pos/end being positions along the lane (m; E1 has pos only).
+    A lane entering several junctions gets its detectors once."""
+    layout = []
+    seen = set()
+    for junction_id in detector_junctions(index, junctions):
+        for lane in index.junction_incoming_lanes(junction_id).tolist():
+            lane_id = str(index.lane_ids[lane])
+            if lane_id in seen:
+                continue
+            seen.add(lane_id)
+            length = float(index.lane_length[lane])
+            if e1:
+                layout.append({"kind": "e1", "id": f"e1_{lane_id}", "lane": lane_id, "junction": junction_id,
+                               "pos": round(max(length - setback, 0.0), 2)})
+            if e2:
+                covered = length if e2_length is None else min(e2_length, length)
+                layout.append({"kind": "e2", "id": f"e2_{lane_id}", "lane": lane_id, "junction": junction_id,
+                               "pos": round(length - covered, 2), "end": round(length, 2)})
+    return layout
+
+
+def _attributes(attrib):
+    return " ".join(f"{key}={quoteattr(value)}" for key, value in attrib.items())
+
+
+def format_detectors(layout, period=DEFAULT_PERIOD, e1_file=DEFAULT_E1_FILE, e2_file=DEFAULT_E2_FILE, space="    "):
+    """生成检测器元素的XML文本（不含<additional>根元素），可直接写入附加文件。"""
+    """Build the XML text of the detector elements (without the <additional> root), ready to go into an additional file."""
+    lines = []
+    for detector in layout:
+        if detector["kind"] == "e1":
+            attrib = {"id": detector["id"], "lane": detector["lane"], "pos": f"{detector['pos']:g}",
+                      "period": f"{period:g}", "file": e1_file}
+            lines.append(f"{space}<inductionLoop {_attributes(attrib)} />\n")
+        else:
+            attrib = {"id": detector["id"], "lane": detector["lane"], "pos": f"{detector['pos']:g}",
+                      "endPos": f"{detector['end']:g}", "period": f"{period:g}", "file": e2_file}
+            lines.append(f"{space}<laneAreaDetector {_attributes(attrib)} />\n")
+    return "".join(lines)
+
+
+def scenario_detectors(index, spec):
+    """由场景的"detectors"参数计算布设并返回(布设, XML文本)。"""
+    """Compute the layout from a scenario's "detectors" parameters and return (layout, XML text)."""
+    layout = detector_layout(index, spec.get("junctions", ("J0",)), spec.get("e1", True), spec.get("e2", True),
+                             spec.get("setback", DEFAULT_SETBACK), spec.get("e2_length"))
+    text = format_detectors(layout, spec.get("period", DEFAULT_PERIOD), spec.get("e1_file", DEFAULT_E1_FILE),
+                            spec.get("e2_file", DEFAULT_E2_FILE))
+    return layout, text
+
+
+def write_detector_file(path, net_file, spec=None):
+    """把检测器单独写成一个附加文件（用于合成路网等没有经过autoscript的场合），返回布设。"""
+    """Write the detectors into an additional file of their own (for synthesized networks and other cases outside autoscript) and return the layout."""
+    layout, text = scenario_detectors(load_network_index(net_file), spec or {})
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<additional>\n")
+        f.write(text)
+        f.write("</additional>\n")
+    return layout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Place E1/E2 detectors on the incoming lanes of junctions")
+    parser.add_argument("--net", default="net.net.xml", help="network file")
+    parser.add_argument("--junctions", nargs="+", default=["J0"], help='junction IDs, or "all"')
+    parser.add_argument("--period", type=float, default=DEFAULT_PERIOD, help="aggregation period (s)")
+    parser.add_argument("--setback", type=float, default=DEFAULT_SETBACK, help="E1 distance from the stop line (m)")
+    parser.add_argument("--e2-length", type=float, default=None, help="E2 length upstream of the stop line (m)")
+    parser.add_argument("--no-e1", action="store_true")
+    parser.add_argument("--no-e2", action="store_true")
+    parser.add_argument("--e1-file", default=DEFAULT_E1_FILE)
+    parser.add_argument("--e2-file", default=DEFAULT_E2_FILE)
+    parser.add_argument("--output", default="detectors.add.xml")
+    args = parser.parse_args()
+    spec = {"junctions": "all" if args.junctions == ["all"] else args.junctions, "period": args.period,
+            "e1": not args.no_e1, "e2": not args.no_e2, "setback": args.setback, "e2_length": args.e2_length,
+            "e1_file": args.e1_file, "e2_file": args.e2_file}
+    layout = write_detector_file(args.output, args.net, spec)
+    print(f"{len(layout)} detectors written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
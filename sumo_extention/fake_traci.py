@@ -0,0 +1,205 @@
+"""
+TraCI替身
+A stand-in for TraCI.
+
+在没有安装SUMO的环境中测试运行时接口（sumo_env等）：实现了它们用到的TraCI/libsumo子集（lane的变量订阅与单项读取、
+simulationStep、simulation（含saveState/loadState）、trafficlight），车道上的交通用一个简单的向量化排队模型模拟。
+latency参数为每次TraCI调用增加固定的往返延迟，用来对比订阅与逐项轮询在真实TraCI中的开销差异。
+
+Exercises the runtime interface (sumo_env and friends) where SUMO is not installed: implements the subset of
+TraCI/libsumo they use (lane variable subscriptions and single reads, simulationStep, simulation with
+saveState/loadState, trafficlight) and simulates the lane traffic with a simple vectorized queue model. latency adds a fixed round-trip delay to every TraCI
+call, to compare the cost of subscriptions and per-variable polling as seen with real TraCI.
+"""
+import json
+import time
+
+import numpy as np
+
+# TraCI变量ID（与traci.constants一致） TraCI variable IDs (as in traci.constants)
+LAST_STEP_VEHICLE_NUMBER = 0x10
+LAST_STEP_MEAN_SPEED = 0x11
+LAST_STEP_OCCUPANCY = 0x13
+LAST_STEP_VEHICLE_HALTING_NUMBER = 0x14
+VAR_WAITING_TIME = 0x7a
+
+FREE_FLOW_SPEED = 13.89  # 自由流速度（m/s） Free-flow speed (m/s)
+VEHICLE_SPACE = 7.5  # 每辆车占用的车道长度（米） Lane length taken by one vehicle (m)
+
+
+class _Domain:
+    def __init__(self, sim):
+        self._sim = sim
+
+
+class _LaneDomain(_Domain):
+    def subscribe(self, lane_id, variables):
+        self._sim._round_trip()
+        self._sim.subscriptions[lane_id] = tuple(variables)
+
+    def getAllSubscriptionResults(self):
+        self._sim._round_trip()
+        return {lane_id: {var: self._sim._value(lane_id, var) for var in variables}
+                for lane_id, variables in self._sim.subscriptions.items()}
+
+    def getSubscriptionResults(self, lane_id):
+        self._sim._round_trip()
+        return {var: self._sim._value(lane_id, var) for var in self._sim.subscriptions.get(lane_id, ())}
+
+    def getIDList(self):
+        self._sim._round_trip()
+        return list(self._sim.lane_ids)
+
+    def _getter(var):
+        def get(self, lane_id):
+            self._sim._round_trip()
+            return self._sim._value(lane_id, var)
+        return get
+
+    getLastStepVehicleNumber = _getter(LAST_STEP_VEHICLE_NUMBER)
+    getLastStepMeanSpeed = _getter(LAST_STEP_MEAN_SPEED)
+    getLastStepOccupancy = _getter(LAST_STEP_OCCUPANCY)
+    getLastStepHaltingNumber = _getter(LAST_STEP_VEHICLE_HALTING_NUMBER)
+    getWaitingTime = _getter(VAR_WAITING_TIME)
+
+
+class _SimulationDomain(_Domain):
+    def getTime(self):
+        self._sim._round_trip()
+        return self._sim.time
+
+    def getMinExpectedNumber(self):
+        self._sim._round_trip()
+        return 0 if self._sim.time >= self._sim.end_time else 1
+
+    def saveState(self, path):
+        """把排队模型的状态（含随机数生成器）保存为.npz格式的文件（文件名不限）。"""
+        """Save the state of the queue model (random Generator included) as an .npz formatted file (any file name)."""
+        self._sim._round_trip()
+        sim = self._sim
+        with open(path, "wb") as f:
+            np.savez(f, time=sim.time, queue=sim.queue, moving=sim.moving, waiting=sim.waiting, phase=sim.phase,
+                     phase_remaining=sim.phase_remaining, lane_ids=np.array(sim.lane_ids), rng=json.dumps(sim.rng.bit_generator.state))
+
+    def loadState(self, path):
+        """载入saveState保存的状态；结束时间随之顺延，回合长度不变。"""
+        """Load a state written by saveState; the end time moves along, so the episode length stays the same."""
+        self._sim._round_trip()
+        sim = self._sim
+        with np.load(path, allow_pickle=False) as state:
+            if state["lane_ids"].tolist() != sim.lane_ids:
+                raise ValueError(f"state {path} was saved for different lanes")
+            sim.end_time += float(state["time"]) - sim.time
+            sim.time = float(state["time"])
+            sim.queue, sim.moving, sim.waiting = state["queue"], state["moving"], state["waiting"]
+            sim.phase = int(state["phase"])
+            if "phase_remaining" in state:
+                sim.phase_remaining = float(state["phase_remaining"])
+            sim.rng.bit_generator.state = json.loads(str(state["rng"]))
+
+
+class _TrafficLightDomain(_Domain):
+    def setPhase(self, tls_id, phase):
+        self._sim._round_trip()
+        self._sim.phase = int(phase)
+        self._sim.phase_remaining = self._sim._phase_duration(self._sim.phase)
+
+    def setPhaseDuration(self, tls_id, duration):
+        self._sim._round_trip()
+        self._sim.phase_remaining = float(duration)
+
+    def getPhase(self, tls_id):
+        self._sim._round_trip()
+        return self._sim.phase
+
+    def setRedYellowGreenState(self, tls_id, state):
+        self._sim._round_trip()
+        self._sim.phase_state = state
+
+
+class FakeTraCI:
+    """TraCI连接的替身。lane_ids为模拟的车道，phase_green[相位]为该相位放行的车道布尔数组（默认所有车道都放行），
+    arrival_rate/discharge_rate为每条车道每秒的到达率与放行率。
+    phase_durations（每个相位的时长，秒）使信号灯像定时tlLogic一样运行：相位时长用完后自动进入下一个相位（与SUMO中setPhase之后相同）；
+    不指定时相位只随setPhase改变。"""
+    """Stand-in for a TraCI connection. lane_ids are the simulated lanes, phase_green[phase] is the boolean array of lanes served by that phase (by default every lane is served),
+    and arrival_rate/discharge_rate are the per-lane arrival and discharge rates in vehicles per second.
+    phase_durations (per phase, seconds) makes the traffic light run like a static tlLogic: a phase advances to the next once its duration is over, as after
+    setPhase in SUMO; without it the phase only changes through setPhase."""
+
+    def __init__(self, lane_ids, lane_length=100.0, phase_green=None, arrival_rate=0.1, discharge_rate=0.5,
+                 step_length=1.0, end_time=3600.0, latency=0.0, seed=None, phase_durations=None):
+        self.lane_ids = list(lane_ids)
+        self._lane_row = {lane_id: i for i, lane_id in enumerate(self.lane_ids)}
+        self.lane_length = np.broadcast_to(np.asarray(lane_length, dtype=float), (len(self.lane_ids),))
+        self.phase_green = (np.ones((1, len(self.lane_ids)), dtype=bool) if phase_green is None
+                            else np.asarray(phase_green, dtype=bool))
+        self.arrival_rate = arrival_rate
+        self.discharge_rate = discharge_rate
+        self.step_length = step_length
+        self.end_time = end_time
+        self.latency = latency
+        self.rng = np.random.default_rng(seed)
+        self.subscriptions = {}
+        self.phase_durations = None if phase_durations is None else [float(d) for d in phase_durations]
+        self.phase = 0
+        self.phase_remaining = self._phase_duration(0)
+        self.phase_state = None
+        self.calls = 0  # TraCI调用次数 Number of TraCI calls
+        self.time = 0.0
+        self.queue = np.zeros(len(self.lane_ids))
+        self.moving = np.zeros(len(self.lane_ids))
+        self.waiting = np.zeros(len(self.lane_ids))
+        self.lane = _LaneDomain(self)
+        self.simulation = _SimulationDomain(self)
+        self.trafficlight = _TrafficLightDomain(self)
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            deadline = time.perf_counter() + self.latency
+            while time.perf_counter() < deadline:
+                pass
+
+    def simulationStep(self, step=0.0):
+        """推进一个仿真步：到达的车辆先行驶一步再排队，放行车道按放行率驶离。step大于0时（与TraCI相同）一直推进到该时刻。"""
+        """Advance one simulation step: arriving vehicles drive for one step before queueing, served lanes discharge at the discharge rate.
+        A step greater than 0 advances until that time, as in TraCI."""
+        self._round_trip()
+        self._advance()
+        while self.time < step:
+            self._advance()
+
+    def _phase_duration(self, phase):
+        return self.phase_durations[phase % len(self.phase_durations)] if self.phase_durations else float("inf")
+
+    def _advance(self):
+        self.queue += self.moving
+        self.moving = self.rng.poisson(self.arrival_rate * self.step_length, len(self.lane_ids)).astype(float)
+        green = self.phase_green[self.phase % len(self.phase_green)]
+        served = np.minimum(self.queue, self.rng.poisson(self.discharge_rate * self.step_length, len(self.lane_ids)))
+        self.queue -= np.where(green, served, 0.0)
+        self.waiting = np.where(self.queue > 0, self.waiting + self.step_length, 0.0)
+        self.time += self.step_length
+        self.phase_remaining -= self.step_length
+        if self.phase_remaining <= 1e-9:
+            self.phase = (self.phase + 1) % len(self.phase_durations)
+            self.phase_remaining = self._phase_duration(self.phase)
+
+    def _value(self, lane_id, var):
+        row = self._lane_row[lane_id]
+        vehicles = self.queue[row] + self.moving[row]
+        if var == LAST_STEP_VEHICLE_NUMBER:
+            return int(vehicles)
+        if var == LAST_STEP_MEAN_SPEED:
+            return FREE_FLOW_SPEED * (self.moving[row] / vehicles if vehicles else 1.0)
+        if var == LAST_STEP_OCCUPANCY:
+            return min(100.0, 100.0 * vehicles * VEHICLE_SPACE / self.lane_length[row])
+        if var == LAST_STEP_VEHICLE_HALTING_NUMBER:
+            return int(self.queue[row])
+        if var == VAR_WAITING_TIME:
+            return float(self.waiting[row] * self.queue[row])
+        raise ValueError(f"variable 0x{var:02x} is not simulated")
+
+    def close(self):
+        self.subscriptions.clear()
@@ -0,0 +1,197 @@
+"""
+事故/事件引擎
+Accident and incident engine.
+
+每个事件是一条车道上一段时间的封闭：{"lane", "begin", "end"}，可选"pos"（事故位置，米）、"length"（封闭路段长度，米）
+和"partial"（部分封闭：只封闭事故附近的路段，车道其余部分仍可通行）。事件可以来自事故车辆，也可以按路网批量随机采样。
+没有事故车辆的事件由一辆停在[pos - length/2, pos + length/2]的阻塞车辆占据事故路段（见blocker_vehicles）。
+
+Every incident closes one lane for a time window: {"lane", "begin", "end"} with optional "pos" (incident position, m),
+"length" (length of the closed segment, m) and "partial" (partial closure: only the segment around the incident is
+blocked, the rest of the lane stays usable). Incidents come from accident vehicles or are sampled in bulk from the
+network. Incidents without an accident vehicle get a blocker vehicle stopped on [pos - length/2, pos + length/2] that
+occupies the incident segment (see blocker_vehicles).
+
+写出附加文件前，同一edge上的所有完全封闭合并为一个rerouter，重叠或相接的时间段合并为最少的interval；
+同一车道上的限速合并为一个variableSpeedSign的step序列。合并只需排序一次，随事件数近似线性增长。
+
+Before the additional file is written, all full closures of an edge are merged into one rerouter whose overlapping
+or adjacent time windows collapse into the minimal set of intervals, and the speed limits of a lane into one
+variableSpeedSign step sequence. Merging needs one sort and grows about linearly with the incident count.
+
+每条车道单独可以关闭并不代表同一edge上同时生效的多个封闭也可以：safe_closures()按开始时间检查每个完全封闭与已接受的封闭
+合起来是否仍给该edge的每个转向留下一条车道，否则缩短或丢弃该事件；事故车辆的封闭保留原样，只计数警告。
+A lane that can be closed on its own does not make overlapping closures of the same edge safe together:
+safe_closures() checks every full closure, in order of begin time, together with the closures already accepted and
+shortens or drops it when the edge would be left without an open lane for one of its movements; closures of
+accident vehicles are kept as they are and only counted for a warning.
+"""
+import numpy as np
+
+DEFAULT_RESTORE_SPEED = 13.89  # 没有路网时的恢复速度（50 km/h） Restore speed without a network (50 km/h)
+PARTIAL_CLOSURE_SPEED = 5.0  # 部分封闭时车道的限速（m/s） Speed limit of a partially closed lane (m/s)
+DEFAULT_CLOSURE_LENGTH = 10.0  # 默认封闭路段长度（米） Default length of the closed segment (m)
+
+
+def accident_incident(accident, lane_id):
+    """将事故车辆转换为事件。"""
+    """Turn an accident vehicle into an incident."""
+    return {
+        "lane": lane_id,
+        "begin": float(accident["accident_start"]),
+        "end": float(accident["accident_end"]),
+        "pos": float(accident.get("pos", 50.0)),
+        "length": float(accident.get("length", DEFAULT_CLOSURE_LENGTH)),
+        "partial": bool(accident.get("partial", False)),
+        "vehicle": True,  # 事故车辆本身占据事故路段 The accident vehicle itself occupies the segment
+    }
+
+
+def sample_incidents(index, num_incidents, horizon, duration=(300.0, 1800.0), length=DEFAULT_CLOSURE_LENGTH,
+                     partial_share=0.0, edges=None, seed=None):
+    """在路网上批量随机采样事件：车道从edges（默认所有普通edge）中可安全关闭的车道里均匀选择，位置在车道长度内均匀分布，
+    开始时间在[0, horizon)内均匀分布，持续时间在duration区间内均匀分布，partial_share比例的事件为部分封闭。
+    与已采样事件重叠后会切断某个转向的完全封闭被缩短或丢弃（见safe_closures），因此返回的事件可能少于num_incidents个。"""
+    """Sample incidents in bulk over the network: lanes uniformly among the lanes of edges (all normal edges by default) that can be closed safely, positions uniform along the lane,
+    begin times uniform in [0, horizon), durations uniform in the duration range, and a partial_share fraction of partial closures.
+    Full closures that would cut off a movement together with overlapping sampled ones are shortened or dropped (see safe_closures), so fewer than num_incidents may be returned."""
+    rng = np.random.default_rng(seed)
+    edge_ids = edges if edges is not None else index.edge_ids[index.normal_edges()].tolist()
+    candidates = np.array([lane for edge_id in edge_ids for lane in index.edge_lanes(edge_id).tolist()
+                           if index.closure_safe(lane) and index.lane_length[lane] > length], dtype=np.int64)
+    if len(candidates) == 0:
+        raise ValueError("no lane can be closed safely for sampled incidents")
+
+    lanes = candidates[rng.integers(0, len(candidates), num_incidents)]
+    lane_length = index.lane_length[lanes]
+    pos = length / 2 + rng.random(num_incidents) * (lane_length - length)
+    begin = rng.random(num_incidents) * horizon
+    end = begin + rng.uniform(duration[0], duration[1], num_incidents)
+    partial = rng.random(num_incidents) < partial_share
+    lane_ids = index.lane_ids[lanes].tolist()
+    incidents = [{"lane": lane_id, "begin": round(b, 2), "end": round(e, 2), "pos": round(p, 2), "length": length,
+             "partial": bool(is_partial)}
+            for lane_id, b, e, p, is_partial in zip(lane_ids, begin.tolist(), end.tolist(), pos.tolist(),
+                                                    partial.tolist())]
+    return safe_closures(incidents, index)[0]
+
+
+def safe_closures(incidents, index):
+    """按开始时间逐个接受完全封闭：开始时与同一edge上仍生效的已接受封闭合起来会切断某个转向（见NetworkIndex.closures_safe）时丢弃，
+    之后才会切断时把结束时间缩短到那一刻。部分封闭不关闭车道，原样保留。事故车辆的封闭（"vehicle"）也不缩短或丢弃，因为路线文件中
+    事故车辆的<stop>仍会停满整个时长，只计入不安全的数量，由调用方给出警告。返回(事件列表, 被缩短的数量, 被丢弃的数量, 不安全但保留的事故封闭数量)，顺序不变。"""
+    """Accept full closures one by one in order of begin time: one that would cut off a movement together with the accepted closures of its edge still active at its begin is dropped,
+    one that would only do so later has its end moved to that moment (see NetworkIndex.closures_safe). Partial closures close no lane and are kept as they are.
+    Closures of accident vehicles ("vehicle") are never shortened or dropped either, since the vehicle's <stop> in the route file keeps the full duration;
+    they are only counted as unsafe for the caller to warn about. Returns (incidents, number shortened, number dropped, number of unsafe accident closures kept) in the original order."""
+    accepted = {}  # edge ID -> [(开始, 结束, 车道)] edge ID -> [(begin, end, lane)]
+    result = {}
+    shortened = dropped = unsafe = 0
+    order = sorted(range(len(incidents)), key=lambda i: incidents[i]["begin"])
+    for i in order:
+        incident = incidents[i]
+        if incident.get("partial") or incident["lane"] not in index.lane_lookup:
+            result[i] = incident
+            continue
+        lane = index.lane_lookup[incident["lane"]]
+        begin, end = incident["begin"], incident["end"]
+        # 按开始时间处理，已结束的封闭不会再影响之后的事件 Processed by begin time, so closures that have ended never matter again
+        edge_closures = [closure for closure in accepted.get(int(index.lane_edge[lane]), []) if closure[1] > begin]
+        accepted[int(index.lane_edge[lane])] = edge_closures
+        # 封闭集合只在已接受封闭开始时变大 The closed set only grows when an accepted closure begins
+        checks = [begin] + sorted(b for b, e, _ in edge_closures if begin < b < end)
+        cut = None
+        for t in checks:
+            closed = {other for b, e, other in edge_closures if b <= t < e} | {lane}
+            if not index.closures_safe(closed):
+                cut = t
+                break
+        if cut is not None and incident.get("vehicle"):
+            unsafe += 1
+        elif cut == begin:
+            dropped += 1
+            continue
+        elif cut is not None:
+            shortened += 1
+            end = cut
+            incident = dict(incident, end=end)
+        edge_closures.append((begin, end, lane))
+        result[i] = incident
+    return [result[i] for i in sorted(result)], shortened, dropped, unsafe
+
+
+def blocker_vehicles(incidents):
+    """没有事故车辆但有位置的事件的阻塞车辆：[(车辆ID, edge ID, 车道序号, 开始, 结束, 停车起点, 停车终点)]，按开始时间排序。"""
+    """Blocker vehicles of the incidents that have a position but no accident vehicle: [(vehicle ID, edge ID, lane index, begin, end, stop start, stop end)], sorted by begin."""
+    blockers = []
+    for incident in sorted(incidents, key=lambda incident: incident["begin"]):
+        if incident.get("vehicle") or incident.get("pos") is None or incident["end"] <= incident["begin"]:
+            continue
+        edge_id, lane_index = incident["lane"].rsplit("_", 1)
+        half_length = float(incident.get("length", DEFAULT_CLOSURE_LENGTH)) / 2
+        blockers.append((f"incident_blocker_{len(blockers)}", edge_id, int(lane_index), incident["begin"],
+                         incident["end"], max(0.0, incident["pos"] - half_length), incident["pos"] + half_length))
+    return blockers
+
+
+def _sweep(intervals):
+    """对[(开始, 结束, 值)]做扫描线，返回分段常数的[(开始, 结束, 当前生效值的元组)]，相邻且值相同的段已合并。"""
+    """Sweep over [(begin, end, value)] and return the piecewise-constant [(begin, end, tuple of active values)], with adjacent segments of equal values merged."""
+    events = sorted([(begin, 1, value) for begin, end, value in intervals if end > begin] +
+                    [(end, -1, value) for begin, end, value in intervals if end > begin], key=lambda event: event[0])
+    active = {}
+    segments = []
+    i = 0
+    while i < len(events):
+        time = events[i][0]
+        while i < len(events) and events[i][0] == time:
+            _, delta, value = events[i]
+            active[value] = active.get(value, 0) + delta
+            if not active[value]:
+                del active[value]
+            i += 1
+        if segments and segments[-1][1] is None:
+            segments[-1][1] = time
+        if active:
+            state = tuple(sorted(active))
+            if segments and segments[-1][1] == time and segments[-1][2] == state:
+                segments[-1][1] = None  # 与上一段相接且状态相同，继续延长 Same state as the adjacent segment: extend it
+            else:
+                segments.append([time, None, state])
+    return [tuple(segment) for segment in segments]
+
+
+def merge_closures(incidents, lane_edges):
+    """将完全封闭按edge合并：返回{edge ID: [(开始, 结束, (封闭的车道ID, ...))]}，每个edge的时间段互不重叠且数量最少。"""
+    """Merge full closures per edge: returns {edge ID: [(begin, end, (closed lane IDs, ...))]} with non-overlapping, minimal time windows per edge."""
+    per_edge = {}
+    for incident in incidents:
+        if not incident.get("partial"):
+            edge_id = lane_edges[incident["lane"]]
+            per_edge.setdefault(edge_id, []).append((incident["begin"], incident["end"], incident["lane"]))
+    return {edge_id: _sweep(intervals) for edge_id, intervals in per_edge.items()}
+
+
+def merge_speed_steps(incidents, restore_speeds):
+    """将每条车道上的事件合并为variableSpeedSign的step序列：返回{车道ID: [(时间, 速度)]}。
+    完全封闭期间速度为0，只有部分封闭时为PARTIAL_CLOSURE_SPEED，其余时间恢复为restore_speeds[车道]。"""
+    """Merge the incidents of every lane into a variableSpeedSign step sequence: returns {lane ID: [(time, speed)]}.
+    The speed is 0 during full closures, PARTIAL_CLOSURE_SPEED while only partial closures are active and restore_speeds[lane] otherwise."""
+    per_lane = {}
+    for incident in incidents:
+        per_lane.setdefault(incident["lane"], []).append(
+            (incident["begin"], incident["end"], PARTIAL_CLOSURE_SPEED if incident.get("partial") else 0.0))
+
+    steps = {}
+    for lane_id, intervals in per_lane.items():
+        restore = restore_speeds[lane_id]
+        lane_steps = [(0.0, restore)]
+        for begin, end, speeds in _sweep(intervals):
+            speed = min(speeds)
+            if lane_steps and lane_steps[-1][0] == begin:
+                lane_steps.pop()  # 与上一段相接 Adjacent to the previous segment
+            if not lane_steps or lane_steps[-1][1] != speed:
+                lane_steps.append((begin, speed))
+            lane_steps.append((end, restore))
+        steps[lane_id] = lane_steps
+    return steps
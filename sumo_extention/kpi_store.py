@@ -0,0 +1,287 @@
+"""
+跨场景的KPI增量汇总
+Incremental KPI aggregation across scenario runs.
+
+每次运行结束后，add_run()把该次运行按(路线, 车辆类别, 天气, 事件)分组的摘要写入存储目录下的runs/<运行ID>.npz。
+摘要是可合并的草图：车辆数、总和、平方和、最小值、最大值，以及固定对数分箱的直方图（用于分位数）。
+汇总文件aggregate.npz记录已合并的运行，查询时只把新增的运行合并进去，不再读取任何原始输出文件。
+
+After every run, add_run() writes the run's summaries grouped by (route, vehicle class, weather, incident) to
+runs/<run ID>.npz inside the store directory. The summaries are mergeable sketches: count, sum, sum of squares, minimum,
+maximum and a histogram over fixed logarithmic bins (for quantiles). The aggregate file aggregate.npz remembers the
+runs already merged; a query only merges the new runs and never touches raw output files.
+
+车辆ID为autoscript.main()分配的序号，路线和车辆类型从生成的路线文件中读取；车辆类别为去掉天气后缀的车辆类型
+（car/emergency/accident）。<flow>产生的车辆由SUMO命名为"<flow ID>.<序号>"，归入该flow的分组。
+不在路线文件中的车辆（如附加文件中的事件阻塞车辆"incident_blocker_<序号>"）的行程被跳过。
+Vehicle IDs are the sequence numbers assigned by autoscript.main(); routes and vehicle types are read from the
+generated route file, and the vehicle class is the vehicle type without its weather suffix (car/emergency/accident).
+Vehicles of a <flow> are named "<flow ID>.<n>" by SUMO and belong to their flow's group. Trips of vehicles that are not
+in the route file, such as the incident blockers of the additional file ("incident_blocker_<n>"), are skipped.
+
+用法 Usage:
+    python kpi_store.py add --store kpis --run scenario_00001 --tripinfo tripinfo.xml --routes generated_vehicles.rou.xml --weather rain
+    python kpi_store.py query --store kpis --by route vclass --metric delay
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from sumo_outputs import iter_output_chunks, vehicle_class
+
+DIMENSIONS = ("route", "vclass", "weather", "incident")
+# 指标: tripinfo列 Metric: tripinfo column
+METRICS = {"delay": "timeLoss", "waiting_time": "waitingTime", "travel_time": "duration"}
+# 直方图分箱（秒）：0以及0.1秒到10000秒之间的对数分箱，超出范围的值计入两端的分箱
+# Histogram bins (s): 0 plus logarithmic bins from 0.1 s to 10000 s; values out of range go to the outermost bins
+BIN_EDGES = np.concatenate([[0.0], np.geomspace(0.1, 1e4, 256)])
+QUANTILES = (0.5, 0.9, 0.95)
+
+_STATS = ("count", "total", "total_sq", "min", "max")
+
+
+def run_conditions(scenario):
+    """由场景参数得到运行条件{"weather": 标签, "incident": "yes"/"no"}。"""
+    """Run conditions from scenario parameters: {"weather": label, "incident": "yes"/"no"}."""
+    weather = scenario.get("weather")
+    if weather is None:
+        label = "clear"
+    elif isinstance(weather, str):
+        label = weather
+    else:
+        label = "mixed"
+    has_incidents = bool(scenario.get("accident_vehicles") or scenario.get("incidents"))
+    return {"weather": label, "incident": "yes" if has_incidents else "no"}
+
+
+def _empty_sketch(groups):
+    sketch = {"count": np.zeros(groups), "total": np.zeros((groups, len(METRICS))),
+              "total_sq": np.zeros((groups, len(METRICS))), "min": np.full((groups, len(METRICS)), np.inf),
+              "max": np.full((groups, len(METRICS)), -np.inf),
+              "hist": np.zeros((groups, len(METRICS), len(BIN_EDGES) - 1), dtype=np.int64)}
+    return sketch
+
+
+def _vehicle_groups(route_file, chunk_size):
+    """从路线文件读取每辆车的(路线, 车辆类别)分组，返回(分组名数组（路线与类别以制表符连接）, 以车辆ID为下标的分组序号数组)。"""
+    """Read the (route, vehicle class) group of every vehicle from a route file; returns (group names (route and class joined by a tab), group index array indexed by vehicle ID)."""
+    ids, pairs = [], []
+    for kind in ("vehicles", "flows"):
+        for chunk in iter_output_chunks(route_file, kind, chunk_size):
+            ids.append(chunk["id"].astype(np.int64))
+            pairs.append(np.char.add(np.char.add(chunk["route"], "\t"), vehicle_class(chunk["type"])))
+    ids = np.concatenate(ids)
+    names, inverse = np.unique(np.concatenate(pairs), return_inverse=True)
+    groups = np.full(ids.max() + 1, -1, dtype=np.int64)
+    groups[ids] = inverse
+    return names, groups
+
+
+def summarize_run(tripinfo_file, route_file, conditions, chunk_size=65536):
+    """逐块读取一次运行的tripinfo输出，返回按(路线, 车辆类别, 天气, 事件)分组的草图{"keys": {维度: 数组}, 统计量: 数组}。
+    不在路线文件中的车辆被跳过。"""
+    """Read the tripinfo output of one run chunk by chunk and return the sketch grouped by (route, vehicle class, weather, incident): {"keys": {dimension: array}, statistic: array}.
+    Vehicles that are not in the route file are skipped."""
+    names, groups = _vehicle_groups(route_file, chunk_size)
+    sketch = _empty_sketch(len(names))
+    for chunk in iter_output_chunks(tripinfo_file, "tripinfo", chunk_size):
+        values = np.stack([np.nan_to_num(chunk[column]) for column in METRICS.values()], axis=1)
+        # flow的车辆ID为"<flow ID>.<序号>" Vehicles of a flow are named "<flow ID>.<n>"
+        prefixes = np.char.partition(chunk["id"], ".")[:, 0]
+        numeric = np.char.isdigit(prefixes)
+        ids = np.zeros(len(prefixes), dtype=np.int64)
+        ids[numeric] = prefixes[numeric].astype(np.int64)
+        # 路线文件之外的车辆（如事件阻塞车辆）不属于任何分组 Vehicles outside the route file (e.g. incident blockers) belong to no group
+        known = numeric & (ids < len(groups))
+        known[known] = groups[ids[known]] >= 0
+        _accumulate(sketch, groups[ids[known]], values[known])
+
+    # 去掉没有车辆完成行程的分组 Drop the groups without finished trips
+    used = sketch["count"] > 0
+    sketch = {name: values[used] for name, values in sketch.items()}
+    pairs = np.char.partition(names[used], "\t")
+    sketch["keys"] = {
+        "route": pairs[:, 0],
+        "vclass": pairs[:, 2],
+        "weather": np.full(len(pairs), conditions.get("weather", "clear")),
+        "incident": np.full(len(pairs), conditions.get("incident", "no")),
+    }
+    return sketch
+
+
+def _accumulate(sketch, rows, values):
+    """把values[车辆, 指标]按rows（分组序号）累加到草图中。"""
+    """Add values[vehicle, metric] into the sketch by rows (group indices)."""
+    np.add.at(sketch["count"], rows, 1)
+    np.add.at(sketch["total"], rows, values)
+    np.add.at(sketch["total_sq"], rows, values ** 2)
+    np.minimum.at(sketch["min"], rows, values)
+    np.maximum.at(sketch["max"], rows, values)
+    bins = np.clip(np.searchsorted(BIN_EDGES, values, side="right") - 1, 0, len(BIN_EDGES) - 2)
+    metric = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    np.add.at(sketch["hist"], (np.broadcast_to(rows[:, None], values.shape), metric, bins), 1)
+
+
+def merge_sketches(sketches):
+    """合并多个草图：相同键的分组逐项相加（最小值/最大值取极值）。"""
+    """Merge several sketches: groups with the same key are added up (min/max take the extremes)."""
+    keys = {name: np.concatenate([sketch["keys"][name] for sketch in sketches]) for name in DIMENSIONS}
+    joined = np.char.add(keys["route"], "\t")
+    for name in DIMENSIONS[1:]:
+        joined = np.char.add(np.char.add(joined, keys[name]), "\t")
+    _, first, rows = np.unique(joined, return_index=True, return_inverse=True)
+    merged = _empty_sketch(len(first))
+    merged["keys"] = {name: values[first] for name, values in keys.items()}
+    np.add.at(merged["count"], rows, np.concatenate([sketch["count"] for sketch in sketches]))
+    for name, ufunc in (("total", np.add), ("total_sq", np.add), ("min", np.minimum), ("max", np.maximum),
+                        ("hist", np.add)):
+        ufunc.at(merged[name], rows, np.concatenate([sketch[name] for sketch in sketches]))
+    return merged
+
+
+def _quantiles(hist, low, high, quantiles):
+    """由直方图估计分位数：在分箱内线性插值，并限制在[最小值, 最大值]内。hist为[分组, 分箱]。"""
+    """Estimate quantiles from histograms by linear interpolation inside the bin, clamped to [min, max]. hist is [group, bin]."""
+    cumulative = np.cumsum(hist, axis=1)
+    total = cumulative[:, -1:]
+    result = np.empty((len(hist), len(quantiles)))
+    for j, q in enumerate(quantiles):
+        target = q * total[:, 0]
+        bins = np.minimum((cumulative < target[:, None]).sum(axis=1), hist.shape[1] - 1)
+        below = np.where(bins > 0, cumulative[np.arange(len(hist)), bins - 1], 0)
+        inside = hist[np.arange(len(hist)), bins]
+        fraction = np.divide(target - below, inside, out=np.zeros(len(hist)), where=inside > 0)
+        value = BIN_EDGES[bins] + fraction * (BIN_EDGES[bins + 1] - BIN_EDGES[bins])
+        result[:, j] = np.clip(value, low, high)
+    return result
+
+
+def _save(path, sketch, **extra):
+    arrays = {f"key_{name}": values for name, values in sketch["keys"].items()}
+    arrays.update({name: sketch[name] for name in _STATS + ("hist",)})
+    arrays.update(extra)
+    # 先写临时文件再重命名 Write a temporary file, then rename it
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _load(path):
+    with np.load(path) as data:
+        sketch = {name: data[name] for name in _STATS + ("hist",)}
+        sketch["keys"] = {name: data[f"key_{name}"] for name in DIMENSIONS}
+        runs = data["runs"] if "runs" in data.files else None
+    return sketch, runs
+
+
+class KPIStore:
+    """增量KPI存储。每次运行一个文件，可由多个进程并行写入；查询时把新增的运行合并到汇总文件中。"""
+    """Incremental KPI store. One file per run, so several processes can write in parallel; queries merge the new runs into the aggregate file."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.runs_dir = os.path.join(store_dir, "runs")
+        self.aggregate_file = os.path.join(store_dir, "aggregate.npz")
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self._aggregate = None
+        self._merged_runs = set()
+
+    def add_run(self, run_id, tripinfo_file, route_file, conditions=None, chunk_size=65536):
+        """汇总一次运行并写入存储（相同run_id重复写入时覆盖尚未合并的摘要）。"""
+        """Summarize one run and write it to the store (writing the same run_id again replaces a summary not merged yet)."""
+        sketch = summarize_run(tripinfo_file, route_file, conditions or {}, chunk_size)
+        _save(os.path.join(self.runs_dir, f"{run_id}.npz"), sketch)
+        return sketch
+
+    def refresh(self):
+        """把尚未合并的运行合并到汇总文件，返回新合并的运行数。"""
+        """Merge the runs not merged yet into the aggregate file and return the number of newly merged runs."""
+        if self._aggregate is None and os.path.exists(self.aggregate_file):
+            self._aggregate, runs = _load(self.aggregate_file)
+            self._merged_runs = set(runs.tolist())
+        pending = sorted(name[:-len(".npz")] for name in os.listdir(self.runs_dir)
+                         if name.endswith(".npz") and ".tmp" not in name
+                         and name[:-len(".npz")] not in self._merged_runs)
+        if not pending:
+            return 0
+        sketches = [_load(os.path.join(self.runs_dir, f"{run_id}.npz"))[0] for run_id in pending]
+        if self._aggregate is not None:
+            sketches.insert(0, self._aggregate)
+        self._aggregate = merge_sketches(sketches)
+        self._merged_runs.update(pending)
+        _save(self.aggregate_file, self._aggregate, runs=np.array(sorted(self._merged_runs), dtype=str))
+        return len(pending)
+
+    @property
+    def num_runs(self):
+        self.refresh()
+        return len(self._merged_runs)
+
+    def query(self, by=("route",), where=None, metric="delay", quantiles=QUANTILES):
+        """按by中的维度分组查询指标：返回[{维度: 值, "vehicles", "mean", "std", "min", "max", "p50", ...}]。
+        where为{维度: 值或值的列表}的过滤条件。"""
+        """Query a metric grouped by the dimensions in by: returns [{dimension: value, "vehicles", "mean", "std", "min", "max", "p50", ...}].
+        where filters by {dimension: value or list of values}."""
+        self.refresh()
+        if self._aggregate is None:
+            return []
+        column = list(METRICS).index(metric)
+        keys = self._aggregate["keys"]
+        mask = np.ones(len(self._aggregate["count"]), dtype=bool)
+        for name, values in (where or {}).items():
+            mask &= np.isin(keys[name], [values] if isinstance(values, str) else list(values))
+        selected = {name: self._aggregate[name][mask] for name in _STATS + ("hist",)}
+        selected["keys"] = {name: values[mask] for name, values in keys.items()}
+        if not mask.any():
+            return []
+
+        # 把未参与分组的维度合并掉 Collapse the dimensions not grouped by
+        collapsed = {name: (values if name in by else np.full(len(values), "")) for name, values in
+                     selected["keys"].items()}
+        merged = merge_sketches([dict(selected, keys=collapsed)])
+        count = merged["count"]
+        mean = merged["total"][:, column] / count
+        variance = np.maximum(merged["total_sq"][:, column] / count - mean ** 2, 0.0)
+        low, high = merged["min"][:, column], merged["max"][:, column]
+        estimates = _quantiles(merged["hist"][:, column], low, high, quantiles)
+        results = []
+        for i in range(len(count)):
+            row = {name: str(merged["keys"][name][i]) for name in by}
+            row.update({"vehicles": int(count[i]), "mean": float(mean[i]), "std": float(np.sqrt(variance[i])),
+                        "min": float(low[i]), "max": float(high[i])})
+            row.update({f"p{round(q * 100):d}": float(estimates[i, j]) for j, q in enumerate(quantiles)})
+            results.append(row)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental KPI store across scenario runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add = subparsers.add_parser("add", help="summarize one run into the store")
+    add.add_argument("--store", required=True)
+    add.add_argument("--run", required=True, help="unique run ID")
+    add.add_argument("--tripinfo", required=True)
+    add.add_argument("--routes", required=True, help="route file generated for the run")
+    add.add_argument("--weather", default="clear")
+    add.add_argument("--incident", default="no", choices=["yes", "no"])
+
+    query = subparsers.add_parser("query", help="query the aggregated KPIs")
+    query.add_argument("--store", required=True)
+    query.add_argument("--by", nargs="*", default=["route"], choices=DIMENSIONS)
+    query.add_argument("--metric", default="delay", choices=list(METRICS))
+    query.add_argument("--where", default=None, help='JSON filter, e.g. \'{"weather": "rain"}\'')
+
+    args = parser.parse_args()
+    store = KPIStore(args.store)
+    if args.command == "add":
+        store.add_run(args.run, args.tripinfo, args.routes, {"weather": args.weather, "incident": args.incident})
+    else:
+        where = json.loads(args.where) if args.where else None
+        print(json.dumps(store.query(args.by, where, args.metric), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
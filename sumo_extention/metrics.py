@@ -0,0 +1,137 @@
+"""
+生成过程的计时、计数与性能分析
+Timing, counters and profiling of scenario generation.
+
+GenerationMetrics记录每个阶段（采样、归并、序列化、附加文件等）的耗时和可选的内存峰值（tracemalloc），以及生成过程中
+顺带统计的计数器（车辆数、事件数、rerouter数等），可导出为JSON报告。profile=True时用cProfile记录整个生成过程，
+报告中附带累计耗时最多的函数，便于定位性能回退。
+
+GenerationMetrics records the wall time and optionally the peak memory (tracemalloc) of every stage (sampling,
+merging, serialization, additional files, ...) plus counters collected during generation (vehicles, incidents,
+rerouters, ...) and exports them as a JSON report. With profile=True the whole generation runs under cProfile and the
+report lists the functions with the highest cumulative time, to localize regressions.
+
+日志 Logging:
+    各模块的文字输出通过logging（logger名为模块名，如"autoscript"）发出；作为库使用时默认不输出，
+    configure_logging()按指定级别输出到标准输出。逐辆的特殊车辆信息为DEBUG级别。
+    Text output of the modules goes through logging (loggers named after the modules, e.g. "autoscript"); used as a
+    library nothing is printed by default, and configure_logging() prints to stdout at the given level. Per-vehicle
+    messages about special vehicles are at DEBUG level.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import pstats
+import sys
+import time
+import tracemalloc
+
+LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+def configure_logging(verbosity="info", stream=None):
+    """把日志按verbosity（"debug"/"info"/"warning"/"error"或logging级别）以纯文本输出到stream（默认标准输出）。"""
+    """Send log records at verbosity ("debug"/"info"/"warning"/"error" or a logging level) as plain text to stream (stdout by default)."""
+    level = LOG_LEVELS[verbosity] if isinstance(verbosity, str) else verbosity
+    logging.basicConfig(level=level, format="%(message)s", stream=stream or sys.stdout, force=True)
+
+
+class GenerationMetrics:
+    """一次生成过程的阶段计时和计数器。memory=True时记录每个阶段的内存峰值，profile=True时启用cProfile。"""
+    """Stage timings and counters of one generation run. memory=True records the peak memory of every stage, profile=True enables cProfile."""
+
+    def __init__(self, memory=False, profile=False):
+        self.memory = memory
+        self.stages = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+        self._started_tracemalloc = False
+        self._memory_frames = []  # 每个进行中的阶段的[起始内存, 峰值] [start memory, peak] of every open stage
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """计时一个阶段；同名阶段多次出现时累加。阶段可以嵌套，外层阶段的内存峰值包含内层阶段。"""
+        """Time one stage; repeated stages of the same name add up. Stages may nest, and the peak memory of an outer stage includes its inner stages."""
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            # reset_peak()会清掉外层阶段的峰值，先把它记到外层的帧里 reset_peak() clears the peak of the outer stages, so fold it into their frames first
+            self._note_peak(tracemalloc.get_traced_memory()[1])
+            self._memory_frames.append([tracemalloc.get_traced_memory()[0], 0])
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"seconds": 0.0})
+            entry["seconds"] += time.perf_counter() - start
+            if self.memory:
+                self._note_peak(tracemalloc.get_traced_memory()[1])
+                baseline, peak = self._memory_frames.pop()
+                entry["peak_bytes"] = max(entry.get("peak_bytes", 0), peak - baseline)
+
+    def _note_peak(self, peak):
+        for frame in self._memory_frames:
+            frame[1] = max(frame[1], peak)
+
+    def timed_iter(self, name, iterable):
+        """包装一个迭代器，把花在其next()中的时间计入name阶段（不含消费者的时间），用于流水线中的归并等阶段。"""
+        """Wrap an iterator so the time spent inside its next() counts towards stage name (excluding the consumer's time), for stages of a streaming pipeline such as merging."""
+        entry = self.stages.setdefault(name, {"seconds": 0.0})
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                entry["seconds"] += time.perf_counter() - start
+                return
+            entry["seconds"] += time.perf_counter() - start
+            yield item
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def profiling(self):
+        """在profile=True时用cProfile记录代码块。"""
+        """Record the block with cProfile when profile=True."""
+        if self.profiler is None:
+            yield
+            return
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def report(self, top=20):
+        """返回报告字典{"stages", "counters", "total_seconds"}，启用cProfile时另有"profile"（累计耗时前top的函数）。"""
+        """Return the report dict {"stages", "counters", "total_seconds"}, plus "profile" (the top functions by cumulative time) when cProfile is enabled."""
+        report = {"stages": self.stages, "counters": self.counters,
+                  "total_seconds": self.stages.get("total", {}).get("seconds")}
+        if self.profiler is not None:
+            stats = pstats.Stats(self.profiler, stream=io.StringIO())
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+            report["profile"] = [{"function": f"{filename}:{line}({function})", "calls": calls,
+                                  "total_seconds": total_time, "cumulative_seconds": cumulative_time}
+                                 for (filename, line, function), (_, calls, total_time, cumulative_time, _) in rows]
+        return report
+
+    def write_json(self, path, top=20):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(top), f, indent=2, ensure_ascii=False)
+
+    def dump_profile(self, path):
+        """把cProfile结果保存为pstats文件（可用snakeviz等工具查看）。"""
+        """Save the cProfile results as a pstats file (for snakeviz and similar tools)."""
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
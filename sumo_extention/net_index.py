@@ -0,0 +1,384 @@
+"""
+路网拓扑索引
+Precompiled topology index of a SUMO .net.xml.
+
+将net.net.xml解析一次为紧凑的numpy数组（edge、lane的长度与限速、lane到lane的connection及转向、
+junction的incLanes/intLanes），并缓存为同目录下的.npz文件，路网文件内容变化（哈希不同）时自动重建。
+之后的路线定义、事故车道选择、车道关闭安全性检查都只需O(1)查表，无需重复解析XML；
+也可以在edge连接图上枚举所有可行的OD路线，并在写文件前校验用户给定的路线。
+
+Parses net.net.xml once into compact numpy arrays (edges, lanes with lengths and speeds, lane-to-lane connections with
+their direction, junction incLanes/intLanes) and caches them as an .npz next to the network file; the cache is rebuilt
+whenever the network content (its hash) changes. Route definitions, accident lane choice and lane closure checks then
+become O(1) lookups instead of repeated XML parsing. The edge connection graph is also used to enumerate every feasible
+OD route and to validate user-supplied routes before anything is written.
+"""
+import hashlib
+import heapq
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+INDEX_VERSION = 2  # 索引格式版本，格式变化时使旧缓存失效 Index format version; bumping it invalidates old caches
+
+# 进程内已加载的索引，按(路径, 修改时间, 大小)记忆 Indexes loaded in this process, memoized on (path, mtime, size)
+_loaded_indexes = {}
+
+
+def _file_hash(path):
+    """路网文件内容的SHA-256。"""
+    """SHA-256 of the network file content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _csr(groups):
+    """将列表的列表压缩为(偏移量, 扁平数组)。"""
+    """Pack a list of lists into (offsets, flat array)."""
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(group) for group in groups])
+    flat = np.array([item for group in groups for item in group], dtype=np.int64)
+    return offsets, flat
+
+
+def parse_network(net_file):
+    """用iterparse解析.net.xml，返回由numpy数组组成的字典（即.npz缓存的内容）。"""
+    """Parse a .net.xml with iterparse and return a dict of numpy arrays (the content of the .npz cache)."""
+    edge_ids, edge_from, edge_to, edge_function, edge_lane_start, edge_lane_count = [], [], [], [], [], []
+    lane_ids, lane_edge, lane_index, lane_length, lane_speed = [], [], [], [], []
+    connections = []
+    junction_ids, junction_type, junction_inc, junction_int = [], [], [], []
+    junction_foes = []
+
+    for _, elem in ET.iterparse(net_file, events=("end",)):
+        if elem.tag == "edge":
+            edge_idx = len(edge_ids)
+            edge_ids.append(elem.get("id"))
+            edge_from.append(elem.get("from", ""))
+            edge_to.append(elem.get("to", ""))
+            edge_function.append(elem.get("function", "normal"))
+            lanes = elem.findall("lane")
+            edge_lane_start.append(len(lane_ids))
+            edge_lane_count.append(len(lanes))
+            for lane in lanes:
+                lane_ids.append(lane.get("id"))
+                lane_edge.append(edge_idx)
+                lane_index.append(int(lane.get("index")))
+                lane_length.append(float(lane.get("length")))
+                lane_speed.append(float(lane.get("speed")))
+            elem.clear()
+        elif elem.tag == "junction":
+            junction_ids.append(elem.get("id"))
+            junction_type.append(elem.get("type", ""))
+            junction_inc.append(elem.get("incLanes", "").split())
+            junction_int.append(elem.get("intLanes", "").split())
+            # request的foes字符串中从右数第j位表示与第j个link冲突 Bit j from the right of a request's foes marks a conflict with link j
+            requests = sorted(elem.findall("request"), key=lambda request: int(request.get("index")))
+            junction_foes.append([bit == "1" for request in requests for bit in reversed(request.get("foes", ""))])
+            elem.clear()
+        elif elem.tag == "connection":
+            connections.append((elem.get("from"), elem.get("to"), int(elem.get("fromLane")), int(elem.get("toLane")),
+                                elem.get("via", ""), elem.get("dir", ""), elem.get("tl", ""),
+                                int(elem.get("linkIndex", -1))))
+            elem.clear()
+
+    lane_lookup = {lane_id: i for i, lane_id in enumerate(lane_ids)}
+    # connection的车道ID为"{edge}_{index}" Connection lanes are named "{edge}_{index}"
+    conn_from_lane = [lane_lookup[f"{c[0]}_{c[2]}"] for c in connections]
+    conn_to_lane = [lane_lookup[f"{c[1]}_{c[3]}"] for c in connections]
+    conn_via_lane = [lane_lookup.get(c[4], -1) for c in connections]
+    inc_offsets, inc_lanes = _csr([[lane_lookup[lane] for lane in lanes if lane in lane_lookup]
+                                   for lanes in junction_inc])
+    int_offsets, int_lanes = _csr([[lane_lookup[lane] for lane in lanes if lane in lane_lookup]
+                                   for lanes in junction_int])
+    foes_offsets, foes_flat = _csr(junction_foes)
+
+    return {
+        "edge_ids": np.array(edge_ids, dtype=str),
+        "edge_from": np.array(edge_from, dtype=str),
+        "edge_to": np.array(edge_to, dtype=str),
+        "edge_function": np.array(edge_function, dtype=str),
+        "edge_lane_start": np.array(edge_lane_start, dtype=np.int64),
+        "edge_lane_count": np.array(edge_lane_count, dtype=np.int64),
+        "lane_ids": np.array(lane_ids, dtype=str),
+        "lane_edge": np.array(lane_edge, dtype=np.int64),
+        "lane_index": np.array(lane_index, dtype=np.int64),
+        "lane_length": np.array(lane_length, dtype=np.float64),
+        "lane_speed": np.array(lane_speed, dtype=np.float64),
+        "conn_from_lane": np.array(conn_from_lane, dtype=np.int64),
+        "conn_to_lane": np.array(conn_to_lane, dtype=np.int64),
+        "conn_via_lane": np.array(conn_via_lane, dtype=np.int64),
+        "conn_dir": np.array([c[5] for c in connections], dtype="<U1"),
+        "conn_tl": np.array([c[6] for c in connections], dtype=str),
+        "conn_link_index": np.array([c[7] for c in connections], dtype=np.int64),
+        "junction_ids": np.array(junction_ids, dtype=str),
+        "junction_type": np.array(junction_type, dtype=str),
+        "junction_inc_offsets": inc_offsets,
+        "junction_inc_lanes": inc_lanes,
+        "junction_int_offsets": int_offsets,
+        "junction_int_lanes": int_lanes,
+        "junction_foe_offsets": foes_offsets,
+        "junction_foe_bits": foes_flat.astype(bool),
+    }
+
+
+class NetworkIndex:
+    """路网索引：数组保存在属性中（如lane_length、conn_dir），并提供按ID的O(1)查找。"""
+    """Network index: the arrays are attributes (lane_length, conn_dir, ...) with O(1) lookups by ID."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.edge_lookup = {edge_id: i for i, edge_id in enumerate(self.edge_ids.tolist())}
+        self.lane_lookup = {lane_id: i for i, lane_id in enumerate(self.lane_ids.tolist())}
+        self.junction_lookup = {junction_id: i for i, junction_id in enumerate(self.junction_ids.tolist())}
+
+        # 只考虑普通edge之间的connection（不含内部车道） Only connections between normal edges (no internal lanes)
+        normal = self.edge_function[self.lane_edge[self.conn_from_lane]] != "internal"
+        # 每条车道的出发connection（CSR） Outgoing connections of every lane (CSR)
+        order = np.argsort(self.conn_from_lane[normal], kind="stable")
+        self._lane_conns = np.flatnonzero(normal)[order]
+        counts = np.bincount(self.conn_from_lane[self._lane_conns], minlength=len(self.lane_ids))
+        self._lane_conn_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        # edge级别的有向图：edge -> 可直接驶入的下游edge集合
+        # Edge-level digraph: edge -> set of downstream edges it connects to directly
+        self.edge_successors = [set() for _ in range(len(self.edge_ids))]
+        for from_edge, to_edge in zip(self.lane_edge[self.conn_from_lane[self._lane_conns]].tolist(),
+                                      self.lane_edge[self.conn_to_lane[self._lane_conns]].tolist()):
+            self.edge_successors[from_edge].add(to_edge)
+        self.edge_length = self.lane_length[self.edge_lane_start]  # 取第一条车道的长度 Length of the first lane
+        self._routes = {}  # 按k记忆的路线枚举结果 Route enumeration results memoized per k
+
+    def edge_lanes(self, edge_id):
+        """返回edge上所有车道的索引（按车道index从右到左）。"""
+        """Return the lane indices of an edge (ordered by lane index, right to left)."""
+        i = self.edge_lookup[edge_id]
+        start = self.edge_lane_start[i]
+        return np.arange(start, start + self.edge_lane_count[i])
+
+    def lane_connections(self, lane):
+        """返回从车道出发的connection索引，lane可以是车道ID或索引。"""
+        """Return the indices of the connections leaving a lane; lane is a lane ID or index."""
+        if isinstance(lane, str):
+            lane = self.lane_lookup[lane]
+        return self._lane_conns[self._lane_conn_offsets[lane]:self._lane_conn_offsets[lane + 1]]
+
+    def lane_movements(self, lane):
+        """返回车道允许的转向集合，如{"s", "l"}。"""
+        """Return the set of movements (directions) a lane allows, e.g. {"s", "l"}."""
+        return set(self.conn_dir[self.lane_connections(lane)].tolist())
+
+    def lane_targets(self, lane):
+        """返回车道可以驶入的下游edge ID集合。"""
+        """Return the set of downstream edge IDs a lane leads to."""
+        return set(self.edge_ids[self.lane_edge[self.conn_to_lane[self.lane_connections(lane)]]].tolist())
+
+    def closure_safe(self, lane):
+        """车道关闭后，同一edge上其余车道仍能到达它所服务的所有下游edge时返回True。"""
+        """True if, with this lane closed, the other lanes of its edge still reach every downstream edge it serves."""
+        return self.closures_safe([lane])
+
+    def closures_safe(self, lanes):
+        """同一edge上的lanes同时关闭后，该edge至少还有一条车道可用，且其余车道仍能到达关闭车道所服务的所有下游edge时返回True。"""
+        """True if, with all of lanes (of one edge) closed at once, the edge keeps at least one open lane and the open lanes still reach every downstream edge the closed ones serve."""
+        closed = {self.lane_lookup[lane] if isinstance(lane, str) else int(lane) for lane in lanes}
+        edge_id = self.edge_ids[self.lane_edge[next(iter(closed))]]
+        targets = set()
+        remaining = set()
+        open_lanes = 0
+        for other in self.edge_lanes(edge_id).tolist():
+            if other in closed:
+                targets |= self.lane_targets(other)
+            else:
+                remaining |= self.lane_targets(other)
+                open_lanes += 1
+        return open_lanes > 0 and targets <= remaining
+
+    def accident_lane(self, edge_id, preferred_index=1):
+        """为edge选择事故车道：优先使用preferred_index（原先固定的"_1"），若关闭它会切断某个转向则改用最近的可安全关闭的车道；
+        没有可安全关闭的车道时返回None。"""
+        """Choose the accident lane of an edge: preferred_index (the former fixed "_1") unless closing it cuts off a movement,
+        in which case the nearest lane that can be closed safely is used. Returns None if no lane can be closed safely."""
+        lanes = self.edge_lanes(edge_id).tolist()
+        for lane in sorted(lanes, key=lambda lane: abs(int(self.lane_index[lane]) - preferred_index)):
+            if self.closure_safe(lane):
+                return str(self.lane_ids[lane])
+        return None
+
+    def normal_edges(self):
+        """返回所有非内部edge的索引。"""
+        """Return the indices of all non-internal edges."""
+        return np.flatnonzero(self.edge_function != "internal")
+
+    def shortest_path(self, from_edge, to_edge, banned_edges=(), banned_links=()):
+        """按edge长度求from_edge到to_edge的最短路径（Dijkstra），返回edge索引列表，不可达时返回None。"""
+        """Shortest path from from_edge to to_edge by edge length (Dijkstra). Returns a list of edge indices, or None if unreachable."""
+        distances = {from_edge: 0.0}
+        previous = {}
+        heap = [(0.0, from_edge)]
+        while heap:
+            distance, edge = heapq.heappop(heap)
+            if edge == to_edge:
+                path = [edge]
+                while path[-1] != from_edge:
+                    path.append(previous[path[-1]])
+                return path[::-1]
+            if distance > distances[edge]:
+                continue
+            for successor in self.edge_successors[edge]:
+                if successor in banned_edges or (edge, successor) in banned_links:
+                    continue
+                candidate = distance + float(self.edge_length[successor])
+                if candidate < distances.get(successor, float("inf")):
+                    distances[successor] = candidate
+                    previous[successor] = edge
+                    heapq.heappush(heap, (candidate, successor))
+        return None
+
+    def path_length(self, path):
+        """路径（edge索引列表）的总长度。"""
+        """Total length of a path (list of edge indices)."""
+        return float(self.edge_length[path].sum())
+
+    def k_shortest_paths(self, from_edge, to_edge, k=1):
+        """Yen算法求前k条无环最短路径，返回edge索引列表的列表。"""
+        """Yen's algorithm for the k shortest loopless paths; returns a list of edge index lists."""
+        first = self.shortest_path(from_edge, to_edge)
+        if first is None:
+            return []
+        paths = [first]
+        candidates = []
+        while len(paths) < k:
+            last = paths[-1]
+            for i in range(len(last) - 1):
+                spur_edge, root = last[i], last[:i + 1]
+                banned_links = {(path[i], path[i + 1]) for path in paths if path[:i + 1] == root}
+                spur = self.shortest_path(spur_edge, to_edge, banned_edges=set(root[:-1]), banned_links=banned_links)
+                if spur is not None:
+                    candidate = root[:-1] + spur
+                    if candidate not in paths and all(candidate != c for _, c in candidates):
+                        heapq.heappush(candidates, (self.path_length(candidate), candidate))
+            if not candidates:
+                break
+            paths.append(heapq.heappop(candidates)[1])
+        return paths
+
+    def enumerate_routes(self, k=1):
+        """枚举所有可行的OD路线：起点为没有上游的edge，终点为没有下游的edge，每个OD对取前k条最短路径。
+        返回route_definitions格式的列表[{"route_id", "edges"}]，结果按k记忆。"""
+        """Enumerate every feasible OD route: origins are edges without upstream edges, destinations edges without downstream edges, with the k shortest paths per OD pair.
+        Returns a list in the route_definitions format [{"route_id", "edges"}]; results are memoized per k."""
+        if k in self._routes:
+            return self._routes[k]
+        normal = self.normal_edges().tolist()
+        has_upstream = set()
+        for edge in normal:
+            has_upstream |= self.edge_successors[edge]
+        origins = [edge for edge in normal if edge not in has_upstream]
+        destinations = [edge for edge in normal if not self.edge_successors[edge]]
+
+        routes = []
+        for origin in origins:
+            for destination in destinations:
+                for rank, path in enumerate(self.k_shortest_paths(origin, destination, k)):
+                    route_id = f"{self.edge_ids[origin]}_to_{self.edge_ids[destination]}"
+                    routes.append({"route_id": route_id if rank == 0 else f"{route_id}_{rank}",
+                                   "edges": " ".join(self.edge_ids[path].tolist())})
+        self._routes[k] = routes
+        return routes
+
+    def route_error(self, edges):
+        """检查路线（空格分隔的edge ID字符串）能否在路网上行驶，可行时返回None，否则返回错误描述。"""
+        """Check whether a route (space-separated edge IDs) is drivable on the network. Returns None if it is, otherwise an error description."""
+        edge_list = edges.split()
+        if not edge_list:
+            return "empty route"
+        for edge_id in edge_list:
+            if edge_id not in self.edge_lookup:
+                return f"unknown edge {edge_id}"
+        for from_id, to_id in zip(edge_list, edge_list[1:]):
+            if self.edge_lookup[to_id] not in self.edge_successors[self.edge_lookup[from_id]]:
+                return f"no connection from {from_id} to {to_id}"
+        return None
+
+    def validate_routes(self, route_definitions):
+        """校验route_definitions中的所有路线，存在不可行路线时抛出ValueError并列出全部错误。"""
+        """Validate every route of route_definitions; raises ValueError listing all errors if any route is not drivable."""
+        errors = []
+        for route_def in route_definitions:
+            error = self.route_error(route_def["edges"])
+            if error is not None:
+                errors.append(f"{route_def['route_id']} ({route_def['edges']}): {error}")
+        if errors:
+            raise ValueError("invalid routes: " + "; ".join(errors))
+
+    def junction_incoming_lanes(self, junction_id):
+        """返回junction的incLanes车道索引。"""
+        """Return the lane indices listed in the junction's incLanes."""
+        i = self.junction_lookup[junction_id]
+        return self.junction_inc_lanes[self.junction_inc_offsets[i]:self.junction_inc_offsets[i + 1]]
+
+    def junction_internal_lanes(self, junction_id):
+        """返回junction的intLanes车道索引。"""
+        """Return the lane indices listed in the junction's intLanes."""
+        i = self.junction_lookup[junction_id]
+        return self.junction_int_lanes[self.junction_int_offsets[i]:self.junction_int_offsets[i + 1]]
+
+    def junction_links(self, junction_id):
+        """返回junction的link（按link/request索引顺序）对应的connection索引：按incLanes顺序，每条车道的connection依次排列。"""
+        """Return the connection indices of the junction's links in link (request) index order: incLanes order, each lane's connections in turn."""
+        return np.concatenate([self.lane_connections(lane) for lane in self.junction_incoming_lanes(junction_id).tolist()]
+                              or [np.zeros(0, dtype=np.int64)])
+
+    def junction_foes(self, junction_id):
+        """返回junction的冲突矩阵（布尔数组[link, link]，对称）。"""
+        """Return the junction's conflict matrix (symmetric boolean array [link, link])."""
+        i = self.junction_lookup[junction_id]
+        flat = self.junction_foe_bits[self.junction_foe_offsets[i]:self.junction_foe_offsets[i + 1]]
+        n = int(round(len(flat) ** 0.5))
+        foes = flat.reshape(n, n)
+        return foes | foes.T
+
+
+def index_path(net_file):
+    """路网索引缓存文件路径（与路网文件同目录）。"""
+    """Path of the cached index, next to the network file."""
+    return f"{net_file}.index.npz"
+
+
+def load_network_index(net_file, use_cache=True):
+    """加载路网索引：优先使用进程内记忆，其次是哈希一致的.npz缓存，否则解析XML并写入缓存。"""
+    """Load the network index: from the in-process memo if possible, then from an .npz cache with a matching hash, otherwise parse the XML and write the cache."""
+    stat = os.stat(net_file)
+    memo_key = (os.path.abspath(net_file), stat.st_mtime_ns, stat.st_size)
+    if memo_key in _loaded_indexes:
+        return _loaded_indexes[memo_key]
+
+    source_hash = _file_hash(net_file)
+    cache_file = index_path(net_file)
+    arrays = None
+    if use_cache and os.path.exists(cache_file):
+        with np.load(cache_file, allow_pickle=False) as cached:
+            if str(cached["source_hash"]) == source_hash and int(cached["version"]) == INDEX_VERSION:
+                arrays = {name: cached[name] for name in cached.files if name not in ("source_hash", "version")}
+    if arrays is None:
+        arrays = parse_network(net_file)
+        if use_cache:
+            try:
+                # 先写临时文件再替换，避免并行进程读到写了一半的缓存
+                # Write to a temporary file and replace, so parallel processes never read a half-written cache
+                tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+                np.savez(tmp_file, source_hash=source_hash, version=INDEX_VERSION, **arrays)
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                pass  # 路网目录只读时不缓存 Do not cache when the network directory is read-only
+
+    index = NetworkIndex(arrays)
+    _loaded_indexes[memo_key] = index
+    return index
@@ -0,0 +1,279 @@
+"""
+紧急车辆信号优先
+Emergency vehicle signal preemption.
+
+紧急车辆的出发时间和路线在生成时就已知道，因此可以离线预测每辆车到达J0停车线的时间（路线上J0之前各edge的长度、
+限速与车辆类型的加速度），并把优先相位直接写进一个定时tlLogic：在预测到达前lead秒放行该车辆所在进口道的相位
+（必要时先截断当前相位并插入黄灯与全红，但保证已放行相位的最短绿灯），到达后保持hold秒，再从下一个相位组恢复原配时。
+定时tlLogic会循环，因此优先配时只写到最后一次优先后原配时回到周期起点为止，之后由WAUT切换到原配时的恢复方案，
+优先相位不会在没有紧急车辆时重复。仿真时不需要任何TraCI调用。
+
+Departure times and routes of emergency vehicles are known at generation time, so the time each one reaches the stop
+line of J0 can be predicted offline (lengths and speed limits of the route's edges before J0 plus the vehicle type's
+acceleration) and the preemption phases baked into one fixed-time tlLogic: the stage serving the vehicle's approach
+turns green lead seconds before the predicted arrival (truncating the running stage with yellow and all-red where
+needed, but never below its minimum green), stays green for hold seconds after it, and the original plan resumes with
+the following stage. A fixed-time tlLogic loops, so the baked program only runs until the original plan is back at
+the start of its cycle after the last preemption; a WAUT then switches to a resume program with the original plan, so
+the preemption phases never repeat without an emergency vehicle. The simulation needs no TraCI calls at all.
+
+报告 Report:
+    离线估计（无需SUMO）：每辆紧急车辆在原配时与优先配时下到达停车线时需要等待绿灯的时间，以及各相位组绿灯时间的变化
+    （被占用的绿灯即横向交通承受的代价）。有SUMO输出时，compare_tripinfo()比较两次运行的紧急车辆行程时间与其他车辆的延误。
+    Offline estimate (no SUMO needed): the time every emergency vehicle would wait for green at the stop line under the
+    original and the preempted plan, and the change of green time per stage (green taken from the cross traffic). With
+    SUMO outputs, compare_tripinfo() compares the emergency travel times and the delay of all other vehicles of two runs.
+
+用法 Usage:
+    场景中 In a scenario: "signal_plan": {"type": "static", "cycle": 90, "preemption": {"lead": 5, "hold": 5}}
+    python preemption.py compare --baseline base/tripinfo.xml --preempted preempt/tripinfo.xml
+"""
+import argparse
+import json
+
+import numpy as np
+
+from signal_plans import ALL_RED_TIME, MIN_GREEN, YELLOW_TIME
+from sumo_outputs import trip_kpis
+
+DEFAULT_LEAD = 5.0  # 预测到达前提前放行的时间（秒） Green shown before the predicted arrival (s)
+DEFAULT_HOLD = 5.0  # 预测到达后保持绿灯的时间（秒） Green kept after the predicted arrival (s)
+DEFAULT_HORIZON_MARGIN = 3600.0  # 报告覆盖到最后一次优先之后的时间（秒） Time the report covers past the last preemption (s)
+
+
+def emergency_arrivals(emergency_vehicles, route_edges, index, template, max_speed=None, accel=None,
+                       speed_factor=1.0):
+    """预测每辆紧急车辆到达交叉口停车线的时间：从静止加速到min(限速×speed_factor, max_speed)后匀速行驶。
+    返回[{"depart", "route", "approach", "arrival", "stage"}]，不经过该交叉口的车辆被跳过。"""
+    """Predict when every emergency vehicle reaches the junction's stop line: accelerating from standstill to min(speed limit × speed_factor, max_speed), then at constant speed.
+    Returns [{"depart", "route", "approach", "arrival", "stage"}]; vehicles whose route avoids the junction are skipped."""
+    link_edges = [(from_lane.rsplit("_", 1)[0], to_lane.rsplit("_", 1)[0])
+                  for from_lane, to_lane in zip(template.from_lanes, template.to_lanes)]
+    arrivals = []
+    for entry in sorted(emergency_vehicles, key=lambda x: x["time"]):
+        edges = [index.edge_lookup[edge_id] for edge_id in route_edges[entry["route"]].split()]
+        at_junction = [k for k, edge in enumerate(edges[:-1]) if index.edge_to[edge] == template.junction_id]
+        if not at_junction:
+            continue
+        k = at_junction[0]
+        distance = float(index.edge_length[edges[:k + 1]].sum())
+        speed = float(index.lane_speed[index.edge_lane_start[edges[:k + 1]]].min()) * speed_factor
+        if max_speed is not None:
+            speed = min(speed, max_speed)
+        travel = distance / speed + (speed / (2 * accel) if accel else 0.0)
+        movement = (str(index.edge_ids[edges[k]]), str(index.edge_ids[edges[k + 1]]))
+        links = [i for i, edge_pair in enumerate(link_edges) if edge_pair == movement]
+        # 优先选择该转向有优先权（"G"）的相位组 Prefer a stage giving the movement priority ("G")
+        stages = ([s for s, state in enumerate(template.green_states) if any(state[i] == "G" for i in links)] or
+                  [s for s, state in enumerate(template.green_states) if any(state[i] == "g" for i in links)])
+        if not stages:
+            continue
+        arrivals.append({"depart": float(entry["time"]), "route": entry["route"], "approach": movement[0],
+                         "arrival": round(float(entry["time"]) + travel, 1), "stage": stages[0]})
+    return arrivals
+
+
+def base_phases(template, green):
+    """一个周期的相位列表[(时长, 状态, 相位组, 类型)]，类型为"green"、"yellow"或"red"。"""
+    """The phases of one cycle as [(duration, state, stage, kind)], kind being "green", "yellow" or "red"."""
+    phases = []
+    for stage, (green_state, yellow_state, duration) in enumerate(zip(template.green_states, template.yellow_states,
+                                                                       np.asarray(green).tolist())):
+        phases += [(duration, green_state, stage, "green"), (YELLOW_TIME, yellow_state, stage, "yellow"),
+                   (ALL_RED_TIME, template.red_state, stage, "red")]
+    return phases
+
+
+def preempted_timeline(template, green, offset=0.0, windows=(), horizon=3600.0, until_cycle_start=False):
+    """从0时刻到horizon的相位时间线[(时长, 状态)]，windows为[(开始, 结束, 相位组)]的优先区间（按开始时间排序）。
+    原配时在t时刻位于周期中的(t - offset) mod 周期处。windows为空时即原配时展开后的时间线。
+    until_cycle_start=True时忽略horizon，时间线在最后一个区间之后原配时第一次回到周期起点（第一个相位组的绿灯）时结束。"""
+    """The phase timeline [(duration, state)] from time 0 to horizon with the preemption windows [(begin, end, stage)] (sorted by begin).
+    The original plan is at (t - offset) mod cycle of its cycle at time t. Without windows this is the original plan unrolled.
+    With until_cycle_start=True horizon is ignored and the timeline ends when, after the last window, the original plan first reaches the start of its cycle (the green of the first stage)."""
+    phases = base_phases(template, green)
+    cycle = sum(phase[0] for phase in phases)
+    timeline = []
+
+    def emit(duration, state):
+        if duration > 1e-9:
+            timeline.append((round(duration, 1), state))
+
+    # 0时刻所在的相位及其已运行时间 Phase running at time 0 and how long it has been running
+    position = (-offset) % cycle
+    i = 0
+    while position >= phases[i][0]:
+        position -= phases[i][0]
+        i += 1
+    elapsed = position
+    t = 0.0
+    for begin, end, stage in windows:
+        begin = max(begin, t)
+        if end <= t:
+            continue
+        # 原配时运行到优先区间开始 The original plan runs until the window begins
+        while t + phases[i][0] - elapsed <= begin:
+            emit(phases[i][0] - elapsed, phases[i][1])
+            t += phases[i][0] - elapsed
+            i, elapsed = (i + 1) % len(phases), 0.0
+        duration, state, running, kind = phases[i]
+        if kind == "green" and running == stage:
+            # 已经是该相位组的绿灯：延长到区间结束 Already green for the stage: extend it to the end of the window
+            until = max(end, t + duration - elapsed)
+            emit(until - t, state)
+            t = until
+        else:
+            if kind == "green":
+                # 截断当前绿灯（不短于最短绿灯）并清空交叉口 Cut the running green (not below the minimum green) and clear the junction
+                cut = max(begin, t + MIN_GREEN - elapsed)
+                emit(cut - t, state)
+                emit(YELLOW_TIME, template.yellow_states[running])
+                emit(ALL_RED_TIME, template.red_state)
+                t = cut + YELLOW_TIME + ALL_RED_TIME
+            else:
+                # 黄灯或全红：先走完当前的清空时间 Yellow or all-red: finish the running clearance first
+                emit(duration - elapsed, state)
+                t += duration - elapsed
+                if kind == "yellow":
+                    emit(ALL_RED_TIME, template.red_state)
+                    t += ALL_RED_TIME
+            until = max(end, t + MIN_GREEN)
+            emit(until - t, template.green_states[stage])
+            t = until
+        # 清空后从下一个相位组恢复原配时 Clear, then resume the original plan with the following stage
+        emit(YELLOW_TIME, template.yellow_states[stage])
+        emit(ALL_RED_TIME, template.red_state)
+        t += YELLOW_TIME + ALL_RED_TIME
+        i, elapsed = 3 * ((stage + 1) % template.num_stages), 0.0
+    while (i or elapsed) if until_cycle_start else t < horizon:
+        emit(phases[i][0] - elapsed, phases[i][1])
+        t += phases[i][0] - elapsed
+        i, elapsed = (i + 1) % len(phases), 0.0
+    return timeline
+
+
+def preemption_windows(arrivals, lead=DEFAULT_LEAD, hold=DEFAULT_HOLD):
+    """每辆车的优先区间(开始, 结束, 相位组)：开始时间预留了黄灯与全红，使绿灯在到达前lead秒亮起。"""
+    """The preemption window (begin, end, stage) of every vehicle: the begin leaves room for yellow and all-red so the green shows lead seconds before the arrival."""
+    return sorted((max(0.0, a["arrival"] - lead - YELLOW_TIME - ALL_RED_TIME), a["arrival"] + hold, a["stage"])
+                  for a in arrivals)
+
+
+def signal_wait(timeline, time, green_state):
+    """按时间线，在time到达停车线时需要等待green_state亮起的时间（已是绿灯时为0）。"""
+    """With the timeline, how long a vehicle reaching the stop line at time waits for green_state (0 if it is green already)."""
+    ends = np.cumsum([duration for duration, _ in timeline])
+    states = [state for _, state in timeline]
+    i = int(np.searchsorted(ends, time, side="right"))
+    for j in range(i, len(states)):
+        if states[j] == green_state:
+            return 0.0 if j == i else float(ends[j - 1] - time)
+    return float("nan")
+
+
+def stage_green_seconds(timeline, template, horizon):
+    """时间线中每个相位组在[0, horizon)内的绿灯总时长。"""
+    """Total green time of every stage in the timeline within [0, horizon)."""
+    seconds = np.zeros(template.num_stages)
+    lookup = {state: stage for stage, state in enumerate(template.green_states)}
+    start = 0.0
+    for duration, state in timeline:
+        if state in lookup:
+            seconds[lookup[state]] += max(0.0, min(duration, horizon - start))
+        start += duration
+    return seconds
+
+
+def format_timeline_program(template, timeline, program_id="preempt", tls_id=None):
+    """把时间线写成一个定时tlLogic元素（offset为0，时间线已包含原配时的相位差）。"""
+    """Format the timeline as one fixed-time tlLogic element (offset 0; the timeline already contains the original offset)."""
+    lines = [f'    <tlLogic id="{tls_id or template.junction_id}" type="static" programID="{program_id}" offset="0">\n']
+    lines += [f'        <phase duration="{duration:g}" state="{state}"/>\n' for duration, state in timeline]
+    lines.append("    </tlLogic>\n")
+    return "".join(lines)
+
+
+def format_resume_switch(template, program_id, resume_program_id, resume_time, tls_id=None):
+    """WAUT：从program_id开始，在resume_time切换到resume_program_id。"""
+    """WAUT that starts with program_id and switches to resume_program_id at resume_time."""
+    waut_id = f"{program_id}_{tls_id or template.junction_id}"
+    return (f'    <WAUT id="{waut_id}" refTime="0" startProg="{program_id}">\n'
+            f'        <wautSwitch time="{resume_time:g}" to="{resume_program_id}"/>\n'
+            f'    </WAUT>\n'
+            f'    <wautJunction wautID="{waut_id}" junctionID="{tls_id or template.junction_id}"/>\n')
+
+
+def write_preemption_program(path, template, plans, arrivals, lead=DEFAULT_LEAD, hold=DEFAULT_HOLD, horizon=None,
+                             program_id="preempt"):
+    """把带优先相位的配时（plans为signal_plans.signal_plan()的单个方案）写入附加文件，返回离线估计的报告。
+    优先配时只写到最后一次优先后原配时回到周期起点为止（resume_time），之后WAUT切换到原配时的恢复方案program_id + "_resume"，
+    其相位差使第一个相位组的绿灯在resume_time开始。horizon为报告覆盖的时间，默认为最后一次优先之后DEFAULT_HORIZON_MARGIN秒。"""
+    """Write the plan with the preemption phases (plans is the single plan of signal_plans.signal_plan()) into an additional file and return the offline estimate.
+    The preempted program only runs until the original plan is back at the start of its cycle after the last preemption (resume_time); a WAUT then switches to
+    the resume program program_id + "_resume", the original plan with its offset set so the green of the first stage starts at resume_time.
+    horizon is the time the report covers, DEFAULT_HORIZON_MARGIN seconds past the last preemption by default."""
+    green, offset = plans["green"][0], float(plans["offset"][0])
+    windows = preemption_windows(arrivals, lead, hold)
+    if horizon is None:
+        horizon = (windows[-1][1] if windows else 0.0) + DEFAULT_HORIZON_MARGIN
+    baseline = preempted_timeline(template, green, offset, (), horizon)
+    preempted = preempted_timeline(template, green, offset, windows, horizon)
+    baked = preempted_timeline(template, green, offset, windows, until_cycle_start=True)
+    resume_time = float(sum(duration for duration, _ in baked))
+    cycle = sum(phase[0] for phase in base_phases(template, green))
+    resume_program_id = f"{program_id}_resume"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<additional>\n")
+        if baked:
+            f.write(format_timeline_program(template, baked, program_id))
+        f.write(template.format_program(resume_program_id, green, round(resume_time % cycle, 1)))
+        if baked:
+            f.write(format_resume_switch(template, program_id, resume_program_id, resume_time))
+        f.write("</additional>\n")
+
+    vehicles = []
+    for arrival in arrivals:
+        state = template.green_states[arrival["stage"]]
+        vehicles.append(dict(arrival, stage_name=template.stage_names[arrival["stage"]],
+                             wait_baseline=signal_wait(baseline, arrival["arrival"], state),
+                             wait_preempted=signal_wait(preempted, arrival["arrival"], state)))
+    green_change = stage_green_seconds(preempted, template, horizon) - stage_green_seconds(baseline, template, horizon)
+    return {
+        "vehicles": vehicles,
+        "horizon": horizon,
+        "resume_time": resume_time,
+        "emergency_wait_saved": round(float(sum(v["wait_baseline"] - v["wait_preempted"] for v in vehicles)), 1),
+        "stage_green_change": dict(zip(template.stage_names, green_change.round(1).tolist())),
+        # 被优先相位占用的绿灯时间，即横向交通承受的代价 Green taken by the preemptions, the cost borne by the cross traffic
+        "green_taken": round(float(-green_change[green_change < 0].sum()), 1),
+    }
+
+
+def compare_tripinfo(baseline_file, preempted_file):
+    """比较未优先与优先两次运行的tripinfo：紧急车辆平均行程时间的节省与其他车辆（car）平均延误的增加。"""
+    """Compare the tripinfo of a run without and a run with preemption: the saving in mean emergency travel time and the increase of the mean delay of the other vehicles (car)."""
+    baseline, preempted = trip_kpis(baseline_file), trip_kpis(preempted_file)
+    report = {"baseline": baseline, "preempted": preempted}
+    if "emergency" in baseline and "emergency" in preempted:
+        report["emergency_travel_time_saved"] = (baseline["emergency"]["mean_travel_time"] -
+                                                 preempted["emergency"]["mean_travel_time"])
+    if "car" in baseline and "car" in preempted:
+        report["car_delay_added"] = preempted["car"]["mean_delay"] - baseline["car"]["mean_delay"]
+        report["car_delay_added_total"] = (preempted["car"]["mean_delay"] * preempted["car"]["vehicles"] -
+                                           baseline["car"]["mean_delay"] * baseline["car"]["vehicles"])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emergency vehicle preemption reports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare = subparsers.add_parser("compare", help="compare the tripinfo outputs of runs without and with preemption")
+    compare.add_argument("--baseline", required=True)
+    compare.add_argument("--preempted", required=True)
+    args = parser.parse_args()
+    if args.command == "compare":
+        print(json.dumps(compare_tripinfo(args.baseline, args.preempted), indent=2))
+
+
+if __name__ == "__main__":
+    main()
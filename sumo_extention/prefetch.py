@@ -0,0 +1,201 @@
+"""
+异步场景预取流水线
+Asynchronous scenario prefetch pipeline.
+
+训练时生成与仿真原本严格串行：回合结束后仿真器要等下一个场景的XML生成并写完。ScenarioPrefetcher在后台（进程池或
+线程池）提前生成场景，每个场景写入自己的目录（路线/附加/.sumocfg），放入一个有界队列；消费者在回合结束时用get()取出
+下一个已就绪的场景，生成的时间因此被仿真的时间掩盖。
+
+Generation and simulation used to run strictly in sequence during training: after an episode the simulator waits
+while the XML of the next scenario is built and written. ScenarioPrefetcher generates scenarios ahead of time in the
+background (a process or thread pool), each into its own directory (route/additional/.sumocfg), and keeps them in a
+bounded queue; the consumer takes the next ready scenario with get() when an episode finishes, so generation latency
+hides behind simulation.
+
+背压 Backpressure:
+    已提交但还没被取走的场景最多depth个；消费者慢时生产者停下等待，不会无限制地占用磁盘和内存。
+    At most depth scenarios are submitted but not yet taken; with a slow consumer the producer waits instead of
+    filling disk and memory without bound.
+
+清理 Cleanup:
+    cleanup=True时，get()删除上一次交出的场景目录（消费者取下一个场景时上一个回合已经结束），close()删除剩余的场景。
+    使用场景缓存（cache_dir）时缓存条目中的文件归缓存所有，不会删除（只有seed为None、生成到场景目录的场景会被删除）。
+    With cleanup=True, get() deletes the directory of the scenario handed out before (the consumer has finished that
+    episode when it asks for the next one) and close() deletes the remaining ones. With the scenario cache (cache_dir)
+    the files of cache entries belong to the cache and are never deleted (only scenarios without a seed, which are
+    generated into their scenario directory, are).
+
+用法 Usage:
+    with ScenarioPrefetcher(seeded_scenarios({"num_vehicles": 500}), "prefetch", depth=4) as scenarios:
+        for overrides, paths in scenarios:
+            env.reset(seed=overrides["seed"], config_file=paths["config_file"])
+            ...
+"""
+import itertools
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import autoscript
+from scenario_cache import CONFIG_NAME, ScenarioCache
+
+_DONE = object()  # 场景来源耗尽的标记 Marks the end of the scenario source
+
+# 每个工作进程（或线程池）复用一个缓存对象，保留路网文件哈希的记忆
+# Every worker process (or thread pool) reuses one cache object so the memoized network file hash is kept
+_worker_caches = {}
+
+
+def seeded_scenarios(base=None, base_seed=0):
+    """无限产生场景参数：base加上由base_seed依次派生的种子（与scenario_batch.assign_seeds的派生方式相同）。"""
+    """Yield scenario overrides forever: base plus seeds spawned in turn from base_seed (derived like scenario_batch.assign_seeds)."""
+    seed_sequence = np.random.SeedSequence(base_seed)
+    while True:
+        scenario = dict(base or {})
+        scenario["seed"] = int(seed_sequence.spawn(1)[0].generate_state(1)[0])
+        yield scenario
+
+
+def _generate(overrides, output_dir, cache_dir):
+    """后台工作函数：生成一个场景（或从缓存中取出）并返回其文件路径。"""
+    """Background worker: generate one scenario (or fetch it from the cache) and return its file paths."""
+    scenario = autoscript.default_scenario()
+    scenario.update({key: value for key, value in overrides.items() if key != "name"})
+    if cache_dir is not None:
+        cache = _worker_caches.setdefault(cache_dir, ScenarioCache(cache_dir, max_entries=None))
+        return cache.get_or_generate(scenario, output_dir=output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    return autoscript.generate_scenario(scenario, output_dir, config_name=CONFIG_NAME)
+
+
+class ScenarioPrefetcher:
+    """场景预取器。scenarios为场景参数（覆盖autoscript.default_scenario()）的可迭代对象，可以是无限的（见seeded_scenarios）；
+    depth为队列上限，workers为后台生成的并行数，executor为"process"或"thread"（在守护进程中只能用线程，如VectorEnv的工作进程）。
+    wait_seconds累计消费者在get()中等待的时间，为0说明生成完全被掩盖。"""
+    """Scenario prefetcher. scenarios is an iterable of scenario overrides (of autoscript.default_scenario()), possibly infinite (see seeded_scenarios);
+    depth bounds the queue, workers is the background generation parallelism and executor is "process" or "thread" (daemonic processes such as
+    VectorEnv workers can only use threads). wait_seconds adds up the time the consumer waited in get(); zero means generation is fully hidden."""
+
+    def __init__(self, scenarios, output_root, depth=4, workers=1, executor="process", net_file=None, cache_dir=None,
+                 cleanup=True):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        if executor not in ("process", "thread"):
+            raise ValueError(f"unknown executor '{executor}'")
+        self.output_root = output_root
+        self.net_file = os.path.abspath(net_file) if net_file is not None else None
+        self.cache_dir = cache_dir
+        self.cleanup = cleanup
+        self.wait_seconds = 0.0
+        self.handed_out = 0
+        self._source = iter(scenarios)
+        self._executor = (ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor)(max_workers=workers)
+        self._ready = queue.Queue()
+        self._slots = threading.Semaphore(depth)
+        self._closed = threading.Event()
+        self._previous = None
+        self._waiting = None  # 已出队但还没生成完的场景 Dequeued scenario whose generation has not finished
+        self._exhausted = False
+        self._producer = threading.Thread(target=self._produce, daemon=True)
+        self._producer.start()
+
+    def _produce(self):
+        """生产者线程：每拿到一个空位就提交一个场景，队列满时阻塞（背压）。"""
+        """Producer thread: submit one scenario per free slot and block while the queue is full (backpressure)."""
+        try:
+            for i in itertools.count():
+                while not self._slots.acquire(timeout=0.1):
+                    if self._closed.is_set():
+                        return
+                if self._closed.is_set():
+                    return
+                overrides = next(self._source, _DONE)
+                if overrides is _DONE:
+                    break
+                overrides = dict(overrides)
+                if self.net_file is not None:
+                    overrides.setdefault("net_file", self.net_file)
+                output_dir = os.path.join(self.output_root, overrides.get("name", f"scenario_{i:06d}"))
+                future = self._executor.submit(_generate, overrides, output_dir, self.cache_dir)
+                self._ready.put((overrides, output_dir, future))
+        except Exception as error:  # 来源出错时交给消费者 Errors of the source are handed to the consumer
+            self._ready.put(error)
+            return
+        self._ready.put(_DONE)
+
+    def get(self, timeout=None):
+        """返回下一个已就绪的场景(场景参数, 文件路径)，来源耗尽时返回None；生成失败时抛出生成时的异常。
+        超过timeout秒仍没有就绪的场景时抛出TimeoutError，下一次get()继续等待同一个场景。"""
+        """Return the next ready scenario as (overrides, file paths), or None once the source is exhausted; a failed generation raises its exception.
+        Raises TimeoutError when no scenario is ready within timeout seconds; the next get() continues waiting for the same scenario."""
+        self._release_previous()
+        if self._exhausted:
+            return None
+        start = time.perf_counter()
+        try:
+            if self._waiting is None:
+                try:
+                    item = self._ready.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError("no scenario was ready in time") from None
+                if item is _DONE:
+                    self._exhausted = True
+                    return None
+                if isinstance(item, Exception):
+                    raise item
+                self._waiting = item
+                self._slots.release()
+            overrides, output_dir, future = self._waiting
+            remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - start))
+            try:
+                paths = future.result(timeout=remaining)
+            finally:
+                if future.done():
+                    self._waiting = None
+        finally:
+            self.wait_seconds += time.perf_counter() - start
+        self._previous = output_dir
+        self.handed_out += 1
+        return overrides, paths
+
+    def __iter__(self):
+        while True:
+            scenario = self.get()
+            if scenario is None:
+                return
+            yield scenario
+
+    def _release_previous(self):
+        if self._previous is not None and self.cleanup:
+            shutil.rmtree(self._previous, ignore_errors=True)
+        self._previous = None
+
+    def close(self):
+        """停止生产者，取消未开始的生成，清理剩余的场景目录。"""
+        """Stop the producer, cancel generations that have not started and clean up the remaining scenario directories."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._producer.join()
+        self._release_previous()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._waiting is not None and self.cleanup:
+            shutil.rmtree(self._waiting[1], ignore_errors=True)
+        while True:
+            try:
+                item = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple) and self.cleanup:
+                shutil.rmtree(item[1], ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,129 @@
+"""
+多场景并行批量生成
+Parallel multi-scenario batch generation.
+
+每个场景是对autoscript.default_scenario()的参数覆盖（可附带"name"），生成到各自的目录中：
+generated_vehicles.rou.xml、accident_config.add.xml和scenario.sumocfg。
+未指定seed的场景由基础种子派生出确定的独立种子，因此同一批参数重复运行结果一致。
+
+Each scenario is a set of overrides of autoscript.default_scenario() (optionally with a "name") and is generated into
+its own directory: generated_vehicles.rou.xml, accident_config.add.xml and scenario.sumocfg.
+Scenarios without an explicit seed get an independent, deterministic seed derived from the base seed, so re-running
+the same batch reproduces the same files.
+
+用法 Usage:
+    python scenario_batch.py --grid grid.json --output scenarios --workers 8
+
+grid.json格式 grid.json format:
+    {"base": {"num_vehicles": 1000}, "grid": {"num_vehicles": [500, 1000], "base_depart_interval": [0.8, 1.0]}}
+    或场景列表 or a list of scenarios: [{"name": "peak", "num_vehicles": 5000}, ...]
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import autoscript
+from scenario_cache import ScenarioCache
+
+
+def expand_grid(grid, base=None):
+    """将参数网格展开为场景列表（各参数取值的笛卡尔积），base为所有场景共用的参数。"""
+    """Expand a parameter grid into a list of scenarios (the Cartesian product of all values); base holds the parameters shared by every scenario."""
+    keys = list(grid)
+    scenarios = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        scenario = dict(base or {})
+        scenario.update(zip(keys, values))
+        scenarios.append(scenario)
+    return scenarios
+
+
+def assign_seeds(scenarios, base_seed=0):
+    """为未指定seed的场景分配由base_seed派生的确定性种子（numpy SeedSequence.spawn），返回新的场景列表。"""
+    """Give every scenario without a seed a deterministic seed derived from base_seed (numpy SeedSequence.spawn) and return the new scenario list."""
+    children = np.random.SeedSequence(base_seed).spawn(len(scenarios))
+    seeded = []
+    for scenario, child in zip(scenarios, children):
+        scenario = dict(scenario)
+        if scenario.get("seed") is None:
+            scenario["seed"] = int(child.generate_state(1)[0])
+        seeded.append(scenario)
+    return seeded
+
+
+# 每个工作进程复用一个缓存对象，保留路网文件哈希的记忆
+# Every worker process reuses one cache object so the memoized network file hash is kept
+_worker_caches = {}
+
+
+def _generate_one(args):
+    """进程池中的工作函数：生成一个场景（或从缓存中取出）并返回其文件路径。"""
+    """Worker run in the process pool: generate one scenario (or fetch it from the cache) and return its file paths."""
+    overrides, output_dir, cache_dir = args
+    scenario = autoscript.default_scenario()
+    scenario.update({key: value for key, value in overrides.items() if key != "name"})
+    if cache_dir is not None:
+        # 工作进程中不淘汰，避免删除同一批次中其他场景的条目
+        # No eviction inside workers, so entries of other scenarios of the same batch are never removed
+        cache = _worker_caches.setdefault(cache_dir, ScenarioCache(cache_dir, max_entries=None))
+        return cache.get_or_generate(scenario, output_dir=output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    return autoscript.generate_scenario(scenario, output_dir, config_name="scenario.sumocfg")
+
+
+def generate_batch(scenarios, output_root, max_workers=None, base_seed=0, net_file=None, cache_dir=None,
+                   cache_entries=256):
+    """用进程池并行生成多个场景，每个场景写入output_root下的独立目录，返回各场景的文件路径列表并打印吞吐量。
+    指定cache_dir时改为使用场景缓存，相同参数的场景直接返回缓存路径，批次结束后按LRU淘汰到cache_entries个条目（不少于本批次场景数）。"""
+    """Generate many scenarios in parallel with a process pool, each into its own directory under output_root. Returns the list of per-scenario file paths and prints the throughput.
+    With cache_dir the scenario cache is used instead: scenarios with identical parameters return the cached paths, and after the batch the cache is evicted down to cache_entries entries (never fewer than the batch size)."""
+    scenarios = assign_seeds(scenarios, base_seed)
+    if net_file is not None:
+        net_file = os.path.abspath(net_file)
+        scenarios = [{"net_file": net_file, **scenario} for scenario in scenarios]
+
+    jobs = []
+    for i, scenario in enumerate(scenarios):
+        name = scenario.get("name", f"scenario_{i:05d}")
+        jobs.append((scenario, os.path.join(output_root, name), cache_dir))
+
+    workers = max_workers or os.cpu_count() or 1
+    # 按块分发任务，减少小场景的进程间通信开销
+    # Dispatch in chunks to cut the inter-process overhead of small scenarios
+    chunksize = max(1, len(jobs) // (4 * workers))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_generate_one, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    if cache_dir is not None:
+        ScenarioCache(cache_dir, max_entries=max(cache_entries, len(results))).evict()
+
+    print(f"生成 {len(results)} 个场景，耗时 {elapsed:.2f} 秒，吞吐量 {len(results) / elapsed:.1f} 场景/秒")
+    print(f"Generated {len(results)} scenarios in {elapsed:.2f} s ({len(results) / elapsed:.1f} scenarios/s)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many scenario variants in parallel")
+    parser.add_argument("--grid", required=True, help="JSON file with a scenario list or a {base, grid} parameter grid")
+    parser.add_argument("--output", default="scenarios", help="root directory of the generated scenarios")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed the per-scenario seeds are derived from")
+    parser.add_argument("--net", default="net.net.xml", help="network file referenced by every .sumocfg")
+    parser.add_argument("--cache", default=None, help="scenario cache directory (reuse identical scenarios)")
+    parser.add_argument("--cache-entries", type=int, default=256, help="maximum number of cached scenarios")
+    args = parser.parse_args()
+
+    with open(args.grid, encoding="utf-8") as f:
+        spec = json.load(f)
+    scenarios = spec if isinstance(spec, list) else expand_grid(spec["grid"], spec.get("base"))
+    generate_batch(scenarios, args.output, args.workers, args.seed, args.net, args.cache, args.cache_entries)
+
+
+if __name__ == "__main__":
+    main()
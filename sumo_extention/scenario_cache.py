@@ -0,0 +1,168 @@
+"""
+按参数哈希寻址的场景缓存
+Content-addressed cache of generated scenarios.
+
+缓存键为规范化后的完整场景参数（含seed）与路网文件内容的SHA-256。命中时直接返回已生成的
+.rou.xml/.add.xml/.sumocfg（以及信号配时、车道车辆数等）路径，未命中时生成到缓存目录中。缓存按最近使用时间（LRU）淘汰，
+可限制条目数和总字节数。seed为None的场景每次结果都不同，不会被缓存，生成到调用者指定的目录。
+
+The cache key is the SHA-256 of the normalized full scenario parameters (seed included) and of the network file
+content. A hit returns the paths of the already generated .rou.xml/.add.xml/.sumocfg (and signal plan, lane count, ...
+files); a miss generates them into the cache directory. Entries are evicted least-recently-used first, bounded by entry
+count and total bytes. Scenarios whose seed is None differ on every run and are never cached; they are generated into a
+directory owned by the caller.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import autoscript
+from demand_profile import load_demand_profile
+
+CONFIG_NAME = "scenario.sumocfg"
+PATHS_NAME = "paths.json"  # 条目中生成的文件路径（相对条目目录） Generated file paths of an entry (relative to the entry directory)
+
+
+def _json_default(value):
+    """缓存键中numpy数组与标量的完整JSON表示（str()会把超过1000个元素的数组省略成"..."）。"""
+    """Full JSON form of numpy arrays and scalars in the cache key (str() elides arrays over 1000 elements with "...")."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return str(value)
+
+
+def normalize_scenario(scenario):
+    """规范化场景参数，使等价的参数得到相同的缓存键：路线概率归一化，特殊车辆按时间排序。"""
+    """Normalize scenario parameters so that equivalent inputs hash to the same key: route probabilities are normalized and special vehicles are sorted by time."""
+    normalized = dict(scenario)
+    if isinstance(scenario["route_probabilities"], dict):
+        prob_sum = sum(scenario["route_probabilities"].values())
+        normalized["route_probabilities"] = {route_id: round(p / prob_sum, 12)
+                                             for route_id, p in scenario["route_probabilities"].items()}
+    for key in ("emergency_vehicles", "accident_vehicles"):
+        normalized[key] = sorted(scenario[key], key=lambda x: x["time"])
+    normalized["special_streams"] = {name: sorted(entries, key=lambda x: x["time"])
+                                     for name, entries in scenario.get("special_streams", {}).items()}
+    normalized["net_file"] = os.path.abspath(scenario["net_file"])
+    if isinstance(scenario.get("demand_profile"), str):
+        # 需求曲线文件按内容参与缓存键 A demand profile file enters the key by its content
+        normalized["demand_profile"] = load_demand_profile(scenario["demand_profile"])
+    if isinstance(scenario.get("lane_demand"), str):
+        normalized["lane_demand"] = load_demand_profile(scenario["lane_demand"], key="counts")
+    return normalized
+
+
+class ScenarioCache:
+    """场景缓存：get_or_generate()在命中时返回缓存路径，否则生成并写入缓存。hits/misses记录命中与未命中次数。"""
+    """Scenario cache: get_or_generate() returns the cached paths on a hit and generates into the cache otherwise. hits/misses count lookups."""
+
+    def __init__(self, cache_dir, max_entries=256, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = {}  # (路径, 修改时间, 大小) -> 内容哈希 (path, mtime, size) -> content hash
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _file_hash(self, path):
+        """路网文件内容的SHA-256，按(路径, 修改时间, 大小)记忆化，避免每次查找都重新读取文件。"""
+        """SHA-256 of the network file content, memoized on (path, mtime, size) so lookups do not re-read the file."""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        if memo_key not in self._file_hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            self._file_hashes[memo_key] = digest.hexdigest()
+        return self._file_hashes[memo_key]
+
+    def key(self, scenario, batch=True):
+        """计算场景的缓存键。"""
+        """Compute the cache key of a scenario."""
+        normalized = normalize_scenario(scenario)
+        payload = json.dumps({"scenario": normalized, "net_hash": self._file_hash(normalized["net_file"]),
+                              "batch": batch}, sort_keys=True, default=_json_default)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, entry_dir):
+        """读取条目中记录的文件路径（generate_scenario返回的全部路径）。"""
+        """Read the file paths recorded in an entry (all paths returned by generate_scenario)."""
+        try:
+            with open(os.path.join(entry_dir, PATHS_NAME), encoding="utf-8") as f:
+                names = json.load(f)
+        except (OSError, ValueError):
+            # 没有记录路径的旧条目 Older entries without recorded paths
+            names = {"route_file": "generated_vehicles.rou.xml", "additional_file": "accident_config.add.xml",
+                     "config_file": CONFIG_NAME}
+        return {key: os.path.join(entry_dir, name) for key, name in names.items()}
+
+    def get_or_generate(self, scenario, batch=True, output_dir=None):
+        """返回场景文件路径：命中时直接返回并更新使用时间，未命中时生成。
+        seed为None的场景不缓存，生成到调用者的output_dir中（此时output_dir必须指定，由调用者负责清理）。"""
+        """Return the scenario file paths: on a hit return them and refresh the entry's use time, on a miss generate them.
+        Scenarios with seed=None are never cached and are generated into the caller's output_dir (required then; the caller owns and cleans it up)."""
+        if scenario.get("seed") is None:
+            if output_dir is None:
+                raise ValueError("scenarios without a seed are not cached and need an output_dir")
+            self.misses += 1
+            os.makedirs(output_dir, exist_ok=True)
+            return autoscript.generate_scenario(scenario, output_dir, batch=batch, config_name=CONFIG_NAME)
+
+        entry_dir = os.path.join(self.cache_dir, self.key(scenario, batch))
+        if os.path.isdir(entry_dir):
+            self.hits += 1
+            os.utime(entry_dir)  # 更新LRU时间 Refresh the LRU time
+            return self._paths(entry_dir)
+
+        self.misses += 1
+        # 先生成到临时目录再原子重命名，多个进程同时生成同一场景时也不会读到半成品
+        # Generate into a temporary directory and rename it atomically, so concurrent processes never see partial files
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        paths = autoscript.generate_scenario(scenario, tmp_dir, batch=batch, config_name=CONFIG_NAME)
+        with open(os.path.join(tmp_dir, PATHS_NAME), "w", encoding="utf-8") as f:
+            json.dump({key: os.path.relpath(path, tmp_dir) for key, path in paths.items()}, f, indent=2)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # 其他进程已写入相同条目 Another process already stored the same entry
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        # .sumocfg中的相对路径不依赖目录名，重命名后仍然有效
+        # The relative paths inside the .sumocfg do not depend on the directory name and stay valid after the rename
+        self.evict()
+        return self._paths(entry_dir)
+
+    def entries(self):
+        """返回缓存条目列表[(最近使用时间, 字节数, 目录)]，按最近使用时间从旧到新排序。"""
+        """Return the cache entries as [(last use time, bytes, directory)], least recently used first."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            entries.append((os.stat(path).st_mtime, size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """按LRU淘汰条目，直到条目数和总字节数都不超过上限。"""
+        """Evict least recently used entries until both the entry count and the total size are within bounds (None means unbounded)."""
+        entries = self.entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries) or
+                           (self.max_bytes is not None and total_bytes > self.max_bytes)):
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total_bytes -= size
+
+    def stats(self):
+        """返回命中/未命中次数和命中率。"""
+        """Return the hit/miss counts and the hit rate."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,275 @@
+"""
+信号配时方案生成
+Traffic signal program generator.
+
+从路网中读取交叉口（默认J0）的link顺序与冲突矩阵，按相对进口道分组生成相位（直行+右转、左转保护相位），
+每个相位的绿灯/黄灯/全红状态字符串只在每个路网计算一次并缓存。之后的配时方案（周期、绿信比、相位差）都只是数组运算：
+批量枚举数千个方案时只需对时长数组做向量化计算并套用缓存的状态字符串。
+
+Reads the link order and conflict matrix of a junction (J0 by default) from the network and builds its stages by
+opposing approaches (through + right, protected left). The green/yellow/all-red state strings of every stage are
+computed once per network and cached; timing plans (cycle, splits, offset) are then plain array operations, so
+enumerating thousands of plans only computes duration arrays and reuses the cached state strings.
+
+程序类型 Program types: "static"（定时 fixed-time）、"actuated"（感应 actuated）、"delay_based"（基于延误 delay-based）
+
+J0在net.net.xml中是priority类型，需要先将其改为信号控制交叉口才能加载tlLogic：
+J0 is a priority junction in net.net.xml and has to become a traffic light junction before any tlLogic can be loaded:
+    netconvert -s net.net.xml --tls.set J0 --tllogic-files J0.tll.xml -o net_tls.net.xml
+J0.tll.xml由write_tls_patch()生成，其link顺序与本模块生成的状态字符串一致；build_tls_network()写出它并调用netconvert
+（autoscript在场景设置了signal_plan时自动调用）。
+J0.tll.xml is written by write_tls_patch() and fixes the link order the state strings of this module use;
+build_tls_network() writes it and runs netconvert (autoscript does so whenever a scenario sets a signal_plan).
+
+用法 Usage:
+    python signal_plans.py --cycles 60 90 120 --splits "[[1,1,1,1],[2,1,2,1]]" --offsets 0 10 20 --output plans.add.xml
+    python signal_plans.py --patch J0.tll.xml
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+from net_index import load_network_index
+
+YELLOW_TIME = 3.0  # 黄灯时间（秒） Yellow time (s)
+ALL_RED_TIME = 2.0  # 全红时间（秒） All-red time (s)
+MIN_GREEN = 5.0  # 最短绿灯时间（秒） Minimum green time (s)
+
+# 感应控制与基于延误控制的默认参数 Default parameters of actuated and delay-based control
+# https://sumo.dlr.de/docs/Simulation/Traffic_Lights.html
+PROGRAM_PARAMS = {
+    "static": {},
+    "actuated": {"max-gap": "3.0", "detector-gap": "2.0", "passing-time": "2.0"},
+    "delay_based": {"detectorRange": "100", "minTimeLoss": "1"},
+}
+
+# 已构建的相位模板，按(路网路径, 修改时间, 大小, junction, 是否设置左转保护相位)记忆
+# Stage templates, memoized on (network path, mtime, size, junction, protected left stages)
+_templates = {}
+
+# 同一相位内link获得优先权（"G"）的顺序：直行、右转、其他 Order in which the links of a stage get priority ("G"): through, right, others
+_DIRECTION_PRIORITY = {"s": 0, "r": 1, "R": 1}
+
+
+class SignalTemplate:
+    """交叉口的相位模板：link顺序、冲突矩阵、各相位的绿灯/黄灯状态字符串及全红状态字符串。"""
+    """Stage template of a junction: link order, conflict matrix, and the green/yellow state strings of every stage plus the all-red state."""
+
+    def __init__(self, index, junction_id="J0", protected_left=True):
+        self.junction_id = junction_id
+        self.links = index.junction_links(junction_id)
+        self.foes = index.junction_foes(junction_id)
+        if len(self.links) != len(self.foes):
+            raise ValueError(f"junction {junction_id} has {len(self.links)} links but {len(self.foes)} requests")
+        self.from_lanes = index.lane_ids[index.conn_from_lane[self.links]].tolist()
+        self.to_lanes = index.lane_ids[index.conn_to_lane[self.links]].tolist()
+        self.directions = index.conn_dir[self.links].tolist()
+        from_edges = index.lane_edge[index.conn_from_lane[self.links]]
+
+        # 进口道按incLanes顺序，相对进口道：直行驶入的edge的终点是另一进口道的起点
+        # Approaches in incLanes order; the opposing approach starts where the approach's through movement leads
+        approaches = list(dict.fromkeys(from_edges.tolist()))
+        through_target = {}
+        for link, edge in zip(self.links.tolist(), from_edges.tolist()):
+            if index.conn_dir[link] == "s":
+                through_target.setdefault(edge, index.edge_to[index.lane_edge[index.conn_to_lane[link]]])
+        groups = []
+        for edge in approaches:
+            if any(edge in group for group in groups):
+                continue
+            opposing = [other for other in approaches if other != edge and edge in through_target and
+                        index.edge_from[other] == through_target[edge]]
+            groups.append((edge,) + tuple(opposing[:1]))
+
+        self.stage_names = []
+        masks = []
+        for group in groups:
+            in_group = np.isin(from_edges, group)
+            left = np.isin(self.directions, ["l", "L", "t"])
+            names = "+".join(str(index.edge_ids[edge]) for edge in group)
+            if protected_left and (in_group & left).any() and (in_group & ~left).any():
+                masks += [in_group & ~left, in_group & left]
+                self.stage_names += [f"{names} through", f"{names} left"]
+            else:
+                masks.append(in_group)
+                self.stage_names.append(names)
+        self.green_masks = np.array(masks)
+
+        # 各相位的状态字符串 State strings of every stage
+        self.green_states = [self._green_state(mask) for mask in self.green_masks]
+        self.yellow_states = ["".join("y" if green else "r" for green in mask) for mask in self.green_masks]
+        self.red_state = "r" * len(self.links)
+
+    def _green_state(self, mask):
+        """相位的绿灯状态：与已获得优先权的link不冲突的link为"G"，否则为"g"（需让行）。"""
+        """Green state of a stage: a link is "G" unless it conflicts with a link that already has priority, in which case it is "g" (must yield)."""
+        state = ["r"] * len(mask)
+        priority = []
+        for link in sorted(np.flatnonzero(mask).tolist(), key=lambda i: _DIRECTION_PRIORITY.get(self.directions[i], 2)):
+            if self.foes[link, priority].any():
+                state[link] = "g"
+            else:
+                state[link] = "G"
+                priority.append(link)
+        return "".join(state)
+
+    def restricted(self, kept):
+        """返回只保留部分link（布尔掩码kept）的相位模板副本，用于车道数不同、部分connection被合并的平铺交叉口（见grid_network）。"""
+        """Return a copy of the template keeping only some links (boolean mask kept), for tiled junctions whose lane counts differ and some connections merged (see grid_network)."""
+        subset = copy.copy(self)
+        keep = np.flatnonzero(kept)
+        subset.links = self.links[keep]
+        subset.foes = self.foes[np.ix_(keep, keep)]
+        subset.from_lanes = [self.from_lanes[k] for k in keep]
+        subset.to_lanes = [self.to_lanes[k] for k in keep]
+        subset.directions = [self.directions[k] for k in keep]
+        subset.green_masks = self.green_masks[:, keep]
+        subset.green_states = [subset._green_state(mask) for mask in subset.green_masks]
+        subset.yellow_states = ["".join(state[k] for k in keep) for state in self.yellow_states]
+        subset.red_state = "r" * len(keep)
+        return subset
+
+    @property
+    def num_stages(self):
+        return len(self.green_states)
+
+    @property
+    def lost_time(self):
+        """每个周期的损失时间（黄灯+全红）。"""
+        """Lost time per cycle (yellow + all-red)."""
+        return self.num_stages * (YELLOW_TIME + ALL_RED_TIME)
+
+    def green_times(self, cycles, splits):
+        """由周期与绿信比计算各相位绿灯时间：green[i, k] = (cycle[i] - 损失时间) * splits[i, k] / sum(splits[i])，向量化。"""
+        """Green times of every stage from cycles and splits, vectorized: green[i, k] = (cycle[i] - lost time) * splits[i, k] / sum(splits[i])."""
+        cycles = np.asarray(cycles, dtype=float).reshape(-1)
+        splits = np.broadcast_to(np.asarray(splits, dtype=float), (len(cycles), self.num_stages))
+        return np.round((cycles - self.lost_time)[:, None] * splits / splits.sum(axis=1, keepdims=True), 1)
+
+    def plan_grid(self, cycles, split_sets, offsets=(0.0,)):
+        """枚举配时方案网格（周期 × 绿信比 × 相位差），剔除绿灯短于MIN_GREEN的方案。
+        返回{"cycle": [n], "offset": [n], "green": [n, 相位数]}。"""
+        """Enumerate a grid of timing plans (cycle × splits × offset), dropping plans with a green shorter than MIN_GREEN.
+        Returns {"cycle": [n], "offset": [n], "green": [n, stages]}."""
+        split_sets = np.asarray(split_sets, dtype=float).reshape(-1, self.num_stages)
+        c, s, o = (axis.ravel() for axis in np.meshgrid(np.arange(len(cycles)), np.arange(len(split_sets)),
+                                                        np.arange(len(offsets)), indexing="ij"))
+        cycle = np.asarray(cycles, dtype=float)[c]
+        green = self.green_times(cycle, split_sets[s])
+        valid = (green >= MIN_GREEN).all(axis=1)
+        return {"cycle": cycle[valid], "offset": np.asarray(offsets, dtype=float)[o][valid], "green": green[valid]}
+
+    def format_program(self, program_id, green, offset=0.0, program_type="static", max_green_factor=2.0,
+                       tls_id=None):
+        """生成一个tlLogic元素的XML文本。感应与基于延误控制的绿灯相位带minDur=MIN_GREEN和maxDur=green*max_green_factor。
+        tls_id默认为模板的junction。"""
+        """Build the XML text of one tlLogic element. Green phases of actuated and delay-based programs get minDur=MIN_GREEN and maxDur=green*max_green_factor.
+        tls_id defaults to the template's junction."""
+        if program_type not in PROGRAM_PARAMS:
+            raise ValueError(f"unknown program type '{program_type}' (known: {', '.join(PROGRAM_PARAMS)})")
+        lines = [f'    <tlLogic id="{tls_id or self.junction_id}" type="{program_type}" programID="{program_id}" offset="{offset:g}">\n']
+        lines += [f'        <param key="{key}" value="{value}"/>\n' for key, value in PROGRAM_PARAMS[program_type].items()]
+        for green_state, yellow_state, duration in zip(self.green_states, self.yellow_states, np.asarray(green).tolist()):
+            if program_type == "static":
+                lines.append(f'        <phase duration="{duration:g}" state="{green_state}"/>\n')
+            else:
+                lines.append(f'        <phase duration="{duration:g}" state="{green_state}" minDur="{MIN_GREEN:g}" '
+                             f'maxDur="{max(duration, duration * max_green_factor):g}"/>\n')
+            lines.append(f'        <phase duration="{YELLOW_TIME:g}" state="{yellow_state}"/>\n')
+            lines.append(f'        <phase duration="{ALL_RED_TIME:g}" state="{self.red_state}"/>\n')
+        lines.append("    </tlLogic>\n")
+        return "".join(lines)
+
+
+def load_signal_template(net_file, junction_id="J0", protected_left=True):
+    """加载交叉口的相位模板（按路网文件与参数记忆，路网文件变化时重建）。"""
+    """Load the stage template of a junction (memoized on the network file and the arguments, rebuilt when the network file changes)."""
+    stat = os.stat(net_file)
+    memo_key = (os.path.abspath(net_file), stat.st_mtime_ns, stat.st_size, junction_id, protected_left)
+    if memo_key not in _templates:
+        _templates[memo_key] = SignalTemplate(load_network_index(net_file), junction_id, protected_left)
+    return _templates[memo_key]
+
+
+def write_signal_programs(path, template, plans, program_type="static", program_prefix="plan_"):
+    """将plan_grid()返回的配时方案全部写入一个附加文件，programID为program_prefix加序号。返回写出的方案数。"""
+    """Write every timing plan returned by plan_grid() into one additional file, with programID program_prefix plus a sequence number. Returns the number of programs written."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<additional>\n")
+        for i, (green, offset) in enumerate(zip(plans["green"], plans["offset"].tolist())):
+            f.write(template.format_program(f"{program_prefix}{i}", green, offset, program_type))
+        f.write("</additional>\n")
+    return len(plans["green"])
+
+
+def signal_plan(template, spec):
+    """由场景中的signal_plan规格{"type", "cycle", "splits", "offset"}计算单个配时方案（splits默认各相位相等）。"""
+    """Compute one timing plan from a scenario's signal_plan spec {"type", "cycle", "splits", "offset"} (splits default to equal stages)."""
+    splits = spec.get("splits", [1.0] * template.num_stages)
+    if len(splits) != template.num_stages:
+        raise ValueError(f"{len(splits)} splits given for the {template.num_stages} stages "
+                         f"({', '.join(template.stage_names)}) of {template.junction_id}")
+    plans = template.plan_grid([spec.get("cycle", 90.0)], [splits], [spec.get("offset", 0.0)])
+    if not len(plans["green"]):
+        raise ValueError(f"cycle {spec.get('cycle', 90.0)} leaves a green shorter than {MIN_GREEN} s")
+    return plans
+
+
+def write_tls_patch(path, template, program_id="0"):
+    """生成netconvert的--tllogic-files输入：一个均分绿信比的默认方案和固定link顺序的connection（见模块说明）。"""
+    """Write the --tllogic-files input of netconvert: a default equal-split program and the connections with their fixed link order (see the module docstring)."""
+    green = template.green_times([90.0], [1.0] * template.num_stages)[0]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<tlLogics>\n")
+        f.write(template.format_program(program_id, green))
+        for link_index, (from_lane, to_lane) in enumerate(zip(template.from_lanes, template.to_lanes)):
+            from_edge, from_lane_index = from_lane.rsplit("_", 1)
+            to_edge, to_lane_index = to_lane.rsplit("_", 1)
+            f.write(f'    <connection from="{from_edge}" to="{to_edge}" fromLane="{from_lane_index}" '
+                    f'toLane="{to_lane_index}" tl="{template.junction_id}" linkIndex="{link_index}"/>\n')
+        f.write("</tlLogics>\n")
+
+
+def build_tls_network(net_file, template, patch_file, output_file, netconvert=None):
+    """写出tls patch（见write_tls_patch）并用netconvert生成交叉口为信号控制的路网output_file；没有找到netconvert时返回False。"""
+    """Write the tls patch (see write_tls_patch) and build output_file, the network with the junction under signal control, with netconvert; returns False when netconvert is not found."""
+    write_tls_patch(patch_file, template)
+    netconvert = netconvert or shutil.which("netconvert")
+    if netconvert is None:
+        return False
+    subprocess.run([netconvert, "-s", net_file, "--tls.set", template.junction_id, "--tllogic-files", patch_file,
+                    "-o", output_file], check=True, stdout=subprocess.DEVNULL)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate signal timing plans for a junction")
+    parser.add_argument("--net", default="net.net.xml")
+    parser.add_argument("--junction", default="J0")
+    parser.add_argument("--type", default="static", choices=list(PROGRAM_PARAMS))
+    parser.add_argument("--cycles", type=float, nargs="+", default=[90.0])
+    parser.add_argument("--splits", default=None, help="JSON list of split vectors (default: equal splits)")
+    parser.add_argument("--offsets", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--no-protected-left", action="store_true", help="run left turns permissively with the through stage")
+    parser.add_argument("--output", default="signal_plans.add.xml")
+    parser.add_argument("--patch", default=None, help="also write the netconvert --tllogic-files input to this path")
+    args = parser.parse_args()
+
+    template = load_signal_template(args.net, args.junction, not args.no_protected_left)
+    split_sets = json.loads(args.splits) if args.splits else [[1.0] * template.num_stages]
+    plans = template.plan_grid(args.cycles, split_sets, args.offsets)
+    count = write_signal_programs(args.output, template, plans, args.type)
+    print(f"相位 Stages: {', '.join(template.stage_names)}")
+    print(f"已写出 {count} 个配时方案 Wrote {count} timing plans: {args.output}")
+    if args.patch:
+        write_tls_patch(args.patch, template)
+        print(f"netconvert -s {args.net} --tls.set {args.junction} --tllogic-files {args.patch} -o net_tls.net.xml")
+
+
+if __name__ == "__main__":
+    main()
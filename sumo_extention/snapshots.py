@@ -0,0 +1,113 @@
+"""
+仿真状态快照：跳过每个回合的预热
+Simulation state snapshots that skip the warm-up of every episode.
+
+每个回合都从t=0的空路网开始时，J0要经过一段预热才能达到稳定的排队长度，而强化学习的每次reset都要重新仿真这段预热。
+create_snapshots()把一个生成的场景运行一次，在warmup、warmup+interval、...时刻用saveState保存仿真状态，文件与场景的
+路由/附加文件放在同一目录（场景缓存条目中也一样），并写入清单snapshots.json；之后的reset从随机选择的一个快照
+loadState开始（SumoEnv.reset(snapshot=...)）。
+
+Starting every episode from an empty network at t=0 means J0 needs a warm-up before its queues reach a steady state,
+and every RL reset simulates that warm-up again. create_snapshots() runs a generated scenario once and saves the
+simulation state with saveState at warmup, warmup+interval, ..., next to the route/additional files of the scenario
+(also inside scenario cache entries) together with a manifest snapshots.json; later resets start from a randomly chosen
+snapshot with loadState (SumoEnv.reset(snapshot=...)).
+
+SUMO的状态文件（.xml.gz）与fake后端的状态文件（.npz）互不兼容，清单中按后端类型分开记录。场景重新生成后.sumocfg
+的修改时间改变，旧的快照随之失效。
+SUMO state files (.xml.gz) and fake backend state files (.npz) are not interchangeable, so the manifest keeps them
+apart per backend kind. Regenerating the scenario changes the modification time of its .sumocfg, which invalidates
+the old snapshots.
+"""
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = "snapshots.json"
+DEFAULT_WARMUP = 600.0
+DEFAULT_COUNT = 4
+DEFAULT_INTERVAL = 60.0
+
+
+def backend_kind(backend):
+    """返回状态文件的格式："fake"或"sumo"（libsumo与traci相同）。"""
+    """Return the state file format: "fake" or "sumo" (shared by libsumo and traci)."""
+    return "fake" if backend == "fake" else "sumo"
+
+
+def snapshot_times(warmup=DEFAULT_WARMUP, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL):
+    return [float(warmup) + k * float(interval) for k in range(count)]
+
+
+def _manifest_path(config_file):
+    return os.path.join(os.path.dirname(os.path.abspath(config_file)), MANIFEST_NAME)
+
+
+def _config_stamp(config_file):
+    return os.stat(config_file).st_mtime_ns
+
+
+def _read_manifest(config_file):
+    try:
+        with open(_manifest_path(config_file), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("config_stamp") == _config_stamp(config_file) else {}
+
+
+def load_snapshots(config_file, backend="auto", warmup=DEFAULT_WARMUP, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL):
+    """返回场景已有的、与参数一致的快照文件路径列表；没有（或已失效）时返回[]。"""
+    """Return the paths of the existing snapshots of the scenario matching the parameters, or [] when there are none (or they are stale)."""
+    entry = _read_manifest(config_file).get(backend_kind(backend))
+    if not entry or entry["times"] != snapshot_times(warmup, count, interval):
+        return []
+    directory = os.path.dirname(os.path.abspath(config_file))
+    paths = [os.path.join(directory, name) for name in entry["files"]]
+    return paths if all(os.path.exists(path) for path in paths) else []
+
+
+def create_snapshots(env, config_file, warmup=DEFAULT_WARMUP, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL,
+                     seed=None):
+    """用env（SumoEnv）把场景从t=0运行到各快照时刻并保存状态，更新清单，返回快照文件路径列表。运行结束后env处于关闭状态。"""
+    """Run the scenario with env (a SumoEnv) from t=0 to every snapshot time and save the state, update the manifest and return the snapshot paths.
+    env is left closed afterwards."""
+    kind = backend_kind(env.backend)
+    directory = os.path.dirname(os.path.abspath(config_file))
+    times = snapshot_times(warmup, count, interval)
+    files = [f"state_{kind}_{t:g}.{'npz' if kind == 'fake' else 'xml.gz'}" for t in times]
+    env.reset(seed=seed, config_file=config_file)
+    try:
+        for t, name in zip(times, files):
+            # 一次调用推进到目标时刻，不读取观测 One call advances to the target time without reading observations
+            env.connection.simulationStep(t)
+            # 先写临时文件再改名，并行的工作进程不会读到写了一半的快照 Write to a temporary file and rename, so parallel workers never read a half-written snapshot
+            temporary = os.path.join(directory, f".{os.getpid()}_{name}")
+            env.connection.simulation.saveState(temporary)
+            os.replace(temporary, os.path.join(directory, name))
+    finally:
+        env.close()
+    manifest = _read_manifest(config_file)
+    manifest["config_stamp"] = _config_stamp(config_file)
+    manifest[kind] = {"times": times, "files": files, "seed": seed}
+    temporary = f"{_manifest_path(config_file)}.{os.getpid()}"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, _manifest_path(config_file))
+    return [os.path.join(directory, name) for name in files]
+
+
+def ensure_snapshots(env, config_file, warmup=DEFAULT_WARMUP, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL,
+                     seed=None):
+    """返回场景的快照，还没有时先用env创建。"""
+    """Return the snapshots of the scenario, creating them with env first when there are none."""
+    return (load_snapshots(config_file, env.backend, warmup, count, interval)
+            or create_snapshots(env, config_file, warmup, count, interval, seed))
+
+
+def choose_snapshot(snapshots, rng=None):
+    """随机选择一个快照；rng可以是种子或numpy Generator。"""
+    """Pick a random snapshot; rng may be a seed or a numpy Generator."""
+    rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+    return snapshots[int(rng.integers(len(snapshots)))]
@@ -0,0 +1,218 @@
+"""
+强化学习运行时接口
+Runtime interface for RL signal control.
+
+SumoEnv包装一个生成的场景（net + generated_vehicles.rou.xml + accident_config.add.xml，即generate_scenario()写出的
+.sumocfg），提供reset()/step()接口。每一步通过TraCI/libsumo的变量订阅一次性取回J0所有进口车道的指标，写入预先分配的
+numpy观测数组[车道, 指标]，而不是每条车道每个指标一次往返。mode="polling"保留逐项读取的方式，用于基准对比。
+
+SumoEnv wraps a generated scenario (net + generated_vehicles.rou.xml + accident_config.add.xml, i.e. the .sumocfg
+written by generate_scenario()) behind a reset()/step() API. Every step fetches the metrics of all incoming lanes of J0
+in one call through TraCI/libsumo variable subscriptions and writes them into a preallocated numpy observation array
+[lane, metric], instead of one round trip per lane and metric. mode="polling" keeps per-variable reads for benchmarks.
+
+后端 Backends: "libsumo"（进程内，最快 in-process, fastest）、"traci"（TCP）、"fake"（fake_traci，无需SUMO no SUMO needed）
+"auto"依次尝试libsumo和traci "auto" tries libsumo, then traci
+
+动作为信号相位组的序号（signal_plans中的相位顺序），每个相位组在tlLogic中占3个相位（绿、黄、全红），
+因此动作k对应setPhase(3k)。切换到另一个相位组时先走完当前相位组剩余的黄灯（3k+1）和全红（3k+2），各持续YELLOW_TIME和
+ALL_RED_TIME秒，这些过渡步计入回合步数。每步开始时重新读取当前相位，并用setPhaseDuration保持所选的绿灯，
+tlLogic不会自行进入下一个相位。动作为None时不干预信号。tls_id为None时（net.net.xml中J0为无信号交叉口）忽略动作。
+An action is a stage index (the stage order of signal_plans); every stage occupies three tlLogic phases (green,
+yellow, all-red), so action k maps to setPhase(3k). Switching to another stage first runs the yellow (3k+1) and all-red
+(3k+2) phases that remain of the current stage for YELLOW_TIME and ALL_RED_TIME seconds; these transition steps count
+towards the episode steps. The current phase is read again at the start of every step and the chosen green is held with
+setPhaseDuration, so the tlLogic never moves on by itself. An action of None leaves the lights alone. With
+tls_id=None (J0 is unsignalized in net.net.xml) actions are ignored.
+"""
+import os
+
+import numpy as np
+
+import fake_traci
+from fake_traci import (LAST_STEP_MEAN_SPEED, LAST_STEP_OCCUPANCY, LAST_STEP_VEHICLE_HALTING_NUMBER,
+                        LAST_STEP_VEHICLE_NUMBER, VAR_WAITING_TIME)
+from net_index import load_network_index
+from signal_plans import ALL_RED_TIME, YELLOW_TIME
+
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
+try:
+    import traci
+except ImportError:
+    traci = None
+
+# 观测数组的列 Columns of the observation array
+LANE_VARIABLES = (LAST_STEP_VEHICLE_NUMBER, LAST_STEP_MEAN_SPEED, LAST_STEP_OCCUPANCY,
+                  LAST_STEP_VEHICLE_HALTING_NUMBER, VAR_WAITING_TIME)
+OBSERVATION_FIELDS = ("vehicles", "mean_speed", "occupancy", "halting", "waiting_time")
+
+# 逐项轮询时使用的getter Getters used by per-variable polling
+_POLLING_GETTERS = {
+    LAST_STEP_VEHICLE_NUMBER: "getLastStepVehicleNumber",
+    LAST_STEP_MEAN_SPEED: "getLastStepMeanSpeed",
+    LAST_STEP_OCCUPANCY: "getLastStepOccupancy",
+    LAST_STEP_VEHICLE_HALTING_NUMBER: "getLastStepHaltingNumber",
+    VAR_WAITING_TIME: "getWaitingTime",
+}
+
+PHASES_PER_STAGE = 3  # 绿、黄、全红 Green, yellow, all-red
+HOLD_DURATION = 1e6  # 保持所选绿灯时设置的剩余时长（秒） Remaining duration set to hold the chosen green (s)
+
+_HALTING_COLUMN = LANE_VARIABLES.index(LAST_STEP_VEHICLE_HALTING_NUMBER)
+
+
+def sumo_command(config_file, gui=False, seed=None, step_length=1.0, extra_args=()):
+    """返回启动SUMO的命令行。"""
+    """Return the command line that starts SUMO."""
+    command = ["sumo-gui" if gui else "sumo", "-c", config_file, "--step-length", str(step_length),
+               "--no-step-log", "true"]
+    if seed is not None:
+        command += ["--seed", str(seed)]
+    return command + list(extra_args)
+
+
+def start_connection(command, backend="auto", label="default"):
+    """按后端启动SUMO并返回连接对象（libsumo模块本身或traci连接）。"""
+    """Start SUMO with the given backend and return the connection (the libsumo module itself or a traci connection)."""
+    if backend == "auto":
+        backend = "libsumo" if libsumo is not None else "traci"
+    if backend == "libsumo":
+        if libsumo is None:
+            raise ImportError("libsumo is not installed (pip install libsumo or add SUMO_HOME/tools to the path)")
+        libsumo.start(command)
+        return libsumo
+    if backend == "traci":
+        if traci is None:
+            raise ImportError("traci is not installed (pip install traci or add SUMO_HOME/tools to the path)")
+        traci.start(command, label=label)
+        return traci.getConnection(label)
+    raise ValueError(f"unknown backend '{backend}'")
+
+
+class SumoEnv:
+    """J0的信号控制环境。observation为预先分配的数组[进口车道, 指标]，每步原地更新（需要保留时请复制），
+    也可以传入外部缓冲区（如共享内存）。reward为所有进口车道停车车辆数之和的相反数。"""
+    """Signal control environment of J0. observation is a preallocated array [incoming lane, metric] updated in place every step (copy it to keep it);
+    an external buffer (e.g. shared memory) may be passed in instead. The reward is minus the total number of halting vehicles on the incoming lanes."""
+
+    def __init__(self, config_file=None, net_file="net.net.xml", junction_id="J0", tls_id=None, max_steps=3600,
+                 steps_per_action=1, mode="subscription", backend="auto", sumo_args=(), fake_options=None,
+                 observation=None):
+        if mode not in ("subscription", "polling"):
+            raise ValueError(f"unknown mode '{mode}'")
+        index = load_network_index(net_file)
+        incoming = index.junction_incoming_lanes(junction_id)
+        self.lane_ids = index.lane_ids[incoming].tolist()
+        self.lane_length = index.lane_length[incoming]
+        self.config_file = config_file
+        self.tls_id = tls_id
+        self.max_steps = max_steps
+        self.steps_per_action = steps_per_action
+        self.mode = mode
+        self.backend = backend
+        self.sumo_args = list(sumo_args)
+        self.fake_options = dict(fake_options or {})
+        shape = (len(self.lane_ids), len(LANE_VARIABLES))
+        if observation is None:
+            observation = np.zeros(shape, dtype=np.float32)
+        elif observation.shape != shape:
+            raise ValueError(f"observation buffer has shape {observation.shape}, expected {shape}")
+        self.observation = observation
+        self._lane_row = {lane_id: i for i, lane_id in enumerate(self.lane_ids)}
+        self.connection = None
+        self.steps = 0
+
+    @classmethod
+    def from_scenario(cls, scenario, output_dir, **kwargs):
+        """生成场景（见autoscript.generate_scenario()）并返回使用其.sumocfg的环境。"""
+        """Generate a scenario (see autoscript.generate_scenario()) and return an environment running its .sumocfg."""
+        import autoscript
+        os.makedirs(output_dir, exist_ok=True)
+        paths = autoscript.generate_scenario(scenario, output_dir, config_name="scenario.sumocfg")
+        return cls(paths["config_file"], net_file=scenario["net_file"], **kwargs)
+
+    def _connect(self, seed):
+        if self.backend == "fake":
+            # reset()本身推进一步，回合仍有max_steps步 reset() itself advances one step, so the episode still has max_steps steps
+            return fake_traci.FakeTraCI(self.lane_ids, self.lane_length, end_time=self.max_steps + 1, seed=seed,
+                                        **self.fake_options)
+        return start_connection(sumo_command(self.config_file, seed=seed, extra_args=self.sumo_args), self.backend,
+                                label=f"env_{id(self)}")
+
+    def reset(self, seed=None, config_file=None, snapshot=None):
+        """重新启动仿真（可切换到新的场景文件），订阅所有进口车道的指标并返回初始观测。
+        snapshot为状态文件（见snapshots模块）时从该状态开始，跳过预热；回合步数仍从0计。"""
+        """Restart the simulation (optionally with a new scenario file), subscribe to the metrics of every incoming lane and return the first observation.
+        With snapshot, a state file (see the snapshots module), the simulation starts from that state and skips the warm-up; episode steps still count from 0."""
+        self.close()
+        if config_file is not None:
+            self.config_file = config_file
+        self.connection = self._connect(seed)
+        if snapshot is not None:
+            self.connection.simulation.loadState(snapshot)
+        self.steps = 0
+        if self.mode == "subscription":
+            for lane_id in self.lane_ids:
+                self.connection.lane.subscribe(lane_id, LANE_VARIABLES)
+        self.connection.simulationStep()
+        self._read()
+        return self.observation
+
+    def _read(self):
+        if self.mode == "subscription":
+            # 一次调用取回所有订阅结果 One call returns every subscription result
+            for lane_id, values in self.connection.lane.getAllSubscriptionResults().items():
+                row = self._lane_row.get(lane_id)
+                if row is not None:
+                    self.observation[row] = [values[var] for var in LANE_VARIABLES]
+        else:
+            lane = self.connection.lane
+            for row, lane_id in enumerate(self.lane_ids):
+                for column, var in enumerate(LANE_VARIABLES):
+                    self.observation[row, column] = getattr(lane, _POLLING_GETTERS[var])(lane_id)
+
+    def step(self, action=None):
+        """执行动作（相位组序号）并推进steps_per_action个仿真步，返回(observation, reward, done, info)。
+        动作切换相位组时先推进黄灯和全红的过渡步（info["transition_steps"]）。"""
+        """Apply an action (stage index), advance steps_per_action simulation steps and return (observation, reward, done, info).
+        An action that changes the stage first advances through the yellow and all-red transition steps (info["transition_steps"])."""
+        transition_steps = 0
+        if action is not None and self.tls_id is not None:
+            # tlLogic可能已自行切换相位，每步重新读取 The tlLogic may have moved on by itself, so read the phase every step
+            phase = self.connection.trafficlight.getPhase(self.tls_id)
+            if phase != int(action) * PHASES_PER_STAGE:
+                transition_steps = self._switch(phase, int(action))
+            else:
+                self.connection.trafficlight.setPhaseDuration(self.tls_id, HOLD_DURATION)
+        for _ in range(self.steps_per_action):
+            self.connection.simulationStep()
+        self.steps += transition_steps + self.steps_per_action
+        self._read()
+        reward = -float(self.observation[:, _HALTING_COLUMN].sum())
+        done = self.steps >= self.max_steps or self.connection.simulation.getMinExpectedNumber() <= 0
+        return self.observation, reward, done, {"steps": self.steps, "transition_steps": transition_steps}
+
+    def _switch(self, phase, stage):
+        """从当前相位phase走完其相位组剩余的黄灯、全红，切换到stage的绿灯并保持，返回推进的仿真步数。"""
+        """Run the yellow and all-red that remain of the stage of the current phase, then switch to the green of stage and hold it; returns the number of simulation steps advanced."""
+        steps = 0
+        trafficlight = self.connection.trafficlight
+        current, position = divmod(phase, PHASES_PER_STAGE)
+        for offset, duration in ((1, YELLOW_TIME), (2, ALL_RED_TIME)):
+            if offset <= position:
+                continue
+            trafficlight.setPhase(self.tls_id, current * PHASES_PER_STAGE + offset)
+            for _ in range(int(round(duration))):
+                self.connection.simulationStep()
+                steps += 1
+        trafficlight.setPhase(self.tls_id, stage * PHASES_PER_STAGE)
+        trafficlight.setPhaseDuration(self.tls_id, HOLD_DURATION)
+        return steps
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,356 @@
+"""
+SUMO输出文件的流式解析
+Streaming parser of SUMO output files.
+
+用expat逐块读取tripinfo、edgeData、laneData、queue、E1/E2检测器和fcd输出（也支持.xml.gz），不建立元素树，每累计chunk_size条记录
+转换为一块numpy列（数值列为float64，缺失的属性为NaN；字符串列为unicode数组）。内存占用只取决于chunk_size，
+与文件大小无关。父元素的属性（如interval的begin/end、timestep的time）作为上下文列附加到每条记录上。
+
+Reads tripinfo, edgeData, laneData, queue, E1/E2 detector and fcd outputs (.xml.gz too) block by block with expat, without building an
+element tree, and turns every chunk_size records into one chunk of numpy columns (numeric columns as float64 with NaN
+for missing attributes, string columns as unicode arrays). Memory depends only on chunk_size, not on the file size.
+Attributes of the parent elements (begin/end of an interval, time of a timestep, ...) are attached to every record as
+context columns.
+
+load_output()可把整列结果写入按文件内容哈希寻址的.npz缓存，再次读取同一文件时直接加载。
+trip_kpis()/queue_kpis()逐块累加统计量，计算延误、等待时间、排队长度以及紧急车辆与普通车辆的行程时间对比；
+detector_kpis()按检测器汇总E1/E2的聚合输出（见detectors）。
+
+load_output() can store the full columns in a .npz cache addressed by the file content hash, so the same file is only
+parsed once. trip_kpis()/queue_kpis() accumulate statistics chunk by chunk to compute delays, waiting times, queue
+lengths and the travel time of emergency vehicles against regular ones; detector_kpis() summarizes the aggregated
+E1/E2 outputs per detector (see detectors).
+
+用法 Usage:
+    python sumo_outputs.py --tripinfo tripinfo.xml --queue queue.xml --e2 e2_output.xml
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import xml.parsers.expat
+
+import numpy as np
+
+PARSER_VERSION = 1  # 列格式变化时递增，使旧缓存失效 Bump when the column format changes to invalidate old caches
+
+# 每种输出的记录元素、上下文元素（元素名: 属性）、字符串列和数值列
+# Record element, context elements (element: attributes), string columns and numeric columns of every output
+OUTPUT_FORMATS = {
+    "tripinfo": {
+        "record": "tripinfo",
+        "context": {},
+        "strings": ("id", "vType"),
+        "numbers": ("depart", "departDelay", "arrival", "duration", "routeLength", "waitingTime", "waitingCount",
+                    "timeLoss"),
+    },
+    "edgedata": {
+        "record": "edge",
+        "context": {"interval": ("begin", "end")},
+        "strings": ("id",),
+        "numbers": ("sampledSeconds", "traveltime", "density", "occupancy", "waitingTime", "speed", "entered",
+                    "left"),
+    },
+    "lanedata": {
+        "record": "lane",
+        "context": {"interval": ("begin", "end")},
+        "strings": ("id",),
+        "numbers": ("sampledSeconds", "traveltime", "density", "occupancy", "waitingTime", "speed", "entered",
+                    "left"),
+    },
+    "queue": {
+        "record": "lane",
+        "context": {"data": ("timestep",)},
+        "strings": ("id",),
+        "numbers": ("queueing_time", "queueing_length", "queueing_length_experimental"),
+    },
+    # E1感应线圈与E2区域检测器的聚合输出（见detectors） Aggregated outputs of E1 induction loops and E2 lane area detectors (see detectors)
+    "e1": {
+        "record": "interval",
+        "context": {},
+        "strings": ("id",),
+        "numbers": ("begin", "end", "nVehContrib", "flow", "occupancy", "speed", "harmonicMeanSpeed", "length",
+                    "nVehEntered"),
+    },
+    "e2": {
+        "record": "interval",
+        "context": {},
+        "strings": ("id",),
+        "numbers": ("begin", "end", "sampledSeconds", "nVehEntered", "nVehLeft", "nVehSeen", "meanSpeed",
+                    "meanTimeLoss", "meanOccupancy", "maxOccupancy", "meanMaxJamLengthInVehicles",
+                    "meanMaxJamLengthInMeters", "maxJamLengthInVehicles", "maxJamLengthInMeters",
+                    "meanHaltingDuration", "maxHaltingDuration"),
+    },
+    # 生成的路线文件（autoscript写出的.rou.xml），用于把输出中的车辆ID关联到路线
+    # Generated route files (the .rou.xml written by autoscript), to join vehicle IDs of the outputs to their routes
+    "vehicles": {
+        "record": "vehicle",
+        "context": {},
+        "strings": ("id", "type", "route"),
+        "numbers": ("depart",),
+    },
+    "flows": {
+        "record": "flow",
+        "context": {},
+        "strings": ("id", "type", "route"),
+        "numbers": ("begin", "end"),
+    },
+    "fcd": {
+        "record": "vehicle",
+        "context": {"timestep": ("time",)},
+        "strings": ("id", "type", "lane"),
+        "numbers": ("x", "y", "angle", "speed", "pos"),
+    },
+}
+
+_READ_SIZE = 1 << 20  # 每次交给expat的字节数 Bytes handed to expat at a time
+
+
+def _open(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def output_columns(kind):
+    """返回一种输出的所有列名（上下文列在前）。"""
+    """Return every column name of an output kind (context columns first)."""
+    spec = OUTPUT_FORMATS[kind]
+    context = tuple(name for names in spec["context"].values() for name in names)
+    return context + spec["strings"] + spec["numbers"]
+
+
+def record_column(kind):
+    """返回每条记录都有的列（用于计数）。"""
+    """Return a column every record has (used for counting)."""
+    return OUTPUT_FORMATS[kind]["strings"][0]
+
+
+def iter_output_chunks(path, kind, chunk_size=65536, counts=None):
+    """逐块读取SUMO输出文件，每块为{列名: numpy数组}。给出counts（字典）时把每种上下文元素（如queue输出的<data>）的个数累加到其中，
+    包括其中没有记录的元素；读完文件后计数才完整。"""
+    """Read a SUMO output file chunk by chunk; every chunk is {column name: numpy array}. With counts (a dict) the number of every context element
+    (e.g. the <data> elements of a queue output) is added to it, including elements without records; the counts are complete once the file is read."""
+    spec = OUTPUT_FORMATS[kind]
+    record = spec["record"]
+    context_spec = spec["context"]
+    context_names = tuple(name for names in context_spec.values() for name in names)
+    string_names = spec["strings"]
+    number_names = spec["numbers"]
+    context = dict.fromkeys(context_names, "nan")
+    columns = {name: [] for name in context_names + string_names + number_names}
+    # 按列表顺序追加，避免每条记录查字典 Append through bound methods to avoid a dict lookup per record
+    context_appends = [(name, columns[name].append) for name in context_names]
+    string_appends = [(name, columns[name].append) for name in string_names]
+    number_appends = [(name, columns[name].append) for name in number_names]
+
+    def start(name, attrs):
+        if name == record:
+            for column, append in context_appends:
+                append(context[column])
+            for column, append in string_appends:
+                append(attrs.get(column, ""))
+            for column, append in number_appends:
+                append(attrs.get(column, "nan"))
+        elif name in context_spec:
+            if counts is not None:
+                counts[name] = counts.get(name, 0) + 1
+            for column in context_spec[name]:
+                context[column] = attrs.get(column, "nan")
+
+    def flush():
+        chunk = {}
+        for name, values in columns.items():
+            if name in string_names:
+                chunk[name] = np.array(values, dtype=str)
+            else:
+                chunk[name] = np.array(values, dtype=np.float64)
+            values.clear()
+        return chunk
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start
+    rows = columns[record_column(kind)]
+    with _open(path) as f:
+        while True:
+            block = f.read(_READ_SIZE)
+            parser.Parse(block, not block)
+            if len(rows) >= chunk_size or (not block and rows):
+                yield flush()
+            if not block:
+                break
+
+
+def read_output(path, kind, chunk_size=65536):
+    """读取整个输出文件，返回{列名: numpy数组}。"""
+    """Read a whole output file and return {column name: numpy array}."""
+    chunks = list(iter_output_chunks(path, kind, chunk_size))
+    if not chunks:
+        return {name: np.array([], dtype=str if name in OUTPUT_FORMATS[kind]["strings"] else np.float64)
+                for name in output_columns(kind)}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def file_hash(path):
+    """按块计算文件内容的SHA-256。"""
+    """SHA-256 of the file content, computed block by block."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_output(path, kind, cache_dir=None, chunk_size=65536):
+    """读取输出文件的全部列；指定cache_dir时使用以(文件内容哈希, 输出类型, 解析器版本)为键的.npz缓存。"""
+    """Read every column of an output file; with cache_dir, use a .npz cache keyed by (file content hash, output kind, parser version)."""
+    if cache_dir is None:
+        return read_output(path, kind, chunk_size)
+    cache_file = os.path.join(cache_dir, f"{kind}_{file_hash(path)[:32]}_v{PARSER_VERSION}.npz")
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as data:
+            return {name: data[name] for name in data.files}
+    columns = read_output(path, kind, chunk_size)
+    os.makedirs(cache_dir, exist_ok=True)
+    # 先写临时文件再重命名，并发读取时不会看到不完整的缓存 Write a temporary file and rename it so concurrent readers never see a partial cache
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp_file, **columns)
+    os.replace(tmp_file, cache_file)
+    return columns
+
+
+def vehicle_class(type_ids):
+    """由车辆类型ID得到车辆类别：去掉天气后缀（car_rain -> car，见weather.py）。"""
+    """Vehicle class from vehicle type IDs: the weather suffix is dropped (car_rain -> car, see weather.py)."""
+    return np.char.partition(np.asarray(type_ids, dtype=str), "_")[:, 0]
+
+
+def trip_kpis(path, chunk_size=65536):
+    """由tripinfo输出逐块计算每个车辆类别的KPI：车辆数、平均延误（timeLoss）、平均等待时间、平均行程时间、最大延误，
+    以及紧急车辆与普通车辆（car）平均行程时间之比。"""
+    """Compute per vehicle class KPIs from a tripinfo output chunk by chunk: vehicle count, mean delay (timeLoss), mean waiting time, mean travel time and maximum delay,
+    plus the ratio of the mean travel times of emergency vehicles and regular vehicles (car)."""
+    totals = {}
+    for chunk in iter_output_chunks(path, "tripinfo", chunk_size):
+        classes, inverse = np.unique(vehicle_class(chunk["vType"]), return_inverse=True)
+        n = len(classes)
+        counts = np.bincount(inverse, minlength=n)
+        sums = {column: np.bincount(inverse, weights=np.nan_to_num(chunk[column]), minlength=n)
+                for column in ("timeLoss", "waitingTime", "duration")}
+        max_delay = np.full(n, -np.inf)
+        np.maximum.at(max_delay, inverse, np.nan_to_num(chunk["timeLoss"], nan=-np.inf))
+        for i, name in enumerate(classes.tolist()):
+            total = totals.setdefault(name, {"count": 0, "timeLoss": 0.0, "waitingTime": 0.0, "duration": 0.0,
+                                             "max_delay": -np.inf})
+            total["count"] += int(counts[i])
+            for column, values in sums.items():
+                total[column] += float(values[i])
+            total["max_delay"] = max(total["max_delay"], float(max_delay[i]))
+
+    kpis = {name: {"vehicles": total["count"],
+                   "mean_delay": total["timeLoss"] / total["count"],
+                   "mean_waiting_time": total["waitingTime"] / total["count"],
+                   "mean_travel_time": total["duration"] / total["count"],
+                   "max_delay": total["max_delay"]}
+            for name, total in sorted(totals.items())}
+    if "emergency" in kpis and "car" in kpis:
+        kpis["emergency_travel_time_ratio"] = (kpis["emergency"]["mean_travel_time"] /
+                                               kpis["car"]["mean_travel_time"])
+    return kpis
+
+
+def queue_kpis(path, chunk_size=65536):
+    """由queue输出逐块计算排队KPI：平均总排队长度（每个时间步所有车道之和的平均值，米）、单车道最大排队长度、
+    平均排队时间。queue输出只列出有排队的车道，但每个时间步都有一个<data>元素，平均值按所有时间步计算（没有排队的时间步计为0）。"""
+    """Compute queue KPIs from a queue output chunk by chunk: mean total queue length (per time step summed over lanes, then averaged, in m), maximum single-lane queue length
+    and mean queueing time. The queue output lists only lanes with a queue but has a <data> element for every time step, so the average runs over every
+    time step (steps without a queue count as 0)."""
+    counts = {}
+    total_length = 0.0
+    max_length = 0.0
+    total_time = 0.0
+    records = 0
+    for chunk in iter_output_chunks(path, "queue", chunk_size, counts):
+        length = np.nan_to_num(chunk["queueing_length"])
+        total_length += float(length.sum())
+        max_length = max(max_length, float(length.max()))
+        total_time += float(np.nan_to_num(chunk["queueing_time"]).sum())
+        records += len(length)
+    timesteps = counts.get("data", 0)
+    return {"timesteps": int(timesteps),
+            "mean_total_queue_length": total_length / timesteps if timesteps else 0.0,
+            "max_queue_length": max_length,
+            "mean_queueing_time": total_time / records if records else 0.0}
+
+
+# 每种检测器输出按检测器汇总的列：(列, 汇总方式) Columns summarized per detector for every detector output: (column, reduction)
+DETECTOR_SUMMARIES = {
+    "e1": (("nVehContrib", "sum"), ("flow", "mean"), ("occupancy", "mean"), ("speed", "mean")),
+    "e2": (("nVehSeen", "sum"), ("meanTimeLoss", "mean"), ("meanOccupancy", "mean"),
+           ("meanMaxJamLengthInMeters", "mean"), ("maxJamLengthInMeters", "max")),
+}
+
+
+def detector_kpis(path, kind="e2", chunk_size=65536):
+    """由E1/E2检测器的聚合输出逐块计算每个检测器的汇总值（见DETECTOR_SUMMARIES），返回{检测器ID: {列: 值}}。
+    均值是各聚合区间的平均值，缺失值（如区间内无车时E1的speed为-1）不计入。"""
+    """Summarize the aggregated output of E1/E2 detectors per detector chunk by chunk (see DETECTOR_SUMMARIES) and return {detector ID: {column: value}}.
+    Means are taken over the aggregation intervals, skipping missing values (e.g. the -1 speed of an E1 interval without vehicles)."""
+    summaries = DETECTOR_SUMMARIES[kind]
+    totals = {}
+    for chunk in iter_output_chunks(path, kind, chunk_size):
+        ids, inverse = np.unique(chunk["id"], return_inverse=True)
+        n = len(ids)
+        reduced = {}
+        for column, how in summaries:
+            values = chunk[column]
+            valid = ~np.isnan(values) & (values >= 0)
+            if how == "max":
+                result = np.full(n, -np.inf)
+                np.maximum.at(result, inverse[valid], values[valid])
+                reduced[column] = (result, None)
+            else:
+                reduced[column] = (np.bincount(inverse[valid], weights=values[valid], minlength=n),
+                                   np.bincount(inverse[valid], minlength=n))
+        for i, detector_id in enumerate(ids.tolist()):
+            total = totals.setdefault(detector_id, {column: [0.0, 0] for column, _ in summaries})
+            for column, how in summaries:
+                value, count = reduced[column]
+                if how == "max":
+                    total[column][0] = max(total[column][0], float(value[i]))
+                else:
+                    total[column][0] += float(value[i])
+                    total[column][1] += int(count[i])
+    return {detector_id: {column: (total[column][0] / total[column][1] if total[column][1] else float("nan"))
+                          if how == "mean" else total[column][0]
+                          for column, how in summaries}
+            for detector_id, total in sorted(totals.items())}
+
+
+def scenario_kpis(outputs, chunk_size=65536):
+    """按可用的输出文件计算一个场景的KPI，outputs为{"tripinfo": 路径, "queue": 路径, "e1": 路径, "e2": 路径}（均可省略）。"""
+    """Compute the KPIs of one scenario from whichever outputs exist; outputs is {"tripinfo": path, "queue": path, "e1": path, "e2": path} (all optional)."""
+    kpis = {}
+    if outputs.get("tripinfo"):
+        kpis["trips"] = trip_kpis(outputs["tripinfo"], chunk_size)
+    if outputs.get("queue"):
+        kpis["queue"] = queue_kpis(outputs["queue"], chunk_size)
+    for kind in ("e1", "e2"):
+        if outputs.get(kind):
+            kpis[kind] = detector_kpis(outputs[kind], kind, chunk_size)
+    return kpis
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scenario KPIs from SUMO output files")
+    parser.add_argument("--tripinfo", default=None, help="tripinfo output (--tripinfo-output)")
+    parser.add_argument("--queue", default=None, help="queue output (--queue-output)")
+    parser.add_argument("--e1", default=None, help="aggregated E1 induction loop output")
+    parser.add_argument("--e2", default=None, help="aggregated E2 lane area detector output")
+    parser.add_argument("--chunk-size", type=int, default=65536, help="records per parsed chunk")
+    args = parser.parse_args()
+    print(json.dumps(scenario_kpis({"tripinfo": args.tripinfo, "queue": args.queue, "e1": args.e1,
+                                     "e2": args.e2}, args.chunk_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
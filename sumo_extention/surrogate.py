@@ -0,0 +1,358 @@
+"""
+J0的向量化点排队替代模型
+Vectorized point-queue surrogate model of J0.
+
+参数扫描中每个候选配时方案或需求变体都跑一次完整的SUMO是瓶颈。QueueSurrogate用numpy把J0的每条进口车道建模为一个
+点排队（竖直排队）：车辆按生成器的车辆表出发，经过进口车道的自由流行驶时间到达停车线，按车道的饱和车头时距在有效绿灯
+内驶离。车道数、车道长度、限速和各车道的转向来自net.net.xml（网络索引），相位来自signal_plans的相位模板，饱和车头时距
+由vType参数计算。数千个配时方案（以及多个场景的到达）在同一组数组上逐时间步一起推进，一次计算全部结果，用于在正式的
+微观仿真之前剪枝搜索空间。
+
+Running full SUMO for every candidate timing plan or demand variant is the bottleneck of parameter sweeps.
+QueueSurrogate models every incoming lane of J0 as a point (vertical) queue with numpy: vehicles depart according to
+the generator's vehicle table, reach the stop line after the free-flow travel time of the incoming lane and discharge
+at the lane's saturation headway during effective green. Lane counts, lengths, speed limits and the movements of every
+lane come from net.net.xml (the network index), the stages from the signal_plans stage template, and the saturation
+headways from the vType parameters. Thousands of timing plans (and the arrivals of several scenarios) advance together
+on one set of arrays time step by time step, so one computation evaluates all of them to prune the search space before
+committing to full microsimulation runs.
+
+模型 Model:
+    到达停车线时间 = 出发时间 + 进口车道长度/v + v/(2·accel)，v = min(车道限速, maxSpeed)（与preemption相同）
+    饱和车头时距 h = tau + (length + minGap) / v_link，v_link为该车道各转向的交叉口内部车道限速的平均值
+    有效绿灯从绿灯开始后STARTUP_LOST秒到黄灯的前YELLOW_USE秒，许可型（"g"）转向的通行能力乘以permissive_factor
+    q[t+1] = max(q[t] + 到达[t] - 通行能力[t], 0)，延误为排队面积Σq·dt（停车延误，不含加减速损失）
+    Stop line arrival = departure + incoming lane length / v + v / (2·accel), v = min(lane speed limit, maxSpeed) (as in preemption)
+    Saturation headway h = tau + (length + minGap) / v_link, v_link being the mean speed limit of the lane's internal junction lanes
+    Effective green runs from STARTUP_LOST seconds after the green starts into the first YELLOW_USE seconds of yellow; permissive ("g") movements get permissive_factor of the capacity
+    q[t+1] = max(q[t] + arrivals[t] - capacity[t], 0), and the delay is the queue area Σq·dt (stopped delay, acceleration losses excluded)
+
+与SUMO的可比性 Comparability with SUMO:
+    kpis()返回与sumo_outputs.trip_kpis()/queue_kpis()相同键名的结果：平均延误对应tripinfo的timeLoss，总排队长度
+    （米，车辆数×(length+minGap)）对应queue输出的queueing_length。点排队不考虑排队的空间长度与溢出、换道和特殊车辆
+    （紧急车辆、事故），高饱和度下的误差会变大，适合排序与剪枝而不是替代SUMO的结果。
+    kpis() returns results under the same keys as sumo_outputs.trip_kpis()/queue_kpis(): the mean delay corresponds to
+    tripinfo timeLoss and the total queue length (m, vehicles × (length + minGap)) to the queueing_length of the queue
+    output. Point queues ignore the spatial extent of queues and spillback, lane changes and special vehicles
+    (emergency vehicles, accidents), so the error grows near saturation: use it to rank and prune, not to replace SUMO.
+
+用法 Usage:
+    python surrogate.py --cycles 60 90 120 --splits "[[1,1,1,1],[2,1,2,1]]" --offsets 0 --top 10
+    python surrogate.py --cycles 90 --tripinfo tripinfo.xml --queue queue.xml
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import autoscript
+from demand_profile import load_demand_profile
+from net_index import load_network_index
+from signal_plans import ALL_RED_TIME, YELLOW_TIME, load_signal_template
+from sumo_outputs import queue_kpis, trip_kpis
+
+STARTUP_LOST = 2.0  # 绿灯开始后的启动损失时间（秒） Start-up lost time after the green starts (s)
+YELLOW_USE = 2.0  # 黄灯中仍有车辆驶离的时间（秒） Part of the yellow still used by discharging vehicles (s)
+PERMISSIVE_FACTOR = 0.5  # 许可型转向（需让行）的通行能力比例 Capacity share of permissive (yielding) movements
+DRAIN_TIME = 600.0  # 默认时长在最后一次到达之后延长的时间（秒） Time the default horizon runs past the last arrival (s)
+
+# SUMO vType的默认值 SUMO vType defaults
+_TYPE_DEFAULTS = {"accel": 2.6, "length": 5.0, "minGap": 2.5, "tau": 1.0, "maxSpeed": 55.55}
+
+
+def _type_value(params, key):
+    return float(params.get(key, _TYPE_DEFAULTS[key]))
+
+
+class QueueSurrogate:
+    """交叉口的点排队替代模型。type_params为vType参数列表（默认取autoscript.default_scenario()的），
+    template为signal_plans的相位模板（默认从net_file加载）。"""
+    """Point-queue surrogate of a junction. type_params is a list of vType parameters (those of autoscript.default_scenario() by default)
+    and template a signal_plans stage template (loaded from net_file by default)."""
+
+    def __init__(self, net_file="net.net.xml", junction_id="J0", type_params=None, template=None, step=1.0,
+                 permissive_factor=PERMISSIVE_FACTOR, startup_lost=STARTUP_LOST, yellow_use=YELLOW_USE):
+        index = load_network_index(net_file)
+        self.index = index
+        self.template = template or load_signal_template(net_file, junction_id)
+        self.type_params = {entry["type_id"]: entry for entry in
+                            (type_params or autoscript.default_scenario()["type_params"])}
+        self.step = step
+        self.startup_lost = startup_lost
+        self.yellow_use = yellow_use
+
+        incoming = index.junction_incoming_lanes(junction_id)
+        self.lane_ids = index.lane_ids[incoming].tolist()
+        self.lane_length = index.lane_length[incoming]
+        self.lane_speed = index.lane_speed[incoming]
+        self.lane_edge = index.edge_ids[index.lane_edge[incoming]].tolist()
+        self.approach_ids = list(dict.fromkeys(self.lane_edge))
+        self.lane_approach = np.array([self.approach_ids.index(edge) for edge in self.lane_edge])
+        self._lane_row = {lane_id: row for row, lane_id in enumerate(self.lane_ids)}
+
+        # 每条车道驶过交叉口的速度：各转向内部车道限速的平均值（没有内部车道时用车道限速）
+        # Speed through the junction per lane: mean speed limit of the internal lanes of its movements (the lane speed without internal lanes)
+        self.junction_speed = np.empty(len(incoming))
+        for row, lane in enumerate(incoming.tolist()):
+            via = index.conn_via_lane[index.lane_connections(lane)]
+            via = via[via >= 0]
+            self.junction_speed[row] = index.lane_speed[via].mean() if len(via) else self.lane_speed[row]
+
+        # 每个相位组对每条车道的放行比例[相位组, 车道]："G"为1，只有"g"时为permissive_factor
+        # Share of every lane served by every stage [stage, lane]: 1 for "G", permissive_factor with only "g"
+        link_rows = np.array([self._lane_row[lane_id] for lane_id in self.template.from_lanes])
+        self.stage_share = np.zeros((self.template.num_stages, len(self.lane_ids)))
+        for stage, state in enumerate(self.template.green_states):
+            share = np.array([1.0 if c == "G" else permissive_factor if c == "g" else 0.0 for c in state])
+            np.maximum.at(self.stage_share[stage], link_rows, share)
+
+    def _type(self, type_id):
+        # 天气类型（如car_rain）没有单独的参数时退回到基础类型 Weather types (e.g. car_rain) fall back to their base type
+        return self.type_params.get(type_id) or self.type_params.get(type_id.partition("_")[0]) or {}
+
+    def headways(self, type_id="car"):
+        """车辆类型在每条车道上的饱和车头时距（秒）。"""
+        """Saturation headway of a vehicle type on every lane (s)."""
+        params = self._type(type_id)
+        speed = np.minimum(self.junction_speed, _type_value(params, "maxSpeed"))
+        return _type_value(params, "tau") + (_type_value(params, "length") + _type_value(params, "minGap")) / speed
+
+    def travel_times(self, type_id="car"):
+        """车辆类型从进口车道起点静止出发到达停车线的自由流时间（秒），每条车道一个值。"""
+        """Free-flow time of a vehicle type from standstill at the start of the incoming lane to the stop line (s), one value per lane."""
+        params = self._type(type_id)
+        speed = np.minimum(self.lane_speed, _type_value(params, "maxSpeed"))
+        return self.lane_length / speed + speed / (2 * _type_value(params, "accel"))
+
+    def assign_lanes(self, table, route_edges):
+        """车辆表中每辆车使用的进口车道行号（-1为不经过该交叉口）。车辆表有"lane_ids"/"lane"列时直接使用，
+        否则同一路线的车辆依次轮流使用可以驶往其下一条edge的车道（即在这些车道间平均分配）。"""
+        """Incoming lane row of every vehicle of a vehicle table (-1 for vehicles not crossing the junction). Tables with "lane_ids"/"lane" columns are used as they are;
+        otherwise the vehicles of a route take turns on the lanes leading to its next edge (an even split over those lanes)."""
+        route_ids = list(table["route_ids"])
+        if "lane" in table and "lane_ids" in table:
+            rows = np.array([self._lane_row.get(lane_id, -1) for lane_id in table["lane_ids"]])
+            return rows[table["lane"]]
+        route = np.asarray(table["route"])
+        lanes = np.full(len(route), -1)
+        # 每辆车在本路线中的序号 Rank of every vehicle within its route
+        order = np.argsort(route, kind="stable")
+        counts = np.bincount(route, minlength=len(route_ids))
+        rank = np.empty(len(route), dtype=np.int64)
+        rank[order] = np.arange(len(route)) - np.repeat(np.cumsum(counts) - counts, counts)
+        for r, route_id in enumerate(route_ids):
+            edges = route_edges[route_id].split()
+            usable = [row for row, lane_id in enumerate(self.lane_ids) if edges[0] == self.lane_edge[row] and
+                      (len(edges) == 1 or edges[1] in self.index.lane_targets(lane_id))]
+            if usable:
+                members = route == r
+                lanes[members] = np.array(usable)[rank[members] % len(usable)]
+        return lanes
+
+    def arrivals(self, table, route_edges, horizon=None):
+        """把车辆表转换为到达停车线的车辆数[时间步, 车道]。返回(到达, 每条车道的平均饱和车头时距)。"""
+        """Turn a vehicle table into stop line arrivals [time step, lane]. Returns (arrivals, mean saturation headway of every lane)."""
+        lanes = self.assign_lanes(table, route_edges)
+        type_ids = list(table.get("type_ids", ["car"]))
+        types = np.asarray(table["type"]) if "type" in table else np.zeros(len(lanes), dtype=np.int64)
+        travel = np.array([self.travel_times(type_id) for type_id in type_ids])  # [类型, 车道] [type, lane]
+        headway = np.array([self.headways(type_id) for type_id in type_ids])
+        crossing = lanes >= 0
+        lanes, types = lanes[crossing], types[crossing]
+        arrival = np.asarray(table["depart"], dtype=float)[crossing] + travel[types, lanes]
+        if horizon is None:
+            horizon = (arrival.max() if len(arrival) else 0.0) + DRAIN_TIME
+        num_steps = int(np.ceil(horizon / self.step))
+        bins = np.minimum((arrival // self.step).astype(np.int64), num_steps - 1)
+        counts = np.bincount(bins * len(self.lane_ids) + lanes, minlength=num_steps * len(self.lane_ids))
+        # 车道的平均车头时距按到达车辆的类型加权 The mean headway of a lane is weighted by the types of its arrivals
+        per_lane = np.bincount(lanes, minlength=len(self.lane_ids))
+        mean_headway = np.bincount(lanes, weights=headway[types, lanes], minlength=len(self.lane_ids))
+        mean_headway = np.where(per_lane > 0, mean_headway / np.maximum(per_lane, 1), headway[0])
+        return counts.reshape(num_steps, len(self.lane_ids)).astype(float), mean_headway
+
+    def scenario_arrivals(self, scenario, horizon=None):
+        """按场景参数（见autoscript.default_scenario()）采样普通车辆并返回arrivals()的结果；支持固定间隔、需求曲线与车道需求，
+        不写任何文件。特殊车辆不参与。"""
+        """Sample the regular vehicles of a scenario (see autoscript.default_scenario()) and return the result of arrivals(); constant headway,
+        demand profile and per-lane demand are supported and no file is written. Special vehicles are left out."""
+        route_definitions = scenario["route_definitions"]
+        if route_definitions == "auto":
+            route_definitions = self.index.enumerate_routes(scenario.get("route_k", 1))
+        route_edges = {route_def["route_id"]: route_def["edges"] for route_def in route_definitions}
+        if scenario["route_probabilities"] == "uniform":
+            probabilities = {route_id: 1.0 / len(route_edges) for route_id in route_edges}
+        else:
+            total = sum(scenario["route_probabilities"].values())
+            probabilities = {route_id: p / total for route_id, p in scenario["route_probabilities"].items()}
+        demand_profile, lane_demand = scenario.get("demand_profile"), scenario.get("lane_demand")
+        if isinstance(demand_profile, str):
+            demand_profile = load_demand_profile(demand_profile)
+        if isinstance(lane_demand, str):
+            lane_demand = load_demand_profile(lane_demand, key="counts")
+        if lane_demand is not None:
+            table = autoscript.build_lane_table(lane_demand, self.index, route_edges, probabilities,
+                                                seed=scenario.get("seed"), colors=False)
+        elif demand_profile is not None:
+            table = autoscript.build_profile_table(demand_profile, probabilities, seed=scenario.get("seed"),
+                                                   colors=False)
+        else:
+            table = autoscript.build_vehicle_table(list(probabilities), list(probabilities.values()),
+                                                   scenario["num_vehicles"], scenario["base_depart_interval"],
+                                                   scenario["interval_std_dev"], seed=scenario.get("seed"),
+                                                   colors=False)
+        return self.arrivals(table, route_edges, horizon)
+
+    def _stage_windows(self, plans):
+        """每个方案每个相位组的有效绿灯区间（相对周期起点）与周期：(开始[方案, 相位组], 结束[方案, 相位组], 周期[方案])。"""
+        """Effective green windows of every stage of every plan relative to the cycle start, and the cycles: (begin [plan, stage], end [plan, stage], cycle [plan])."""
+        green = np.asarray(plans["green"], dtype=float).reshape(-1, self.template.num_stages)
+        stage_length = green + YELLOW_TIME + ALL_RED_TIME
+        start = np.cumsum(stage_length, axis=1) - stage_length
+        cycle = stage_length.sum(axis=1)
+        return start + self.startup_lost, start + green + min(self.yellow_use, YELLOW_TIME), cycle
+
+    def evaluate(self, arrivals, headway, plans):
+        """对所有配时方案（plan_grid()的格式）和所有场景一起推进点排队模型。arrivals为[时间步, 车道]或[场景, 时间步, 车道]，
+        headway为对应的[车道]或[场景, 车道]。返回的数组形状为[场景, 方案, ...]：
+        "arrived"/"served"/"residual"（车辆数）、"delay"（车辆·秒）、"queue_mean"/"queue_max"（车辆数，均为[场景, 方案, 车道]），
+        以及"mean_delay"[场景, 方案]（每辆到达车辆的平均延误）与"total_queue_mean"[场景, 方案]（所有车道之和的时间平均，车辆数）。
+        total_queue_mean与sumo_outputs.queue_kpis()一样按路网清空前的时间步平均（到最后一个有到达或有排队的时间步为止），不计入DRAIN_TIME中空闲的部分。"""
+        """Advance the point-queue model for every timing plan (in the plan_grid() format) and every scenario together. arrivals is [step, lane] or [scenario, step, lane]
+        and headway the matching [lane] or [scenario, lane]. Arrays come back shaped [scenario, plan, ...]:
+        "arrived"/"served"/"residual" (vehicles), "delay" (vehicle-seconds), "queue_mean"/"queue_max" (vehicles, all [scenario, plan, lane]),
+        plus "mean_delay" [scenario, plan] (mean delay per arrived vehicle) and "total_queue_mean" [scenario, plan] (time mean of the sum over lanes, vehicles).
+        Like sumo_outputs.queue_kpis(), total_queue_mean averages over the steps until the network empties (up to the last step with an arrival or a queue),
+        leaving out the idle part of DRAIN_TIME."""
+        arrivals = np.asarray(arrivals, dtype=float)
+        if arrivals.ndim == 2:
+            arrivals = arrivals[None]
+        headway = np.broadcast_to(np.asarray(headway, dtype=float), (arrivals.shape[0], arrivals.shape[2]))
+        begin, end, cycle = self._stage_windows(plans)
+        offset = np.broadcast_to(np.asarray(plans.get("offset", 0.0), dtype=float), cycle.shape)
+        num_scenarios, num_steps, num_lanes = arrivals.shape
+        shape = (num_scenarios, len(cycle), num_lanes)
+
+        # 每个相位组每步每条车道可驶离的车辆数 = dt / h × 放行比例，最后一行为没有有效绿灯的时刻
+        # Vehicles every stage lets each lane discharge per step = dt / h × served share; the last row is for steps without effective green
+        share = np.vstack([self.stage_share, np.zeros(num_lanes)])
+        stage_capacity = (self.step / headway)[:, None, :] * share[None]  # [场景, 相位组+1, 车道] [scenario, stage + 1, lane]
+        no_green = self.template.num_stages
+        queue = np.zeros(shape)
+        queue_area = np.zeros(shape)
+        queue_max = np.zeros(shape)
+        # 每个(场景, 方案)到最后一个有到达或有排队的时间步为止的步数 Steps up to the last one with an arrival or a queue, per (scenario, plan)
+        busy_steps = np.zeros(shape[:2])
+        has_arrivals = arrivals.sum(axis=2) > 0  # [场景, 时间步] [scenario, step]
+        for t in range(num_steps):
+            # 取时间步中点在周期中的位置 Position of the step's midpoint within the cycle
+            position = ((t + 0.5) * self.step - offset) % cycle
+            active = (position[:, None] >= begin) & (position[:, None] < end)  # [方案, 相位组] [plan, stage]
+            stage = np.where(active.any(axis=1), active.argmax(axis=1), no_green)
+            queue += arrivals[:, t, None, :]
+            queue -= stage_capacity[:, stage]
+            np.maximum(queue, 0.0, out=queue)
+            queue_area += queue
+            np.maximum(queue_max, queue, out=queue_max)
+            busy_steps[(queue.sum(axis=2) > 0) | has_arrivals[:, t, None]] = t + 1
+        arrived = np.broadcast_to(arrivals.sum(axis=1)[:, None, :], shape)
+        delay = queue_area * self.step
+        return {
+            "lane_ids": self.lane_ids,
+            "approach_ids": self.approach_ids,
+            "arrived": arrived,
+            "served": arrived - queue,
+            "residual": queue,
+            "delay": delay,
+            "queue_mean": queue_area / num_steps,
+            "queue_max": queue_max,
+            "mean_delay": delay.sum(axis=2) / np.maximum(arrived.sum(axis=2), 1.0),
+            "total_queue_mean": queue_area.sum(axis=2) / np.maximum(busy_steps, 1.0),
+        }
+
+    def approach_summary(self, result):
+        """按进口道汇总：{"mean_delay": [场景, 方案, 进口道]（每辆车平均延误）, "queue_max": [场景, 方案, 进口道]（各车道最大排队之和，车辆数）}。"""
+        """Per approach summary: {"mean_delay": [scenario, plan, approach] (mean delay per vehicle), "queue_max": [scenario, plan, approach] (sum of the lane maxima, vehicles)}."""
+        members = self.lane_approach[None, :] == np.arange(len(self.approach_ids))[:, None]  # [进口道, 车道] [approach, lane]
+        delay = result["delay"] @ members.T
+        arrived = result["arrived"] @ members.T
+        return {"approach_ids": self.approach_ids, "mean_delay": delay / np.maximum(arrived, 1.0),
+                "queue_max": result["queue_max"] @ members.T}
+
+    def vehicle_space(self, type_id="car"):
+        """每辆排队车辆占用的车道长度（米），用于把车辆数换算为排队长度。"""
+        """Lane length taken by one queued vehicle (m), to turn vehicle counts into queue lengths."""
+        params = self._type(type_id)
+        return _type_value(params, "length") + _type_value(params, "minGap")
+
+    def kpis(self, result, scenario=0, plan=0):
+        """一个(场景, 方案)的KPI，键名和平均方式与sumo_outputs.trip_kpis()/queue_kpis()一致，便于与SUMO的结果比较。"""
+        """KPIs of one (scenario, plan) under the same keys and averaging as sumo_outputs.trip_kpis()/queue_kpis(), for a comparison with SUMO results."""
+        space = self.vehicle_space()
+        approaches = self.approach_summary(result)
+        return {
+            "trips": {"car": {"vehicles": int(round(result["arrived"][scenario, plan].sum())),
+                              "mean_delay": float(result["mean_delay"][scenario, plan])}},
+            "queue": {"mean_total_queue_length": float(result["total_queue_mean"][scenario, plan]) * space,
+                      "max_queue_length": float(result["queue_max"][scenario, plan].max()) * space},
+            "approaches": {approach: {"mean_delay": float(approaches["mean_delay"][scenario, plan, a]),
+                                      "max_queue_length": float(approaches["queue_max"][scenario, plan, a]) * space}
+                           for a, approach in enumerate(approaches["approach_ids"])},
+        }
+
+
+def rank_plans(result, plans, top=10, scenario_weights=None):
+    """按平均延误（多个场景时按scenario_weights加权平均）排序配时方案，返回前top个[{"plan", "cycle", "offset", "green", "mean_delay"}]。"""
+    """Rank timing plans by mean delay (weighted over scenarios with scenario_weights when there are several) and return the top ones as [{"plan", "cycle", "offset", "green", "mean_delay"}]."""
+    score = np.average(result["mean_delay"], axis=0, weights=scenario_weights)
+    best = np.argsort(score, kind="stable")[:top]
+    return [{"plan": int(p), "cycle": float(plans["cycle"][p]), "offset": float(plans["offset"][p]),
+             "green": np.asarray(plans["green"][p]).tolist(), "mean_delay": float(score[p])} for p in best.tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen signal timing plans of J0 with a point-queue surrogate model")
+    parser.add_argument("--net", default="net.net.xml", help="network file")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="scenario seeds (one scenario each)")
+    parser.add_argument("--vehicles", type=int, default=None, help="override num_vehicles of the default scenario")
+    parser.add_argument("--cycles", type=float, nargs="+", default=[60.0, 90.0, 120.0])
+    parser.add_argument("--splits", default=None, help="JSON list of split sets (default: equal splits)")
+    parser.add_argument("--offsets", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--top", type=int, default=10, help="number of best plans to print")
+    parser.add_argument("--tripinfo", default=None, help="SUMO tripinfo output of the first plan, to compare against")
+    parser.add_argument("--queue", default=None, help="SUMO queue output of the first plan, to compare against")
+    args = parser.parse_args()
+
+    surrogate = QueueSurrogate(args.net)
+    template = surrogate.template
+    split_sets = json.loads(args.splits) if args.splits else [[1.0] * template.num_stages]
+    plans = template.plan_grid(args.cycles, split_sets, args.offsets)
+    start = time.perf_counter()
+    inputs = []
+    for seed in args.seeds:
+        scenario = autoscript.default_scenario(seed=seed)
+        scenario["net_file"] = args.net
+        if args.vehicles is not None:
+            scenario["num_vehicles"] = args.vehicles
+        inputs.append(surrogate.scenario_arrivals(scenario))
+    # 各场景的到达补齐到相同的时间步数 Pad the arrivals of every scenario to the same number of steps
+    num_steps = max(arrivals.shape[0] for arrivals, _ in inputs)
+    arrivals = np.stack([np.pad(arrivals, ((0, num_steps - arrivals.shape[0]), (0, 0))) for arrivals, _ in inputs])
+    result = surrogate.evaluate(arrivals, np.stack([headway for _, headway in inputs]), plans)
+    elapsed = time.perf_counter() - start
+    print(f"{len(plans['cycle'])} plans × {len(args.seeds)} scenarios × {num_steps} steps in {elapsed:.2f} s")
+    print(f"{'plan':>5} {'cycle':>6} {'offset':>7} {'mean delay':>11}  green")
+    for row in rank_plans(result, plans, args.top):
+        print(f"{row['plan']:>5} {row['cycle']:>6g} {row['offset']:>7g} {row['mean_delay']:>11.1f}  {row['green']}")
+    if args.tripinfo or args.queue:
+        comparison = {"surrogate": surrogate.kpis(result)}
+        if args.tripinfo:
+            comparison["sumo_trips"] = trip_kpis(args.tripinfo)
+        if args.queue:
+            comparison["sumo_queue"] = queue_kpis(args.queue)
+        print(json.dumps(comparison, indent=2))
+
+
+if __name__ == "__main__":
+    main()
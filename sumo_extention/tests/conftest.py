@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 模块是sumo_extention下的平铺文件，按顶层模块导入 The modules are flat files in sumo_extention, imported as top-level modules
+sys.path.insert(0, PACKAGE_DIR)
+
+
+@pytest.fixture
+def net_file():
+    return os.path.join(PACKAGE_DIR, "net.net.xml")
@@ -0,0 +1,31 @@
+from kpi_store import KPIStore
+
+ROUTES = """<routes>
+    <vehicle id="0" type="car" route="ntos" depart="0.00"/>
+    <vehicle id="1" type="emergency" route="wtoe" depart="1.00"/>
+    <flow id="2" type="car" route="ntos" begin="0" end="60" number="2"/>
+</routes>
+"""
+
+# 混合的tripinfo：普通车辆、flow车辆和附加文件中的事件阻塞车辆 Mixed tripinfo: vehicles, flow vehicles and an incident blocker of the additional file
+TRIPINFO = """<tripinfos>
+    <tripinfo id="0" vType="car" depart="0.00" duration="30.00" waitingTime="5.00" timeLoss="10.00"/>
+    <tripinfo id="1" vType="emergency" depart="1.00" duration="20.00" waitingTime="0.00" timeLoss="2.00"/>
+    <tripinfo id="incident_blocker_0" vType="incident_blocker" depart="20.97" duration="520.00" waitingTime="499.00" timeLoss="510.00"/>
+    <tripinfo id="2.0" vType="car" depart="3.00" duration="40.00" waitingTime="6.00" timeLoss="20.00"/>
+    <tripinfo id="2.1" vType="car" depart="33.00" duration="36.00" waitingTime="4.00" timeLoss="12.00"/>
+</tripinfos>
+"""
+
+
+def test_add_run_skips_vehicles_outside_the_route_file(tmp_path):
+    routes, tripinfo = tmp_path / "routes.rou.xml", tmp_path / "tripinfo.xml"
+    routes.write_text(ROUTES, encoding="utf-8")
+    tripinfo.write_text(TRIPINFO, encoding="utf-8")
+    store = KPIStore(str(tmp_path / "kpis"))
+    store.add_run("run", str(tripinfo), str(routes), {"incident": "yes"})
+    rows = {(row["route"], row["vclass"]): row for row in store.query(by=("route", "vclass"))}
+    assert set(rows) == {("ntos", "car"), ("wtoe", "emergency")}
+    assert rows["ntos", "car"]["vehicles"] == 3
+    assert rows["ntos", "car"]["mean"] == 14.0
+    assert rows["wtoe", "emergency"]["max"] == 2.0
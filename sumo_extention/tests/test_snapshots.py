@@ -0,0 +1,45 @@
+import os
+
+from snapshots import create_snapshots, load_snapshots
+from sumo_env import SumoEnv
+
+WARMUP, COUNT, INTERVAL = 20.0, 2, 10.0
+
+
+def _scenario(tmp_path, net_file):
+    config_file = tmp_path / "scenario.sumocfg"
+    config_file.write_text("<configuration/>\n", encoding="utf-8")
+    return str(config_file), SumoEnv(str(config_file), net_file=net_file, backend="fake", max_steps=100)
+
+
+def test_snapshot_round_trip_matches_continued_run(tmp_path, net_file):
+    config_file, env = _scenario(tmp_path, net_file)
+    snapshots = create_snapshots(env, config_file, WARMUP, COUNT, INTERVAL, seed=1)
+    assert [os.path.basename(path) for path in snapshots] == ["state_fake_20.npz", "state_fake_30.npz"]
+    assert load_snapshots(config_file, "fake", WARMUP, COUNT, INTERVAL) == snapshots
+
+    restored = env.reset(seed=1, snapshot=snapshots[0]).copy()
+    restored_queue = env.connection.queue.copy()
+    assert env.connection.simulation.getTime() == WARMUP + 1
+    env.close()
+
+    # 从0时刻不间断地运行到同一时刻 Run without interruption from time 0 to the same time
+    env.reset(seed=1)
+    env.connection.simulationStep(WARMUP)
+    continued = env.step()[0]
+    assert (continued == restored).all()
+    assert (env.connection.queue == restored_queue).all()
+    env.close()
+
+
+def test_snapshots_invalidated_when_config_changes(tmp_path, net_file):
+    config_file, env = _scenario(tmp_path, net_file)
+    create_snapshots(env, config_file, WARMUP, COUNT, INTERVAL, seed=1)
+    assert load_snapshots(config_file, "fake", WARMUP, COUNT, INTERVAL)
+    # 参数不同的快照不复用 Snapshots with other parameters are not reused
+    assert load_snapshots(config_file, "fake", WARMUP + 1, COUNT, INTERVAL) == []
+    assert load_snapshots(config_file, "sumo", WARMUP, COUNT, INTERVAL) == []
+    # 场景重新生成后.sumocfg的修改时间改变 Regenerating the scenario changes the modification time of the .sumocfg
+    stat = os.stat(config_file)
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_snapshots(config_file, "fake", WARMUP, COUNT, INTERVAL) == []
@@ -0,0 +1,71 @@
+from sumo_env import PHASES_PER_STAGE, SumoEnv
+from signal_plans import ALL_RED_TIME, YELLOW_TIME
+
+GREEN = 10.0
+# 4个相位组的定时tlLogic：绿、黄、全红 Fixed-time tlLogic of 4 stages: green, yellow, all-red
+PHASE_DURATIONS = [GREEN, YELLOW_TIME, ALL_RED_TIME] * 4
+
+
+def _env(net_file, **kwargs):
+    return SumoEnv(net_file=net_file, tls_id="J0", backend="fake", fake_options={"phase_durations": PHASE_DURATIONS},
+                   **kwargs)
+
+
+def test_repeated_action_holds_green(net_file):
+    env = _env(net_file, max_steps=100)
+    env.reset(seed=0)
+    for _ in range(int(3 * GREEN)):
+        _, _, _, info = env.step(1)
+    assert env.connection.trafficlight.getPhase("J0") == 1 * PHASES_PER_STAGE
+    assert info["transition_steps"] == 0
+    env.close()
+
+
+def test_reset_and_step_observation_shape(net_file):
+    env = _env(net_file, max_steps=10)
+    observation = env.reset(seed=0)
+    assert observation.shape == (16, 5)
+    observation, reward, done, info = env.step(0)
+    assert observation.shape == (16, 5)
+    assert reward == -float(observation[:, 3].sum())
+    assert not done and info["steps"] == 1
+    env.close()
+
+
+def test_stage_switch_runs_yellow_and_all_red(net_file):
+    env = _env(net_file, max_steps=100)
+    env.reset(seed=0)
+    env.step(0)
+    phases = []
+    set_phase = env.connection.trafficlight.setPhase
+    env.connection.trafficlight.setPhase = lambda tls_id, phase: (phases.append(phase), set_phase(tls_id, phase))
+    _, _, _, info = env.step(2)
+    assert phases == [1, 2, 2 * PHASES_PER_STAGE]
+    assert info["transition_steps"] == YELLOW_TIME + ALL_RED_TIME
+    assert info["steps"] == 1 + YELLOW_TIME + ALL_RED_TIME + 1
+    env.close()
+
+
+def test_episode_runs_max_steps(net_file):
+    env = SumoEnv(net_file=net_file, backend="fake", max_steps=20)
+    env.reset(seed=0)
+    steps = 0
+    done = False
+    while not done:
+        _, _, done, _ = env.step()
+        steps += 1
+    assert steps == 20
+    env.close()
+
+
+def test_subscription_and_polling_agree(net_file):
+    observations = {}
+    for mode in ("subscription", "polling"):
+        env = _env(net_file, max_steps=50, mode=mode)
+        rows = [env.reset(seed=3).copy()]
+        for action in [0, 0, 1, 1, 1, 3, None, 2]:
+            rows.append(env.step(action)[0].copy())
+        observations[mode] = rows
+        env.close()
+    for subscribed, polled in zip(observations["subscription"], observations["polling"]):
+        assert (subscribed == polled).all()
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+
+from vector_env import NO_ACTION, VectorEnv
+
+MAX_STEPS = 5
+
+
+def test_auto_reset_through_shared_memory(net_file):
+    env = VectorEnv(2, scenario={"num_vehicles": 50}, backend="fake", max_steps=MAX_STEPS, net_file=net_file)
+    output_root = env.output_root
+    try:
+        observations = env.reset()
+        assert observations.shape == (2, 16, 5)
+        assert env.episodes.tolist() == [1, 1]
+        for step in range(1, MAX_STEPS + 1):
+            _, rewards, dones = env.step(np.full(2, NO_ACTION))
+            assert dones.tolist() == [step == MAX_STEPS] * 2
+        # 结束的回合自动重置：新回合从0步开始，上一回合的最终观测保留 Finished episodes reset by themselves: the new one starts at step 0 and the last observation is kept
+        assert env.episodes.tolist() == [2, 2]
+        assert env.episode_steps.tolist() == [0, 0]
+        assert rewards.tolist() == (-env.final_observations[:, :, 3].sum(axis=1)).tolist()
+        env.step()
+        assert env.episode_steps.tolist() == [1, 1]
+        assert not env.dones.any()
+    finally:
+        env.close()
+    assert not os.path.exists(output_root)
+
+
+def test_close_keeps_caller_output_root(net_file, tmp_path):
+    env = VectorEnv(1, scenario={"num_vehicles": 50}, backend="fake", max_steps=MAX_STEPS, net_file=net_file,
+                    output_root=str(tmp_path))
+    env.reset()
+    env.close()
+    assert os.listdir(tmp_path) == ["env_000"]
@@ -0,0 +1,342 @@
+"""
+并行多环境运行器
+Vectorized runner of parallel environments.
+
+VectorEnv启动N个工作进程，每个进程运行一个SumoEnv（libsumo/traci/fake后端），使用由base_seed派生的种子和
+autoscript生成的独立场景。观测、奖励、结束标志和动作都放在一块共享内存（multiprocessing.shared_memory）中：
+工作进程的SumoEnv直接把观测写进共享数组，主进程与工作进程之间每步只交换1字节的命令，不做任何pickle序列化。
+
+VectorEnv launches N worker processes, each running one SumoEnv (libsumo/traci/fake backend) with a seed derived from
+base_seed and its own scenario generated by autoscript. Observations, rewards, done flags and actions live in one
+shared memory block (multiprocessing.shared_memory): the SumoEnv of every worker writes its observation straight into
+the shared array, and the main process and the workers exchange a single command byte per step, with no pickling.
+
+两种步进方式 Two stepping styles:
+    step(actions)                 同步：所有环境一起前进一步 Lockstep: every environment advances one step
+    send(actions, env_ids) + recv()  异步：只推进部分环境，recv()返回已完成的环境 Async: advance some environments, recv() returns the finished ones
+
+回合结束的环境自动重置：生成（或从场景缓存取出）一个新的场景并用它重新启动，dones[i]为True，observations[i]为新回合的
+初始观测，上一回合的最终观测保存在final_observations[i]中。
+Finished episodes reset automatically: a new scenario is generated (or fetched from the scenario cache) and the
+environment restarts with it; dones[i] is True, observations[i] holds the first observation of the new episode and the
+last observation of the finished one is kept in final_observations[i].
+
+预热快照 Warm-up snapshots:
+    warmup不为None时，每个场景第一次使用时运行到warmup并保存状态快照（见snapshots模块），之后的回合从随机选择的快照开始。
+    配合pool_size（每个环境在固定数量的场景之间随机选择）或场景缓存，快照才能在回合之间复用。
+    With warmup set, every scenario runs to warmup on first use and saves state snapshots (see the snapshots module),
+    and later episodes start from a randomly chosen snapshot. Snapshots are only reused across episodes together with
+    pool_size (every environment picks randomly among a fixed number of scenarios) or the scenario cache.
+
+预取 Prefetching:
+    prefetch=N时每个工作进程用后台线程提前生成最多N个场景（见prefetch模块），回合结束时直接取用，用过的场景目录随后删除。
+    With prefetch=N every worker generates up to N scenarios ahead in a background thread (see the prefetch module)
+    and takes one when an episode ends; used scenario directories are deleted afterwards.
+"""
+import contextlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import traceback
+from multiprocessing import connection as mp_connection
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import autoscript
+from net_index import load_network_index
+from prefetch import ScenarioPrefetcher
+from scenario_cache import ScenarioCache
+from snapshots import DEFAULT_COUNT, DEFAULT_INTERVAL, choose_snapshot, ensure_snapshots
+from sumo_env import LANE_VARIABLES, SumoEnv
+
+# 主进程与工作进程之间的命令 Commands between the main process and the workers
+_RESET = b"r"
+_STEP = b"s"
+_CLOSE = b"c"
+_OK = b"k"
+_ERROR = b"e"
+
+NO_ACTION = -1  # 不改变信号相位 Leave the signal phase unchanged
+
+
+def _buffer_layout(num_envs, num_lanes):
+    """返回共享数组的布局[(名称, 形状, dtype, 偏移)]与总字节数，每个数组按8字节对齐。"""
+    """Return the shared array layout [(name, shape, dtype, offset)] and the total byte size, every array aligned to 8 bytes."""
+    specs = [
+        ("observations", (num_envs, num_lanes, len(LANE_VARIABLES)), np.float32),
+        ("final_observations", (num_envs, num_lanes, len(LANE_VARIABLES)), np.float32),
+        ("rewards", (num_envs,), np.float64),
+        ("dones", (num_envs,), np.bool_),
+        ("actions", (num_envs,), np.int64),
+        ("episode_steps", (num_envs,), np.int64),
+        ("episodes", (num_envs,), np.int64),
+    ]
+    layout = []
+    offset = 0
+    for name, shape, dtype in specs:
+        layout.append((name, shape, dtype, offset))
+        offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+    return layout, offset
+
+
+def _attach(shm, layout):
+    """返回共享内存块上的数组视图{名称: 数组}。"""
+    """Return the array views over a shared memory block as {name: array}."""
+    return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for name, shape, dtype, offset in layout}
+
+
+class _EpisodeScenarios:
+    """工作进程的场景来源：每个回合使用一个新的派生种子生成场景，指定cache_dir时通过场景缓存复用相同的场景。
+    pool_size不为None时只派生pool_size个种子，每个回合随机选择其一；warmup不为None时回合从预热快照开始。"""
+    """Scenario source of a worker: every episode generates a scenario with a fresh derived seed, reusing identical ones through the scenario cache when cache_dir is given.
+    With pool_size only pool_size seeds are derived and every episode picks one at random; with warmup episodes start from warm-up snapshots.
+    prefetch不为None时（不能与pool_size同时使用）由后台线程提前生成最多prefetch个场景。
+    With prefetch (not combinable with pool_size) a background thread generates up to prefetch scenarios ahead."""
+
+    def __init__(self, overrides, seed_sequence, output_dir, cache_dir=None, pool_size=None, warmup=None,
+                 snapshot_count=DEFAULT_COUNT, snapshot_interval=DEFAULT_INTERVAL, prefetch=None):
+        if prefetch is not None and pool_size is not None:
+            raise ValueError("prefetch and pool_size cannot be combined")
+        self.overrides = overrides
+        self.seed_sequence = seed_sequence
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.cache = ScenarioCache(cache_dir, max_entries=None) if cache_dir is not None else None
+        self.prefetch = prefetch
+        # 预取器的线程不能跨进程传递，在工作进程中第一次使用时创建 The prefetcher's threads cannot cross processes, so it is created on first use inside the worker
+        self._prefetcher = None
+        self.pool = None
+        if pool_size is not None:
+            self.pool = [int(child.generate_state(1)[0]) for child in seed_sequence.spawn(pool_size)]
+        # 只在需要时派生，不改变默认的回合种子序列 Spawned only when needed, so the default episode seeds stay unchanged
+        self.rng = np.random.default_rng(seed_sequence.spawn(1)[0]) if pool_size or warmup is not None else None
+        self.warmup = warmup
+        self.snapshot_count = snapshot_count
+        self.snapshot_interval = snapshot_interval
+
+    def _seeded(self):
+        while True:
+            scenario = dict(self.overrides)
+            scenario["seed"] = int(self.seed_sequence.spawn(1)[0].generate_state(1)[0])
+            yield scenario
+
+    def next(self):
+        """返回(种子, 场景文件路径)。"""
+        """Return (seed, scenario file paths)."""
+        if self.prefetch is not None:
+            if self._prefetcher is None:
+                self._prefetcher = ScenarioPrefetcher(self._seeded(), self.output_dir, depth=self.prefetch,
+                                                      executor="thread", cache_dir=self.cache_dir)
+            scenario, paths = self._prefetcher.get()
+            return scenario["seed"], paths
+        if self.pool is not None:
+            seed = self.pool[int(self.rng.integers(len(self.pool)))]
+        else:
+            seed = int(self.seed_sequence.spawn(1)[0].generate_state(1)[0])
+        scenario = autoscript.default_scenario(seed=seed)
+        scenario.update(self.overrides)
+        scenario["seed"] = seed
+        if self.cache is not None:
+            return seed, self.cache.get_or_generate(scenario)
+        output_dir = self.output_dir
+        if self.pool is not None:
+            # 池中的每个场景有自己的目录，只生成一次 Every scenario of the pool has its own directory and is generated once
+            output_dir = os.path.join(self.output_dir, f"scenario_{seed}")
+            config_file = os.path.join(output_dir, "scenario.sumocfg")
+            if os.path.exists(config_file):
+                return seed, {"config_file": config_file}
+        os.makedirs(output_dir, exist_ok=True)
+        return seed, autoscript.generate_scenario(scenario, output_dir, config_name="scenario.sumocfg")
+
+    def snapshot(self, env, config_file, seed):
+        """返回本回合的起始快照（首次使用场景时先用env创建快照），未启用预热快照时返回None。"""
+        """Return the starting snapshot of this episode (creating the snapshots with env on first use of the scenario), or None without warm-up snapshots."""
+        if self.warmup is None:
+            return None
+        snapshots = ensure_snapshots(env, config_file, self.warmup, self.snapshot_count, self.snapshot_interval, seed)
+        return choose_snapshot(snapshots, self.rng)
+
+    def close(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+
+def _worker(env_id, conn, shm_name, layout, env_kwargs, scenarios):
+    """工作进程：等待1字节命令，在共享数组中就地更新自己的那一行。"""
+    """Worker process: wait for one-byte commands and update its own row of the shared arrays in place."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = _attach(shm, layout)
+    env = None
+    try:
+        env = SumoEnv(observation=arrays["observations"][env_id], **env_kwargs)
+
+        def new_episode():
+            seed, paths = scenarios.next()
+            snapshot = scenarios.snapshot(env, paths["config_file"], seed)
+            env.reset(seed=seed, config_file=paths["config_file"], snapshot=snapshot)
+            arrays["episodes"][env_id] += 1
+            arrays["episode_steps"][env_id] = 0
+
+        while True:
+            command = conn.recv_bytes()
+            if command == _STEP:
+                action = int(arrays["actions"][env_id])
+                _, reward, done, info = env.step(None if action == NO_ACTION else action)
+                arrays["rewards"][env_id] = reward
+                arrays["dones"][env_id] = done
+                arrays["episode_steps"][env_id] = info["steps"]
+                if done:
+                    arrays["final_observations"][env_id] = arrays["observations"][env_id]
+                    new_episode()
+            elif command == _RESET:
+                new_episode()
+                arrays["rewards"][env_id] = 0.0
+                arrays["dones"][env_id] = False
+            elif command == _CLOSE:
+                conn.send_bytes(_OK)
+                break
+            conn.send_bytes(_OK)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        conn.send_bytes(_ERROR + traceback.format_exc().encode("utf-8"))
+    finally:
+        if env is not None:
+            env.close()
+        scenarios.close()
+        # 先释放共享数组的视图才能关闭共享内存 The views of the shared arrays must go before the block can be closed
+        env = arrays = None
+        shm.close()
+
+
+class VectorEnv:
+    """N个并行SumoEnv。observations/rewards/dones等属性是共享内存上的数组，每步原地更新（需要保留时请复制）。
+    scenario为覆盖autoscript.default_scenario()的参数，env_kwargs传给每个SumoEnv（backend、max_steps、fake_options等）。"""
+    """N parallel SumoEnvs. observations/rewards/dones and friends are arrays in shared memory updated in place every step (copy them to keep them).
+    scenario overrides autoscript.default_scenario() and env_kwargs is passed to every SumoEnv (backend, max_steps, fake_options, ...).
+    pool_size/warmup/snapshot_count/snapshot_interval选择场景池和预热快照，prefetch为场景预取的深度（见模块说明）。
+    pool_size/warmup/snapshot_count/snapshot_interval select the scenario pool and the warm-up snapshots, and prefetch sets the scenario prefetch depth (see the module docstring)."""
+
+    def __init__(self, num_envs, scenario=None, base_seed=0, output_root=None, cache_dir=None, start_method=None,
+                 pool_size=None, warmup=None, snapshot_count=DEFAULT_COUNT, snapshot_interval=DEFAULT_INTERVAL,
+                 prefetch=None, **env_kwargs):
+        overrides = dict(scenario or {})
+        net_file = os.path.abspath(overrides.get("net_file", env_kwargs.get("net_file", "net.net.xml")))
+        overrides["net_file"] = net_file
+        env_kwargs["net_file"] = net_file
+        num_lanes = len(load_network_index(net_file).junction_incoming_lanes(env_kwargs.get("junction_id", "J0")))
+
+        self.num_envs = num_envs
+        # 没有指定output_root时场景写入临时目录，close()时删除 Without output_root the scenarios go to a temporary directory removed by close()
+        self._owns_output_root = output_root is None
+        self.output_root = output_root or tempfile.mkdtemp(prefix="vector_env_")
+        layout, size = _buffer_layout(num_envs, num_lanes)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        arrays = _attach(self._shm, layout)
+        arrays["actions"][:] = NO_ACTION
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+        context = multiprocessing.get_context(start_method)
+        # 每个环境一个独立的种子序列，回合种子从中依次派生 One seed sequence per environment; episode seeds are spawned from it in turn
+        seed_sequences = np.random.SeedSequence(base_seed).spawn(num_envs)
+        self._conns = []
+        self._processes = []
+        self._pending = set()
+        for env_id in range(num_envs):
+            parent_conn, child_conn = context.Pipe()
+            scenarios = _EpisodeScenarios(overrides, seed_sequences[env_id],
+                                          os.path.join(self.output_root, f"env_{env_id:03d}"), cache_dir,
+                                          pool_size, warmup, snapshot_count, snapshot_interval, prefetch)
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(env_id, child_conn, self._shm.name, layout, env_kwargs, scenarios))
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+    def _expect(self, env_id):
+        reply = self._conns[env_id].recv_bytes()
+        if reply != _OK:
+            raise RuntimeError(f"environment {env_id} failed:\n{reply[1:].decode('utf-8')}")
+
+    def reset(self):
+        """重置所有环境（每个环境都换一个新的场景），返回observations。"""
+        """Reset every environment (each switches to a new scenario) and return observations."""
+        self.recv_all()
+        for conn in self._conns:
+            conn.send_bytes(_RESET)
+        for env_id in range(self.num_envs):
+            self._expect(env_id)
+        return self.observations
+
+    def step(self, actions=None):
+        """同步推进所有环境一步，返回(observations, rewards, dones)。actions为每个环境的相位组序号，NO_ACTION或None表示不变。"""
+        """Advance every environment one step in lockstep and return (observations, rewards, dones). actions holds one stage index per environment; NO_ACTION or None leaves the phase unchanged."""
+        self.send(actions)
+        self.recv_all()
+        return self.observations, self.rewards, self.dones
+
+    def send(self, actions=None, env_ids=None):
+        """异步：为env_ids（默认所有空闲环境）写入动作并开始推进一步，不等待完成。"""
+        """Async: write the actions of env_ids (every idle environment by default) and start advancing them one step without waiting."""
+        env_ids = [i for i in range(self.num_envs) if i not in self._pending] if env_ids is None else list(env_ids)
+        busy = self._pending.intersection(env_ids)
+        if busy:
+            raise RuntimeError(f"environments {sorted(busy)} are still stepping")
+        self.actions[env_ids] = NO_ACTION if actions is None else actions
+        for env_id in env_ids:
+            self._conns[env_id].send_bytes(_STEP)
+            self._pending.add(env_id)
+
+    def recv(self, timeout=None):
+        """异步：等待至少一个正在推进的环境完成（或超时），返回已完成环境的序号数组，其结果可在共享数组中按序号读取。"""
+        """Async: wait until at least one stepping environment finishes (or the timeout expires) and return the indices of the finished ones; their results are read from the shared arrays by index."""
+        conns = {self._conns[env_id]: env_id for env_id in self._pending}
+        ready = sorted(conns[conn] for conn in mp_connection.wait(list(conns), timeout))
+        for env_id in ready:
+            self._pending.discard(env_id)
+            self._expect(env_id)
+        return np.array(ready, dtype=np.int64)
+
+    def recv_all(self):
+        """等待所有正在推进的环境完成。"""
+        """Wait for every stepping environment to finish."""
+        while self._pending:
+            env_id = min(self._pending)
+            self._pending.discard(env_id)
+            self._expect(env_id)
+
+    def close(self):
+        """结束所有工作进程并释放共享内存；output_root是自动创建的临时目录时一并删除。"""
+        """Stop every worker process and release the shared memory; output_root is removed as well when it is the temporary directory created by the env."""
+        if self._shm is None:
+            return
+        with contextlib.suppress(RuntimeError, OSError, EOFError):
+            self.recv_all()
+        for conn, process in zip(self._conns, self._processes):
+            with contextlib.suppress(OSError, EOFError):
+                conn.send_bytes(_CLOSE)
+                conn.recv_bytes()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        for name in ("observations", "final_observations", "rewards", "dones", "actions", "episode_steps",
+                     "episodes"):
+            delattr(self, name)
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        if self._owns_output_root:
+            shutil.rmtree(self.output_root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,157 @@
+"""
+天气曲线
+Weather profiles.
+
+天气曲线是对车辆类型参数的相对变换：scale中的参数按倍数变化，offset中的参数加上给定值，set中的参数直接替换
+（如跟车模型carFollowModel、换道模型laneChangeModel）。变换作用于场景中的每一个车辆类型。
+
+A weather profile is a relative transform of vehicle type parameters: parameters in scale are multiplied, parameters in
+offset are shifted and parameters in set are replaced (e.g. carFollowModel, laneChangeModel). The transform is applied
+to every vehicle type of the scenario.
+
+场景中的"weather"可以是 The scenario's "weather" may be:
+    "rain"                                     整个仿真使用一个天气 One weather for the whole simulation
+    {"rain": 0.7, "clear": 0.3}                按比例混合的驾驶行为（vTypeDistribution） A mix of behaviours (vTypeDistribution)
+    [{"begin": 0, "weather": "clear"}, {"begin": 1800, "weather": "rain"}]
+                                               随时间变化：按出发时间切换车辆类型 Time-varying: vehicle types switch by departure time
+
+解析后的车辆类型集合按(天气, 基础车辆类型, 天气曲线)记忆，生成大量天气变体时相同的类型块只计算一次。
+Resolved vehicle type sets are memoized per (weather, base types, profiles), so generating many weather variants
+computes every identical type block only once.
+"""
+import bisect
+import json
+
+# 内置天气曲线，数值参考雨雪雾天的实测车速与车头时距变化
+# Built-in weather profiles; the values follow measured speed and headway changes in rain, snow and fog
+WEATHER_PROFILES = {
+    "clear": {},
+    "rain": {"scale": {"accel": 0.8, "decel": 0.8, "maxSpeed": 0.85},
+             "offset": {"minGap": 0.5, "tau": 0.2, "sigma": 0.1}},
+    "snow": {"scale": {"accel": 0.5, "decel": 0.6, "maxSpeed": 0.6},
+             "offset": {"minGap": 1.5, "tau": 0.5, "sigma": 0.2}},
+    "fog": {"scale": {"maxSpeed": 0.7},
+            "offset": {"minGap": 1.0, "tau": 0.4}},
+}
+
+# 未在车辆类型中给出的参数使用SUMO的默认值 Parameters missing from a vehicle type use SUMO's defaults
+# https://sumo.dlr.de/docs/Vehicle_Type_Parameter_Defaults.html
+SUMO_TYPE_DEFAULTS = {"accel": 2.6, "decel": 4.5, "emergencyDecel": 9.0, "sigma": 0.5, "tau": 1.0, "minGap": 2.5,
+                      "maxSpeed": 55.55, "speedFactor": 1.0, "speedDev": 0.1}
+
+# 取值范围受限的参数 Parameters with a bounded range
+_BOUNDS = {"sigma": (0.0, 1.0)}
+
+# 已解析的车辆类型集合，最多保留RESOLVED_TYPES_SIZE个，超出时淘汰最久未用的
+# Resolved vehicle type sets, at most RESOLVED_TYPES_SIZE of them; the least recently used one is evicted beyond that
+RESOLVED_TYPES_SIZE = 256
+_resolved_types = {}
+
+
+def _periods(weather):
+    """将weather规范化为[(开始时间, {天气名: 比例})]。"""
+    """Normalize weather into [(begin time, {profile name: share})]."""
+    if weather is None:
+        return []
+    if isinstance(weather, str):
+        return [(0.0, {weather: 1.0})]
+    if isinstance(weather, dict):
+        return [(0.0, dict(weather))]
+    periods = [(float(period["begin"]), _periods(period["weather"])[0][1]) for period in weather]
+    if [begin for begin, _ in periods] != sorted(begin for begin, _ in periods):
+        raise ValueError("weather periods must be ordered by begin time")
+    return periods
+
+
+def transform_type(attributes, profile):
+    """对一个车辆类型的属性字典应用天气变换，返回新的属性字典（数值格式化为字符串）。"""
+    """Apply a weather transform to the attribute dict of one vehicle type and return the new attribute dict (numbers formatted as strings)."""
+    transformed = dict(attributes)
+    for mode in ("scale", "offset"):
+        for name, amount in profile.get(mode, {}).items():
+            if name in transformed:
+                value = float(transformed[name])
+            elif name in SUMO_TYPE_DEFAULTS:
+                value = SUMO_TYPE_DEFAULTS[name]
+            else:
+                raise ValueError(f"weather transform of '{name}' needs a value in the vehicle type {attributes['id']}")
+            value = value * amount if mode == "scale" else value + amount
+            low, high = _BOUNDS.get(name, (0.0, float("inf")))
+            transformed[name] = f"{min(max(value, low), high):g}"
+    transformed.update({name: str(value) for name, value in profile.get("set", {}).items()})
+    return transformed
+
+
+def resolve_weather_types(weather, type_attributes, profiles=None):
+    """将基础车辆类型（vType属性字典列表）按weather展开，返回(类型条目元组, 时间线)。
+    条目为("vType", 属性字典)或("vTypeDistribution", 分布ID, (成员属性字典, ...))；时间线为None（类型ID不变）
+    或[(开始时间, 类型ID后缀)]，供retype_vehicles()按出发时间切换车辆类型。结果按参数记忆，调用者不应修改。"""
+    """Expand the base vehicle types (a list of vType attribute dicts) according to weather and return (type entries tuple, timeline).
+    An entry is ("vType", attributes) or ("vTypeDistribution", distribution ID, (member attributes, ...)); the timeline is None (type IDs unchanged)
+    or [(begin time, type ID suffix)] for retype_vehicles() to switch types by departure time. Results are memoized on the arguments and must not be modified."""
+    profiles = {**WEATHER_PROFILES, **(profiles or {})}
+    periods = _periods(weather)
+    memo_key = json.dumps([periods, type_attributes, {name: profiles[name] for period in periods for name in period[1]
+                                                      if name in profiles}], sort_keys=True)
+    if memo_key in _resolved_types:
+        # 移到末尾，字典的插入顺序即使用顺序 Move it to the end, the dict's insertion order being the order of use
+        _resolved_types[memo_key] = _resolved_types.pop(memo_key)
+        return _resolved_types[memo_key]
+
+    for _, mixture in periods:
+        for name in mixture:
+            if name not in profiles:
+                raise ValueError(f"unknown weather profile '{name}' (known: {', '.join(sorted(profiles))})")
+
+    def members(attributes, mixture, prefix):
+        return tuple(dict(transform_type(attributes, profiles[name]), id=f"{prefix}_{name}", probability=f"{share:g}")
+                     for name, share in mixture.items())
+
+    entries = []
+    timeline = None
+    if not periods:
+        entries = [("vType", attributes) for attributes in type_attributes]
+    elif len(periods) == 1 and periods[0][0] <= 0:
+        # 不随时间变化：类型ID不变 Constant over time: type IDs stay the same
+        mixture = periods[0][1]
+        for attributes in type_attributes:
+            if len(mixture) == 1:
+                entries.append(("vType", transform_type(attributes, profiles[next(iter(mixture))])))
+            else:
+                entries.append(("vTypeDistribution", attributes["id"], members(attributes, mixture, attributes["id"])))
+    else:
+        # 随时间变化：每种不同的天气生成一组类型，ID加后缀 Time-varying: one set of types per distinct weather, with suffixed IDs
+        labels = {}
+        timeline = []
+        for begin, mixture in periods:
+            mixture_key = json.dumps(mixture, sort_keys=True)
+            if mixture_key not in labels:
+                labels[mixture_key] = next(iter(mixture)) if len(mixture) == 1 else f"mix{len(labels)}"
+                for attributes in type_attributes:
+                    type_id = f"{attributes['id']}_{labels[mixture_key]}"
+                    if len(mixture) == 1:
+                        entries.append(("vType", dict(transform_type(attributes, profiles[next(iter(mixture))]),
+                                                      id=type_id)))
+                    else:
+                        entries.append(("vTypeDistribution", type_id, members(attributes, mixture, type_id)))
+            timeline.append((begin, labels[mixture_key]))
+
+    if len(_resolved_types) >= RESOLVED_TYPES_SIZE:
+        del _resolved_types[next(iter(_resolved_types))]
+    _resolved_types[memo_key] = (tuple(entries), timeline)
+    return _resolved_types[memo_key]
+
+
+def retype_vehicles(vehicles, timeline, type_ids):
+    """按出发时间把车辆类型切换为当时天气的类型（type_ids中的类型加上后缀），第一个时段之前出发的车辆使用第一个时段的天气。
+    vehicles为(属性字典, stop列表)的可迭代对象。"""
+    """Switch every vehicle to the type of the weather at its departure (the types in type_ids get the period's suffix); vehicles departing before the first period use the first period's weather.
+    vehicles is an iterable of (attribute dict, stop list)."""
+    begins = [begin for begin, _ in timeline]
+    suffixes = [suffix for _, suffix in timeline]
+    for attrib, stops in vehicles:
+        if attrib["type"] in type_ids:
+            depart = attrib["depart"] if "depart" in attrib else attrib["begin"]  # <flow>按开始时间 <flow>s by begin time
+            period = max(0, bisect.bisect_right(begins, float(depart)) - 1)
+            attrib["type"] = f"{attrib['type']}_{suffixes[period]}"
+        yield attrib, stops